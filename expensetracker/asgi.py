@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'expensetracker.settings')
+# Async views get a new connection per request, which persistent connections
+# would leave open; see expensetracker/db.py
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+SQLite configuration.
+
+``database_settings()`` builds the DATABASES entry from environment
+variables and ``configure_sqlite`` applies the chosen PRAGMAs to every new
+connection through the ``connection_created`` signal.
+
+Profiles (``DB_PROFILE``):
+
+- ``tuned`` (default): WAL journal, so readers never block the writer and
+  the writer never blocks readers; ``synchronous=NORMAL``, which is durable
+  across application crashes in WAL mode; a larger page cache and memory
+  mapped reads; a busy timeout plus ``BEGIN IMMEDIATE`` transactions, so
+  concurrent writers queue for the lock instead of failing with "database
+  is locked"; and persistent connections.
+- ``default``: SQLite's own defaults (rollback journal), one connection
+  per request.
+
+Every PRAGMA can be overridden with ``SQLITE_<NAME>`` (e.g.
+``SQLITE_CACHE_SIZE=-32768``), the file with ``DB_PATH`` and the connection
+lifetime with ``DB_CONN_MAX_AGE`` (seconds, empty for unlimited).
+
+Persistent connections (the tuned profile's ``CONN_MAX_AGE=60``) are only
+safe under WSGI. Under ASGI each request runs its queries in a thread of
+its own, so connections kept open past the request are never reused and
+pile up; Django advises disabling them in async mode, and
+``expensetracker/asgi.py`` therefore defaults ``DB_CONN_MAX_AGE`` to 0.
+
+``replica_settings()`` builds a read-only entry for a replica file, used
+by ``tracker.replicas`` when ``DB_REPLICA_PATH`` is set.
+"""
+import os
+import re
+
+from django.db.backends.signals import connection_created
+
+PROFILES = {
+    'default': {
+        # journal_mode is stored in the file, so switch a WAL database back
+        'pragmas': {'journal_mode': 'DELETE'},
+        'conn_max_age': 0,
+        'transaction_mode': None,
+    },
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,       # milliseconds
+            'cache_size': -65536,       # negative values are KiB, so 64 MiB
+            'mmap_size': 268435456,     # 256 MiB
+            'temp_store': 'MEMORY',
+        },
+        'conn_max_age': 60,
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+PRAGMA_NAMES = [
+    'journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store', 'query_only',
+]
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def profile_settings(name=None, environ=os.environ):
+    """Return the profile's pragmas, connection age and transaction mode, with env overrides"""
+    name = name or environ.get('DB_PROFILE', 'tuned')
+    if name not in PROFILES:
+        raise ValueError(f'DB_PROFILE must be one of {", ".join(PROFILES)}, not "{name}"')
+    profile = PROFILES[name]
+    pragmas = dict(profile['pragmas'])
+    for pragma in PRAGMA_NAMES:
+        value = environ.get(f'SQLITE_{pragma.upper()}')
+        if value:
+            pragmas[pragma] = value
+    conn_max_age = environ.get('DB_CONN_MAX_AGE', str(profile['conn_max_age']))
+    return {
+        'pragmas': pragmas,
+        'conn_max_age': int(conn_max_age) if conn_max_age else None,
+        'transaction_mode': profile['transaction_mode'],
+    }
+
+
+def database_settings(base_dir, environ=os.environ, name=None):
+    """The ``default`` DATABASES entry for the configured profile"""
+    profile = profile_settings(environ=environ)
+    options = {}
+    if profile['transaction_mode']:
+        options['transaction_mode'] = profile['transaction_mode']
+    if 'busy_timeout' in profile['pragmas']:
+        # The driver's own wait, used before the PRAGMA is applied
+        options['timeout'] = int(profile['pragmas']['busy_timeout']) / 1000
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name or environ.get('DB_PATH') or base_dir / 'db.sqlite3',
+        'CONN_MAX_AGE': profile['conn_max_age'],
+        'CONN_HEALTH_CHECKS': bool(profile['conn_max_age'] != 0),
+        'OPTIONS': options,
+        'PRAGMAS': profile['pragmas'],
+    }
+
+
+def replica_settings(base_dir, path, environ=os.environ):
+    """A DATABASES entry for a read-only replica file of the primary"""
+    settings = database_settings(base_dir, environ, name=path)
+    # Replicas are refreshed by copying the primary, never written through Django
+    settings['PRAGMAS'] = {**settings['PRAGMAS'], 'query_only': 'ON'}
+    settings['OPTIONS'] = {key: value for key, value in settings['OPTIONS'].items() if key != 'transaction_mode'}
+    # Tests read the replica from the test database
+    settings['TEST'] = {'MIRROR': 'default'}
+    return settings
+
+
+def apply_pragmas(cursor, pragmas):
+    """Run ``PRAGMA name = value`` for each item on a DB-API cursor"""
+    for name, value in pragmas.items():
+        if name not in PRAGMA_NAMES or not PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f'Unsupported PRAGMA {name} = {value}')
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created receiver applying the PRAGMAs of the connection's settings"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if pragmas:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas)
+
+
+connection_created.connect(configure_sqlite, dispatch_uid='expensetracker.db.configure_sqlite')
@@ -6,6 +6,8 @@ Enhanced version with SQLite, improved security, and additional features.
 from pathlib import Path
 import os
 
+from .db import database_settings, replica_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -30,8 +32,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tracker.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'tracker.replicas.ReadYourWritesMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -60,12 +64,84 @@ TEMPLATES = [
 WSGI_APPLICATION = 'expensetracker.wsgi.application'
 
 # Database - Using SQLite (much better for development and deployment)
+# DB_PROFILE=tuned (WAL, busy timeout, persistent connections) or default;
+# see expensetracker/db.py for the per-PRAGMA environment overrides.
 DATABASES = {
+    'default': database_settings(BASE_DIR),
+}
+
+# Read replicas - analytics, reports and chart endpoints read from a replica;
+# set DB_REPLICA_PATH to use a second SQLite file, refreshed with
+# manage.py sync_replica. See tracker/replicas.py.
+DB_REPLICA_PATH = os.environ.get('DB_REPLICA_PATH')
+if DB_REPLICA_PATH:
+    DATABASES['replica'] = replica_settings(BASE_DIR, DB_REPLICA_PATH)
+DATABASE_ROUTERS = ['tracker.replicas.ReplicaRouter']
+TRACKER_DB_REPLICAS = ['replica'] if DB_REPLICA_PATH else []
+TRACKER_READ_YOUR_WRITES = 10  # seconds a session reads from the primary after writing
+
+# Caches - analytics and chart data are cached per user in the 'tracker' cache.
+# Entries are keyed by data versions stored in the database, so writes in
+# any process (web or run_tasks worker) invalidate them everywhere. The
+# default locmem backend still keeps a copy per process and per-process
+# avatar digests, so it is meant for a single process (system check
+# tracker.W001 warns when DEBUG is off). Set TRACKER_CACHE_BACKEND=file to
+# share it between processes on disk.
+TRACKER_CACHE_BACKEND = os.environ.get('TRACKER_CACHE_BACKEND', 'locmem')
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tracker': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tracker',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
+if TRACKER_CACHE_BACKEND == 'file':
+    CACHES['tracker'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('TRACKER_CACHE_DIR', str(BASE_DIR / 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+TRACKER_CACHE_ALIAS = 'tracker'
+TRACKER_CACHE_TIMEOUT = 60 * 60  # seconds
+
+# Request profiling - off unless TRACKER_PROFILING=1; see tracker/profiling.py
+TRACKER_PROFILING = os.environ.get('TRACKER_PROFILING', '') == '1'
+TRACKER_PROFILING_SAMPLE_RATE = float(os.environ.get('TRACKER_PROFILING_SAMPLE_RATE', '0.05'))
+TRACKER_PROFILING_WINDOW = 1000  # samples kept per URL name
+TRACKER_PROFILING_SIMILAR_THRESHOLD = 5  # repeats of one statement flagged as N+1
+
+# Background tasks - run with manage.py run_tasks; see tracker/tasks.py
+TRACKER_TASK_TIMEOUT = 600  # seconds per attempt
+TRACKER_TASK_MAX_ATTEMPTS = 3
+TRACKER_TASK_RETRY_DELAY = 30  # seconds before the first retry, doubled for each further one
+TRACKER_INLINE_IMPORT_MAX_BYTES = 1024 * 1024  # larger statements are imported in the background
+
+# Receipt images - processed by the process_receipt task; see tracker/receipts.py
+TRACKER_RECEIPT_FORMAT = 'WEBP'  # or 'JPEG'
+TRACKER_RECEIPT_MAX_SIDE = 2000  # pixels
+TRACKER_RECEIPT_MAX_BYTES = 400 * 1024
+TRACKER_RECEIPT_THUMBNAIL_WIDTHS = [160, 320, 640]
+
+# Avatars - normalized on upload, resized on demand; see tracker/avatars.py
+TRACKER_AVATAR_SIZES = [32, 64, 128, 256]  # pixels; 256 is the stored size
+TRACKER_AVATAR_CACHE_DIR = BASE_DIR / 'avatar_cache'
+TRACKER_AVATAR_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Unusual expense flags - scored when an expense is saved; see tracker/anomalies.py
+TRACKER_ANOMALY_Z = 3.0  # standard deviations above the category mean
+TRACKER_ANOMALY_MIN_SAMPLES = 5  # earlier expenses needed in the category
+
+# Budget alerts - counted when expenses are saved, emailed by the
+# send_budget_alerts task; run manage.py reconcile_budgets nightly; see tracker/budget_alerts.py
+TRACKER_BUDGET_ALERT_THRESHOLDS = [80, 100]  # percent of the budget
+TRACKER_BUDGET_ALERT_BATCH_SIZE = 100  # emails per send_messages() call
+
+# Currencies - transactions are converted to each user's home currency with
+# rates loaded by manage.py load_fx_rates; see tracker/fx.py
+TRACKER_FX_BASE_CURRENCY = 'INR'  # rates are the value of one unit in this currency
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
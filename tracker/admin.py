@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
-from django.db.models import Sum
-from .models import Category, Expense, Income, Budget, UserProfile
+from .models import Category, Expense, ExpenseTag, FxRate, Income, Budget, BudgetAlert, Tag, Task, UserProfile
+from .budgets import evaluate_budgets
+from .money import format_amount, user_currency
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -21,28 +23,41 @@ class CategoryAdmin(admin.ModelAdmin):
         return obj.expenses.count()
     expense_count.short_description = 'Total Expenses'
 
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'created_at']
+    search_fields = ['name', 'user__username']
+    readonly_fields = ['created_at']
+    list_select_related = ['user']
+
+class ExpenseTagInline(admin.TabularInline):
+    model = ExpenseTag
+    extra = 0
+    autocomplete_fields = ['tag']
+
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'amount', 'category', 'date', 'payment_method', 'is_recurring']
-    list_filter = ['category', 'payment_method', 'is_recurring', 'date', 'created_at']
-    search_fields = ['title', 'description', 'tags', 'location', 'user__username']
-    readonly_fields = ['created_at', 'updated_at']
+    list_display = ['title', 'user', 'amount', 'currency', 'category', 'date', 'payment_method', 'is_recurring']
+    list_filter = ['category', 'currency', 'payment_method', 'is_recurring', 'date', 'created_at']
+    search_fields = ['title', 'description', 'tags__name', 'location', 'user__username']
+    readonly_fields = ['created_at', 'updated_at', 'recurring_source', 'recurring_last_date']
     list_per_page = 25
     date_hierarchy = 'date'
+    inlines = [ExpenseTagInline]
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('user', 'title', 'description', 'amount', 'category', 'date')
+            'fields': ('user', 'title', 'description', 'amount', 'currency', 'category', 'date')
         }),
         ('Payment Details', {
             'fields': ('payment_method', 'receipt_image')
         }),
         ('Recurring', {
-            'fields': ('is_recurring', 'recurring_period'),
+            'fields': ('is_recurring', 'recurring_period', 'recurring_source', 'recurring_last_date'),
             'classes': ('collapse',)
         }),
         ('Additional Info', {
-            'fields': ('tags', 'location'),
+            'fields': ('location',),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -57,19 +72,19 @@ class ExpenseAdmin(admin.ModelAdmin):
 
 @admin.register(Income)
 class IncomeAdmin(admin.ModelAdmin):
-    list_display = ['title', 'user', 'amount', 'source', 'date', 'is_recurring']
-    list_filter = ['source', 'is_recurring', 'date', 'created_at']
+    list_display = ['title', 'user', 'amount', 'currency', 'source', 'date', 'is_recurring']
+    list_filter = ['source', 'currency', 'is_recurring', 'date', 'created_at']
     search_fields = ['title', 'description', 'user__username']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'recurring_source', 'recurring_last_date']
     list_per_page = 25
     date_hierarchy = 'date'
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('user', 'title', 'description', 'amount', 'source', 'date')
+            'fields': ('user', 'title', 'description', 'amount', 'currency', 'source', 'date')
         }),
         ('Recurring', {
-            'fields': ('is_recurring', 'recurring_period'),
+            'fields': ('is_recurring', 'recurring_period', 'recurring_source', 'recurring_last_date'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -85,44 +100,59 @@ class BudgetAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'category__name']
     readonly_fields = ['created_at', 'updated_at', 'spent_amount', 'remaining_amount']
     list_per_page = 25
+    list_select_related = ['user__profile', 'category']
+    
+    def get_changelist_instance(self, request):
+        # Evaluate the whole page of budgets in one query up front
+        changelist = super().get_changelist_instance(request)
+        for status in evaluate_budgets(changelist.result_list):
+            status['budget']._budget_status = status
+        return changelist
+    
+    def _budget_status(self, obj):
+        status = getattr(obj, '_budget_status', None)
+        if status is None:
+            status = obj._budget_status = evaluate_budgets([obj])[0]
+        return status
     
     def spent_amount(self, obj):
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        current_month = timezone.now().replace(day=1)
-        next_month = (current_month + timedelta(days=32)).replace(day=1)
-        
-        spent = obj.category.expenses.filter(
-            user=obj.user,
-            date__gte=current_month,
-            date__lt=next_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        return f"₹{spent}"
-    spent_amount.short_description = 'Spent This Month'
+        if obj.pk is None:
+            return '-'
+        return format_amount(self._budget_status(obj)['spent'], user_currency(obj.user))
+    spent_amount.short_description = 'Spent This Period'
     
     def remaining_amount(self, obj):
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        current_month = timezone.now().replace(day=1)
-        next_month = (current_month + timedelta(days=32)).replace(day=1)
-        
-        spent = obj.category.expenses.filter(
-            user=obj.user,
-            date__gte=current_month,
-            date__lt=next_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        remaining = obj.amount - spent
+        if obj.pk is None:
+            return '-'
+        remaining = self._budget_status(obj)['remaining']
         color = 'red' if remaining < 0 else 'green'
         return format_html(
-            '<span style="color: {};">₹{}</span>',
-            color, remaining
+            '<span style="color: {};">{}</span>',
+            color, format_amount(remaining, user_currency(obj.user))
         )
     remaining_amount.short_description = 'Remaining'
 
+@admin.register(BudgetAlert)
+class BudgetAlertAdmin(admin.ModelAdmin):
+    list_display = ['budget', 'period_start', 'threshold', 'spent', 'budget_amount', 'created_at', 'sent_at', 'emailed']
+    list_filter = ['threshold', 'emailed', 'created_at']
+    search_fields = ['budget__user__username', 'budget__category__name']
+    readonly_fields = ['created_at']
+    list_select_related = ['budget__user__profile', 'budget__category']
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Budget labels show the owner's currency; load it with the choices
+        if db_field.name == 'budget':
+            kwargs['queryset'] = Budget.objects.select_related('user__profile', 'category')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ['currency', 'date', 'rate']
+    list_filter = ['currency']
+    date_hierarchy = 'date'
+    list_per_page = 50
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'phone', 'monthly_budget', 'email_notifications', 'budget_alerts', 'created_at']
@@ -146,7 +176,24 @@ class UserProfileAdmin(admin.ModelAdmin):
         })
     )
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'user', 'status', 'progress', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind', 'created_at']
+    search_fields = ['kind', 'user__username', 'message']
+    readonly_fields = ['worker', 'heartbeat_at', 'attempts', 'progress', 'message', 'error',
+                       'result', 'created_at', 'started_at', 'finished_at']
+    list_select_related = ['user']
+    actions = ['retry_tasks']
+    
+    def retry_tasks(self, request, queryset):
+        updated = queryset.filter(status=Task.FAILED).update(
+            status=Task.PENDING, attempts=0, run_after=timezone.now(), finished_at=None, worker=''
+        )
+        self.message_user(request, f'{updated} tasks queued again.')
+    retry_tasks.short_description = 'Retry selected failed tasks'
+
 # Custom admin site settings
 admin.site.site_header = "ExpenseTracker Administration"
 admin.site.site_title = "ExpenseTracker Admin"
-admin.site.index_title = "Welcome to ExpenseTracker Admin Panel"
\ No newline at end of file
+admin.site.index_title = "Welcome to ExpenseTracker Admin Panel"
@@ -0,0 +1,213 @@
+"""
+Write-time anomaly flags for expenses.
+
+ExpenseCategoryStats holds, per user and category, the number of expenses,
+their mean amount and M2, the sum of squared deviations from the mean (the
+variance is ``m2 / (count - 1)``). The receivers in tracker.signals keep the
+rows current the way they keep the rollups current: saving or deleting an
+expense changes its row with a single statement applying Welford's update
+(or Chan's formula, which merges a whole bulk insert with one upsert for
+every category it touches), so a write never reads the category's other
+expenses.
+
+Before an expense is written it is scored against its category's stats
+without itself: how many standard deviations its amount lies above the
+mean. Expenses at least ``TRACKER_ANOMALY_Z`` deviations above, in a category
+with at least ``TRACKER_ANOMALY_MIN_SAMPLES`` other expenses, are saved with
+``anomaly_score`` set; the others have it cleared. The deviation used is at
+least ``MIN_SPREAD`` of the mean, so a category of identical amounts does
+not flag every small change. Flags are not revisited when later expenses
+move the stats.
+
+``manage.py rebuild_rollups`` recomputes the stats along with the rollups.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F, FloatField, Value, Variance
+from django.db.models.functions import Cast, Greatest
+
+from . import fx, upserts
+from .models import Expense, ExpenseCategoryStats
+
+# Stats are (count, mean, m2) tuples
+EMPTY = (0, 0.0, 0.0)
+
+MIN_SPREAD = 0.1
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def z_threshold():
+    return getattr(settings, 'TRACKER_ANOMALY_Z', 3.0)
+
+
+def min_samples():
+    return getattr(settings, 'TRACKER_ANOMALY_MIN_SAMPLES', 5)
+
+
+def stats_key(values):
+    return {'user_id': values['user_id'], 'category_id': values['category_id']}
+
+
+def add(stats, amount):
+    """Welford's update: the stats with ``amount`` added"""
+    count, mean, m2 = stats
+    count += 1
+    delta = amount - mean
+    mean += delta / count
+    return count, mean, m2 + delta * (amount - mean)
+
+
+def remove(stats, amount):
+    """The stats with ``amount`` taken out again"""
+    count, mean, m2 = stats
+    if count <= 1:
+        return EMPTY
+    previous_mean = (count * mean - amount) / (count - 1)
+    return count - 1, previous_mean, max(m2 - (amount - previous_mean) * (amount - mean), 0.0)
+
+
+def score(stats, amount):
+    """Standard deviations ``amount`` lies above the mean, or None with too few samples"""
+    count, mean, m2 = stats
+    if count < max(min_samples(), 2):
+        return None
+    spread = max(math.sqrt(m2 / (count - 1)), abs(mean) * MIN_SPREAD)
+    if not spread:
+        return None
+    return (amount - mean) / spread
+
+
+def anomaly_score(stats, amount):
+    """The ``anomaly_score`` to store: the score for outliers, None otherwise"""
+    z = score(stats, amount)
+    return round(z, 2) if z is not None and z >= z_threshold() else None
+
+
+def load(key):
+    return ExpenseCategoryStats.objects.filter(**key).values_list('count', 'mean', 'm2').first() or EMPTY
+
+
+def flag(instance, values, previous):
+    """
+    Set ``anomaly_score`` on an expense about to be saved. ``values`` are its
+    rollup values and ``previous`` those of the stored row (None when new).
+    """
+    key = stats_key(values)
+    stats = load(key)
+    if previous is not None and stats_key(previous) == key:
+        stats = remove(stats, float(previous['amount']))
+    instance.anomaly_score = anomaly_score(stats, float(values['amount']))
+
+
+# Chan's formula; every SET expression reads the stored row's old values
+MERGE_SQL = {
+    'm2': '{old.m2} + {new.m2} + ({new.mean} - {old.mean}) * ({new.mean} - {old.mean}) * {old.count} * {new.count}'
+          ' / ({old.count} + {new.count})',
+    'mean': '{old.mean} + ({new.mean} - {old.mean}) * {new.count} / ({old.count} + {new.count})',
+    'count': '{old.count} + {new.count}',
+}
+
+
+def merge(stats):
+    """Merge ``{(user_id, category_id): stats}`` of new expenses into the stored rows with one upsert"""
+    rows = [
+        {'user_id': user_id, 'category_id': category_id, 'count': count, 'mean': mean, 'm2': m2}
+        for (user_id, category_id), (count, mean, m2) in stats.items() if count
+    ]
+    upserts.upsert(ExpenseCategoryStats, rows, ['user', 'category'], MERGE_SQL)
+
+
+def subtract(key, amount):
+    """Take one expense out of the stored row"""
+    previous_mean = (F('count') * F('mean') - amount) / (F('count') - 1)
+    updated = ExpenseCategoryStats.objects.filter(count__gt=1, **key).update(
+        m2=Greatest(F('m2') - (Value(amount) - previous_mean) * (Value(amount) - F('mean')), Value(0.0)),
+        mean=previous_mean,
+        count=F('count') - 1,
+    )
+    if not updated:
+        ExpenseCategoryStats.objects.filter(**key).delete()
+
+
+def apply(values, sign):
+    """Add (sign=1) or remove (sign=-1) one expense from its category's stats"""
+    if sign > 0:
+        merge({tuple(stats_key(values).values()): add(EMPTY, float(values['amount']))})
+    else:
+        subtract(stats_key(values), float(values['amount']))
+
+
+def apply_bulk(instances, rows):
+    """
+    Score bulk-created expenses as if they had been saved one by one, store
+    the flags of the outliers and merge the batch into the stats.
+    ``rows`` are the instances' rollup values.
+    """
+    batches = defaultdict(list)
+    for instance, values in zip(instances, rows):
+        batches[tuple(stats_key(values).values())].append((instance, float(values['amount'])))
+    stored = {
+        (user_id, category_id): (count, mean, m2)
+        for user_id, category_id, count, mean, m2 in ExpenseCategoryStats.objects.filter(
+            user_id__in={user_id for user_id, _ in batches},
+            category_id__in={category_id for _, category_id in batches},
+        ).values_list('user_id', 'category_id', 'count', 'mean', 'm2')
+    }
+    flagged, merged = [], {}
+    for (user_id, category_id), batch in batches.items():
+        stats, added = stored.get((user_id, category_id), EMPTY), EMPTY
+        for instance, amount in batch:
+            instance.anomaly_score = anomaly_score(stats, amount)
+            if instance.anomaly_score is not None:
+                flagged.append(instance)
+            stats, added = add(stats, amount), add(added, amount)
+        merged[user_id, category_id] = added
+    merge(merged)
+    if flagged:
+        Expense.objects.bulk_update(flagged, ['anomaly_score'])
+
+
+def rebuild(users=None):
+    """Recompute the stats rows from the expenses, returning the number of rows"""
+    expenses = Expense.objects.all()
+    stats = ExpenseCategoryStats.objects.all()
+    if users is not None:
+        expenses = expenses.filter(user__in=users)
+        stats = stats.filter(user__in=users)
+    amount = Cast(fx.converted(), FloatField())
+    grouped = expenses.values('user_id', 'category_id').annotate(
+        count=Count('id'), mean=Avg(amount), variance=Variance(amount),
+    ).order_by()
+
+    created = 0
+    with transaction.atomic():
+        stats.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            row['m2'] = row.pop('variance') * row['count']
+            batch.append(ExpenseCategoryStats(**row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                ExpenseCategoryStats.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            ExpenseCategoryStats.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def explain(expense):
+    """``{'score', 'threshold', 'category_mean'}`` for a flagged expense, or None"""
+    if expense.anomaly_score is None:
+        return None
+    _, mean, _ = load({'user_id': expense.user_id, 'category_id': expense.category_id})
+    return {'score': expense.anomaly_score, 'threshold': z_threshold(), 'category_mean': round(mean, 2)}
+
+
+def recent(user, limit=5):
+    """The user's most recent flagged expenses"""
+    return Expense.objects.filter(user=user, anomaly_score__isnull=False).select_related('category')[:limit]
@@ -7,8 +7,9 @@ class TrackerConfig(AppConfig):
     verbose_name = 'Expense Tracker'
     
     def ready(self):
-        # Import signals here to ensure they are registered
-        try:
-            import tracker.signals
-        except ImportError:
-            pass
\ No newline at end of file
+        # Register the system checks, signal receivers and task handlers;
+        # rollups, budgets and caches depend on them, so import errors must
+        # stop startup
+        import tracker.checks
+        import tracker.signals
+        import tracker.jobs
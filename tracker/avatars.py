@@ -0,0 +1,193 @@
+"""
+Profile avatars.
+
+Uploads are normalized when the profile is saved: turned upright, cropped
+to a centred square, scaled to ``MASTER_SIZE`` pixels and stored as WebP
+without metadata under ``avatars/<ab>/<digest>.webp``, where the digest is
+the SHA-256 of the normalized image. Identical avatars share one file and a
+changed avatar gets a new URL, so responses can be cached forever.
+
+The ``avatar`` view serves the sizes in ``TRACKER_AVATAR_SIZES`` at
+``/avatars/<digest>/<size>.webp``. Smaller sizes are resized on first
+request and kept in ``TRACKER_AVATAR_CACHE_DIR``; a hit refreshes the file's
+mtime, and once the directory grows past ``TRACKER_AVATAR_CACHE_MAX_BYTES``
+the least recently used files are removed. The bytes written since the last
+sweep are counted in the tracker cache, so the directory is only listed
+when the cap may have been reached.
+
+A profile's previous avatar is deleted (with its resized copies) when the
+profile changes it or is deleted and no other profile uses the same file;
+``manage.py clean_avatars`` sweeps files orphaned by older code.
+"""
+import hashlib
+import io
+import os
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from . import images
+from .cache import get_cache
+from .models import UserProfile
+
+MASTER_SIZE = 256
+
+AVATAR_DIR = 'avatars/'
+NORMALIZED_NAME = re.compile(r'^avatars/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.webp$')
+
+# Bytes written to the resize cache since it was last swept
+WRITTEN_KEY = 'tracker:avatars:written'
+
+# Cached digest of a user's avatar ('' for none), read by every page's navbar
+DIGEST_KEY = 'tracker:avatars:digest:{}'
+
+
+def avatar_sizes():
+    return getattr(settings, 'TRACKER_AVATAR_SIZES', [32, 64, 128, MASTER_SIZE])
+
+
+def cache_dir():
+    return str(getattr(settings, 'TRACKER_AVATAR_CACHE_DIR', os.path.join(settings.BASE_DIR, 'avatar_cache')))
+
+
+def cache_max_bytes():
+    return getattr(settings, 'TRACKER_AVATAR_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def digest_of(name):
+    """Digest of a normalized avatar's storage name, or None for other names"""
+    match = NORMALIZED_NAME.match(name or '')
+    return match.group('digest') if match else None
+
+
+def master_name(digest):
+    return f'{AVATAR_DIR}{digest[:2]}/{digest}.webp'
+
+
+def normalize(data):
+    """Return the normalized WebP bytes of an uploaded image"""
+    image = images.open_upright(data, MASTER_SIZE * 4)
+    image = ImageOps.fit(image, (MASTER_SIZE, MASTER_SIZE), Image.Resampling.LANCZOS)
+    return images.encode(image, 'WEBP', 85)
+
+
+def store(data):
+    """Normalize and store an uploaded image unless it is stored already; returns its digest"""
+    data = normalize(data)
+    digest = hashlib.sha256(data).hexdigest()
+    if not default_storage.exists(master_name(digest)):
+        default_storage.save(master_name(digest), ContentFile(data))
+    return digest
+
+
+def normalize_field(profile):
+    """Replace a profile's uploaded avatar with the stored normalized one"""
+    with profile.avatar.open('rb') as upload:
+        digest = store(upload.read())
+    # Assigning a name marks the field as committed, so the upload itself
+    # is never written to storage
+    profile.avatar = master_name(digest)
+
+
+def remember(user_id, name):
+    get_cache().set(DIGEST_KEY.format(user_id), digest_of(name) or '', None)
+
+
+def user_digest(user):
+    """Digest of the user's avatar, or '' (cached; kept current by the profile signals)"""
+    key = DIGEST_KEY.format(user.pk)
+    digest = get_cache().get(key)
+    if digest is None:
+        name = UserProfile.objects.filter(user=user).values_list('avatar', flat=True).first()
+        digest = digest_of(name) or ''
+        get_cache().set(key, digest, None)
+    return digest
+
+
+def _cache_path(digest, size):
+    return os.path.join(cache_dir(), digest[:2], f'{digest}-{size}.webp')
+
+
+def variant_path(digest, size):
+    """
+    Local path of the ``size`` pixel variant, resizing it on a cache miss.
+    Raises FileNotFoundError for unknown avatars.
+    """
+    path = _cache_path(digest, size)
+    try:
+        # A hit counts as a use for the LRU order
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    with default_storage.open(master_name(digest), 'rb') as master:
+        image = Image.open(io.BytesIO(master.read()))
+        image.load()
+    data = images.encode(image.resize((size, size), Image.Resampling.LANCZOS), 'WEBP', 85)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so concurrent requests never read a partial file
+    partial = f'{path}.{os.getpid()}.tmp'
+    with open(partial, 'wb') as output:
+        output.write(data)
+    os.replace(partial, path)
+    _count_written(len(data))
+    return path
+
+
+def _count_written(size):
+    cache = get_cache()
+    if not cache.add(WRITTEN_KEY, size, None):
+        try:
+            size = cache.incr(WRITTEN_KEY, size)
+        except ValueError:
+            cache.set(WRITTEN_KEY, size, None)
+    if size > cache_max_bytes() // 10:
+        cache.set(WRITTEN_KEY, 0, None)
+        trim_cache()
+
+
+def _cached_files():
+    for root, _, filenames in os.walk(cache_dir()):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+
+def trim_cache(max_bytes=None):
+    """Delete the least recently used resized avatars until the cache fits ``max_bytes``"""
+    max_bytes = cache_max_bytes() if max_bytes is None else max_bytes
+    files = sorted(_cached_files())
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def purge(name):
+    """Delete an avatar file and its resized copies, unless a profile still uses it"""
+    if not name or UserProfile.objects.filter(avatar=name).exists():
+        return False
+    default_storage.delete(name)
+    digest = digest_of(name)
+    if digest:
+        for size in avatar_sizes():
+            try:
+                os.remove(_cache_path(digest, size))
+            except FileNotFoundError:
+                pass
+    return True
@@ -0,0 +1,568 @@
+"""
+View benchmarks and query budgets.
+
+``seed()`` fills the database with synthetic users, categories, tags,
+expenses, income and budgets using bulk inserts, then rebuilds the rollups,
+the category stats, the budget spend counters and the search index the way
+a real import would leave them. ``run_cases()`` requests every tracker URL
+as the benchmark user and records the query count, wall time and peak
+Python memory of each view; every case declares the most queries the view
+may run, independent of data volume.
+
+Most page templates are not part of this tree, so pages are rendered with a
+stub template that extends ``tracker/base.html`` and evaluates the
+querysets, pages and forms in the context, the way a real template would.
+
+Used by tracker.tests (small scale, on every test run) and by
+``manage.py benchmark_views`` (any scale, JSON report, comparison).
+"""
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.color import no_style
+from django.core.paginator import Page
+from django.forms import BaseForm
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.template.base import Origin, Template
+from django.template.loaders.base import Loader
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import anomalies, avatars, budget_alerts, cache, fx, rollups
+from .exports import EXPORT_CHUNK_SIZE
+from .models import Budget, Category, Expense, ExpenseTag, FxRate, Income, Tag, Task, UserProfile
+from .money import DEFAULT_CURRENCY
+from .pagination import KeysetPage
+from .search import get_search_backend
+
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+INSERT_BATCH_SIZE = 10_000
+# Columns written by the raw expense insert in seed()
+EXPENSE_SEED_FIELDS = [
+    'id', 'user', 'title', 'description', 'amount', 'currency', 'category', 'date',
+    'payment_method', 'is_recurring', 'location', 'created_at', 'updated_at',
+]
+# Every this many seeded expenses is in US dollars
+FOREIGN_EVERY = 20
+SEED_RATES = {'USD': Decimal('83.20'), 'EUR': Decimal('90.10')}
+MIN_TIME_DELTA_MS = 5.0
+BENCHMARK_USERNAME = 'benchmark'
+PASSWORD = 'benchmark-password'
+
+CATEGORY_NAMES = [
+    'Food', 'Transport', 'Rent', 'Utilities', 'Groceries', 'Health',
+    'Entertainment', 'Shopping', 'Travel', 'Education', 'Gifts', 'Other',
+]
+TITLES = [
+    'Coffee', 'Lunch', 'Dinner', 'Taxi', 'Bus pass', 'Electricity bill',
+    'Water bill', 'Supermarket', 'Pharmacy', 'Cinema', 'Books', 'Flight',
+    'Hotel', 'Course fee', 'Birthday present', 'Phone recharge',
+]
+LOCATIONS = ['Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', None]
+TAG_NAMES = [
+    'work', 'family', 'weekend', 'travel', 'health', 'subscription',
+    'reimbursable', 'cash back', 'online', 'gift',
+]
+
+
+class Fixture:
+    """Ids of the seeded benchmark data"""
+
+    def __init__(self, user, expenses, days):
+        self.user = user
+        self.expenses = expenses
+        self.days = days
+        self.category = Category.objects.order_by('pk').first()
+        self.expense_id = Expense.objects.filter(user=user).values_list('pk', flat=True).first()
+        self.income_id = Income.objects.filter(user=user).values_list('pk', flat=True).first()
+        self.budget_id = Budget.objects.filter(user=user).values_list('pk', flat=True).first()
+
+    def new_expense(self):
+        """A throwaway expense for cases that delete one"""
+        return Expense.objects.create(
+            user=self.user, title='Benchmark expense', amount=Decimal('1.00'), category=self.category
+        ).pk
+
+    def new_income(self):
+        return Income.objects.create(user=self.user, title='Benchmark income', amount=Decimal('1.00')).pk
+
+    def new_category(self):
+        return Category.objects.create(name=f'Benchmark {time.perf_counter_ns()}').pk
+
+    def new_budget(self):
+        return Budget.objects.create(
+            user=self.user, category=self.category, amount=Decimal('100.00'), period_type='daily'
+        ).pk
+
+    def new_task(self):
+        """A finished export with a result file, for the task views"""
+        task = Task.objects.create(user=self.user, kind='export_expenses', status=Task.SUCCEEDED, progress=100)
+        task.result.save('expenses.csv', ContentFile(b'Date,Title\n'))
+        return task.pk
+
+    def new_avatar(self):
+        """A stored avatar, for the resized avatar view"""
+        upload = io.BytesIO()
+        Image.linear_gradient('L').save(upload, 'PNG')
+        return [avatars.store(upload.getvalue()), 64]
+
+
+def _batches(items, size=INSERT_BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_rows(model, fields, rows):
+    """Insert one batch of value tuples with executemany(), skipping model instances"""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _reset_sequences(*models):
+    """Move primary key sequences past explicitly inserted ids"""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def seed(expenses=SCALES['1k'], users=10, days=730, random_seed=0):
+    """
+    Create synthetic data and return a Fixture for the benchmark user.
+
+    Half of the ``expenses`` belong to the benchmark user and the rest are
+    spread over ``users`` other users, so per-user filtering matters.
+    """
+    rng = random.Random(random_seed)
+    today = timezone.localdate()
+    password = make_password(PASSWORD)
+
+    bench_user = User.objects.create(username=BENCHMARK_USERNAME, password=password)
+    UserProfile.objects.create(user=bench_user)
+    User.objects.bulk_create([
+        User(username=f'{BENCHMARK_USERNAME}-{index}', password=password) for index in range(users)
+    ])
+    user_ids = list(User.objects.filter(username__startswith=f'{BENCHMARK_USERNAME}-').values_list('pk', flat=True))
+
+    Category.objects.bulk_create(
+        [Category(name=name) for name in CATEGORY_NAMES], ignore_conflicts=True
+    )
+    category_ids = list(Category.objects.filter(name__in=CATEGORY_NAMES).values_list('pk', flat=True))
+
+    Tag.objects.bulk_create([
+        Tag(user_id=user_id, name=name) for user_id in [bench_user.pk] + user_ids for name in TAG_NAMES
+    ])
+    tag_ids = {}
+    for tag_id, user_id in Tag.objects.values_list('pk', 'user_id'):
+        tag_ids.setdefault(user_id, []).append(tag_id)
+
+    # Weekly rates, so converted totals exercise the rate lookups
+    FxRate.objects.bulk_create([
+        FxRate(currency=currency, date=today - timedelta(days=day), rate=rate + Decimal(day % 13) / 10)
+        for currency, rate in SEED_RATES.items() for day in range(0, days, 7)
+    ])
+    fx.rates_changed()
+
+    payment_methods = [key for key, _ in Expense.PAYMENT_METHODS]
+    ops = connection.ops
+    now = ops.adapt_datetimefield_value(timezone.now())
+    dates = [ops.adapt_datefield_value(today - timedelta(days=day)) for day in range(days)]
+    first_id = (Expense.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+    links = []
+
+    def expense_rows():
+        for pk in range(first_id, first_id + expenses):
+            user_id = bench_user.pk if pk % 2 == 0 or not user_ids else rng.choice(user_ids)
+            for tag_id in rng.sample(tag_ids[user_id], rng.randint(0, 2)):
+                links.append((pk, tag_id))
+            yield (
+                pk,
+                user_id,
+                rng.choice(TITLES),
+                None if pk % 3 else f'Synthetic expense {pk}',
+                ops.adapt_decimalfield_value(Decimal(rng.randint(100, 500_000)) / 100, 12, 2),
+                'USD' if pk % FOREIGN_EVERY == 0 else DEFAULT_CURRENCY,
+                rng.choice(category_ids),
+                rng.choice(dates),
+                rng.choice(payment_methods),
+                False,
+                rng.choice(LOCATIONS),
+                now,
+                now,
+            )
+
+    for batch in _batches(expense_rows()):
+        _insert_rows(Expense, EXPENSE_SEED_FIELDS, batch)
+        _insert_rows(ExpenseTag, ['expense', 'tag'], links)
+        links.clear()
+    _reset_sequences(Expense, ExpenseTag)
+
+    sources = [key for key, _ in Income.INCOME_SOURCES]
+    incomes = (
+        Income(
+            user_id=bench_user.pk if index % 2 == 0 or not user_ids else rng.choice(user_ids),
+            title='Salary' if index % 4 == 0 else 'Side project',
+            amount=Decimal(rng.randint(10_000, 10_000_000)) / 100,
+            source=rng.choice(sources),
+            date=today - timedelta(days=rng.randrange(days)),
+        )
+        for index in range(max(expenses // 10, 1))
+    )
+    for batch in _batches(incomes):
+        Income.objects.bulk_create(batch)
+
+    Budget.objects.bulk_create([
+        Budget(
+            user=bench_user,
+            category_id=category_id,
+            amount=Decimal(rng.randint(1_000, 50_000)),
+            period_type=rng.choice(['monthly', 'weekly', 'yearly']),
+            start_date=today - timedelta(days=rng.randrange(days)),
+        )
+        for category_id in category_ids
+    ])
+
+    rollups.rebuild_all()
+    anomalies.rebuild()
+    budget_alerts.reconcile()
+    get_search_backend().rebuild()
+    # The data versions exist from here on, as for any user who wrote something
+    for owner in (bench_user.pk, cache.GLOBAL):
+        cache.bump(owner)
+    return Fixture(bench_user, expenses, days)
+
+
+class ViewCase:
+    """
+    One request to benchmark.
+
+    ``args``, ``params``, ``data`` and ``budget`` may be callables taking
+    the Fixture; they are evaluated before the timer starts, so a case that
+    deletes can create its own victim.
+    """
+
+    def __init__(self, url_name, budget, method='get', args=None, params=None, data=None, label=None):
+        self.url_name = url_name
+        self.budget = budget
+        self.method = method
+        self.args = args
+        self.params = params or {}
+        self.data = data
+        self.label = label or (url_name if method == 'get' else f'{url_name} ({method.upper()})')
+
+    def request(self, fixture):
+        """Return the URL and the query parameters or form data"""
+        args = self.args(fixture) if callable(self.args) else self.args
+        if args is not None and not isinstance(args, (list, tuple)):
+            args = [args]
+        url = reverse(self.url_name, args=args)
+        if self.method == 'get':
+            return url, self.params(fixture) if callable(self.params) else self.params
+        return url, (self.data(fixture) if callable(self.data) else self.data) or {}
+
+
+def _expense_form(fixture):
+    return {
+        'title': 'Benchmark lunch',
+        'amount': '12.50',
+        'category': fixture.category.pk,
+        'date': timezone.localdate().isoformat(),
+        'payment_method': 'card',
+        'tags': 'work, benchmark',
+    }
+
+
+def _search_term(fixture):
+    return {'q': TITLES[0].lower()}
+
+
+# Query budgets include the session and user lookups of the logged-in client,
+# and for pages the navbar's avatar lookup (cached, but the cache starts cold)
+CASES = [
+    ViewCase('home', 2),
+    ViewCase('dashboard', 11),
+    ViewCase('login', 3),
+    ViewCase('logout', 4, method='post'),
+    ViewCase('register', 3),
+    ViewCase('profile', 4),
+    ViewCase('edit_profile', 4),
+    ViewCase('avatar', 0, args=lambda fixture: fixture.new_avatar()),
+    ViewCase('expense_list', 7),
+    ViewCase('expense_list', 7, params={'tag': 'work', 'date_from': '2000-01-01'}, label='expense_list (filtered)'),
+    ViewCase('expense_list', 7, params={'cursor': ''}, label='expense_list (cursor)'),
+    ViewCase('add_expense', 5),
+    ViewCase('add_expense', 30, method='post', data=_expense_form),
+    ViewCase('import_expenses', 4),
+    ViewCase('edit_expense', 6, args=lambda fixture: fixture.expense_id),
+    ViewCase('delete_expense', 4, args=lambda fixture: fixture.expense_id),
+    ViewCase('delete_expense', 16, method='post', args=lambda fixture: fixture.new_expense()),
+    ViewCase('expense_detail', 4, args=lambda fixture: fixture.expense_id),
+    ViewCase('income_list', 5),
+    ViewCase('add_income', 4),
+    ViewCase('edit_income', 4, args=lambda fixture: fixture.income_id),
+    ViewCase('delete_income', 4, args=lambda fixture: fixture.income_id),
+    ViewCase('delete_income', 10, method='post', args=lambda fixture: fixture.new_income()),
+    ViewCase('category_list', 4),
+    ViewCase('add_category', 3),
+    ViewCase('edit_category', 4, args=lambda fixture: fixture.category.pk),
+    ViewCase('delete_category', 4, args=lambda fixture: fixture.category.pk),
+    ViewCase('delete_category', 9, method='post', args=lambda fixture: fixture.new_category()),
+    ViewCase('budget_list', 5),
+    ViewCase('add_budget', 4),
+    ViewCase('edit_budget', 5, args=lambda fixture: fixture.budget_id),
+    ViewCase('delete_budget', 4, args=lambda fixture: fixture.budget_id),
+    ViewCase('delete_budget', 7, method='post', args=lambda fixture: fixture.new_budget()),
+    ViewCase('analytics', 13),
+    ViewCase('reports', 8),
+    # One tag lookup per export chunk
+    ViewCase('export_expenses', lambda fixture: 3 + math.ceil(
+        Expense.objects.filter(user=fixture.user).count() / EXPORT_CHUNK_SIZE
+    )),
+    ViewCase('export_expenses', 3, method='post', data={'format': 'csv', 'tag': 'work'}),
+    ViewCase('report_pdf', 3, method='post', data={'start_date': '2000-01-01', 'end_date': '2000-12-31'}),
+    ViewCase('task_list', 5),
+    ViewCase('task_status', 3, args=lambda fixture: fixture.new_task()),
+    ViewCase('task_download', 3, args=lambda fixture: fixture.new_task()),
+    ViewCase('dashboard_api', 11),
+    ViewCase('dashboard_api', 5, params={'fields': 'totals,trend'}, label='dashboard_api (totals,trend)'),
+    ViewCase('analytics_api', 5),
+    ViewCase('expense_chart_data', 4),
+    ViewCase('category_chart_data', 4),
+    ViewCase('monthly_trend_data', 5),
+    ViewCase('expense_list_api', 4),
+    ViewCase('expense_list_api', 4, params=_search_term, label='expense_list_api (search)'),
+    ViewCase('income_list_api', 3),
+    ViewCase('profiling_stats', 2),
+    ViewCase('search_expenses', 7, params=_search_term),
+    ViewCase('password_reset', 3),
+    ViewCase('password_reset_done', 3),
+    ViewCase('password_reset_confirm', 4, args=['MQ', 'invalid-token']),
+    ViewCase('password_reset_complete', 3),
+]
+
+
+def uncovered_urls(cases=CASES):
+    """Names of tracker URLs without a benchmark case"""
+    names = {
+        pattern.name for pattern in get_resolver('tracker.urls').url_patterns if pattern.name
+    }
+    return sorted(names - {case.url_name for case in cases})
+
+
+class StubTemplate(Template):
+    """Template that evaluates its context before rendering"""
+
+    def _render(self, context):
+        for value in context.flatten().values():
+            _evaluate(value)
+        return super()._render(context)
+
+
+class StubTemplateLoader(Loader):
+    """Serve a stub extending tracker/base.html for templates not in the tree"""
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.templates = {}
+
+    def get_template_sources(self, template_name):
+        yield Origin(name=template_name, template_name=template_name, loader=self)
+
+    def get_contents(self, origin):
+        return "{% extends 'tracker/base.html' %}"
+
+    def get_template(self, template_name, skip=None):
+        if template_name not in self.templates:
+            origin = next(self.get_template_sources(template_name))
+            self.templates[template_name] = StubTemplate(
+                self.get_contents(origin), origin, template_name, self.engine
+            )
+        return self.templates[template_name]
+
+    def reset(self):
+        self.templates.clear()
+
+
+def _evaluate(value):
+    if isinstance(value, (QuerySet, Page, KeysetPage)):
+        list(value)
+    elif isinstance(value, BaseForm):
+        str(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            if isinstance(item, (QuerySet, Page)):
+                list(item)
+
+
+def benchmark_templates(templates):
+    """TEMPLATES setting with the stub loader appended to every Django engine"""
+    engines = []
+    for engine in templates:
+        engine = dict(engine, OPTIONS=dict(engine.get('OPTIONS', {})))
+        if engine['BACKEND'] == 'django.template.backends.django.DjangoTemplates':
+            engine['APP_DIRS'] = False
+            engine['OPTIONS']['loaders'] = [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+                'tracker.benchmarks.StubTemplateLoader',
+            ]
+        engines.append(engine)
+    return engines
+
+
+def _consume(response):
+    """Read a streaming response to the end without keeping it"""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+def measure(client, case, fixture, repeat=3):
+    """Request one case ``repeat`` times from a cold cache and return its result row"""
+    times = []
+    budget = case.budget(fixture) if callable(case.budget) else case.budget
+    for run in range(repeat + 1):
+        url, payload = case.request(fixture)
+        cache.get_cache().clear()
+        send = getattr(client, case.method)
+        if run < repeat:
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = send(url, payload)
+                _consume(response)
+                times.append(time.perf_counter() - start)
+            if run == 0:
+                query_count, status = len(queries), response.status_code
+        else:
+            # Separate run under tracemalloc, which slows allocation down
+            tracemalloc.start()
+            response = send(url, payload)
+            _consume(response)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        if case.url_name == 'logout':
+            # Log back in for the next run and the cases after this one
+            client.force_login(fixture.user)
+    return {
+        'view': case.label,
+        'url': url,
+        'method': case.method.upper(),
+        'status': status,
+        'queries': query_count,
+        'budget': budget,
+        'time_ms': round(statistics.median(times) * 1000, 3),
+        'times_ms': [round(value * 1000, 3) for value in times],
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+@contextmanager
+def case_environment(fixture):
+    """Yield a client logged in as the fixture's user, with stub templates and throwaway media"""
+    client = Client()
+    client.force_login(fixture.user)
+    # Task results and uploads go to a throwaway MEDIA_ROOT
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        TEMPLATES=benchmark_templates(settings.TEMPLATES), MEDIA_ROOT=media_root,
+        TRACKER_AVATAR_CACHE_DIR=os.path.join(media_root, 'avatar_cache'),
+    ):
+        yield client
+
+
+def run_cases(fixture, cases=CASES, repeat=3):
+    """Benchmark every case as the fixture's user and return the result rows"""
+    with case_environment(fixture) as client:
+        return [measure(client, case, fixture, repeat) for case in cases]
+
+
+def over_budget(results):
+    """Result rows whose query count exceeds the declared budget"""
+    return [row for row in results if row['queries'] > row['budget']]
+
+
+def revision():
+    """Current git commit, when available"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(scale, fixture, results):
+    return {
+        'scale': scale,
+        'expenses': fixture.expenses,
+        'revision': revision(),
+        'created': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'results': results,
+    }
+
+
+def compare_reports(baseline, current, time_tolerance=0.5):
+    """
+    Compare two reports of the same scale and list regressions.
+
+    A view regresses when it runs more queries than in the baseline or its
+    median time grew by more than ``time_tolerance`` (a fraction) and by
+    more than MIN_TIME_DELTA_MS, which keeps timer noise on fast views out.
+    """
+    previous = {row['view']: row for row in baseline['results']}
+    regressions = []
+    for row in current['results']:
+        old = previous.get(row['view'])
+        if old is None:
+            continue
+        if row['queries'] > old['queries']:
+            regressions.append(f"{row['view']}: {old['queries']} -> {row['queries']} queries")
+        slower = row['time_ms'] - old['time_ms']
+        if slower > MIN_TIME_DELTA_MS and row['time_ms'] > old['time_ms'] * (1 + time_tolerance):
+            regressions.append(f"{row['view']}: {old['time_ms']} -> {row['time_ms']} ms")
+    return regressions
+
+
+def load_report(path):
+    with open(path) as report_file:
+        return json.load(report_file)
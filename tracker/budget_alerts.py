@@ -0,0 +1,265 @@
+"""
+Budget alerts.
+
+Each active budget has a BudgetPeriodSpend row per period holding the amount
+spent so far. The receivers in tracker.signals adjust it when an expense is
+saved, deleted or bulk created: the changes are added to the rows of the
+budgets on the expenses' categories with one upsert, so the write path
+never re-aggregates expenses. A period's row is seeded with one aggregate
+the first time it is touched, and a budget's rows are dropped when the
+budget is edited.
+
+When the current period's spending reaches one of
+``TRACKER_BUDGET_ALERT_THRESHOLDS`` (percent of the budget), a BudgetAlert
+is queued. Alerts are unique per budget, period and threshold, and the
+period row remembers the highest threshold queued, so each threshold alerts
+once per period however many expenses follow. A ``send_budget_alerts`` task,
+queued when alerts are created, emails them through ``EMAIL_BACKEND``: one
+message per user covering all of their pending alerts, sent over one
+connection in batches of ``TRACKER_BUDGET_ALERT_BATCH_SIZE``. Alerts of
+users who turned ``budget_alerts`` or ``email_notifications`` off, or have no
+email address, are marked sent without a message.
+
+``manage.py reconcile_budgets`` (meant to run nightly) re-aggregates the
+current periods, corrects counters that drifted (e.g. after
+``QuerySet.update()``), queues any missed alerts and sends pending ones.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import fx, tasks, upserts
+from .budgets import evaluate_budgets
+from .models import Budget, BudgetAlert, BudgetPeriodSpend, Expense, Task, UserProfile
+from .money import format_amount, user_currency
+from .periods import period_window
+
+RECONCILE_BATCH_SIZE = 500
+
+
+def thresholds():
+    return sorted(getattr(settings, 'TRACKER_BUDGET_ALERT_THRESHOLDS', [80, 100]))
+
+
+def batch_size():
+    return getattr(settings, 'TRACKER_BUDGET_ALERT_BATCH_SIZE', 100)
+
+
+def _aggregate_spent(budget, period_start, period_end):
+    return Expense.objects.filter(
+        user_id=budget.user_id, category_id=budget.category_id,
+        date__gte=period_start, date__lt=period_end,
+    ).aggregate(total=Sum(fx.converted()))['total'] or Decimal('0')
+
+
+def apply_changes(changes, today=None):
+    """
+    Add expense changes to the spend counters of the budgets they fall in.
+
+    ``changes`` are ``(rollup values, sign)`` pairs of expenses already
+    written (sign 1 for added, -1 for removed).
+    """
+    date_field = Expense._meta.get_field('date')
+    deltas = defaultdict(Decimal)
+    for values, sign in changes:
+        day = date_field.to_python(values['date'])
+        deltas[values['user_id'], values['category_id'], day] += sign * values['amount']
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    budgets = defaultdict(list)
+    for budget in Budget.objects.filter(
+        is_active=True,
+        user_id__in={user_id for user_id, _, _ in deltas},
+        category_id__in={category_id for _, category_id, _ in deltas},
+    ):
+        budgets[budget.user_id, budget.category_id].append(budget)
+    if not budgets:
+        return
+
+    periods = defaultdict(Decimal)
+    for (user_id, category_id, day), delta in deltas.items():
+        for budget in budgets[user_id, category_id]:
+            period_start, period_end = period_window(budget.period_type, budget.start_date, day)
+            if period_start <= day < period_end:
+                periods[budget, period_start, period_end] += delta
+
+    stored = {
+        (row.budget_id, row.period_start): row
+        for row in BudgetPeriodSpend.objects.filter(
+            budget__in={budget for budget, _, _ in periods},
+            period_start__in={period_start for _, period_start, _ in periods},
+        )
+    }
+    today = today or timezone.localdate()
+    rows, increments = {}, []
+    for (budget, period_start, period_end), delta in periods.items():
+        row = stored.get((budget.pk, period_start))
+        if row is None:
+            row = _seed(budget, period_start, period_end, delta)
+        elif delta:
+            increments.append({
+                'budget_id': budget.pk, 'period_start': period_start, 'period_end': period_end,
+                'spent': delta, 'alerted_threshold': 0, 'updated_at': timezone.now(),
+            })
+            row.spent += delta
+        rows[budget, period_start, period_end] = row
+    # The stored counters of every period take their changes in one statement
+    upserts.upsert(BudgetPeriodSpend, increments, ['budget', 'period_start'],
+                   dict(upserts.added('spent'), updated_at='{new.updated_at}'))
+    for (budget, period_start, period_end), row in rows.items():
+        if periods[budget, period_start, period_end] > 0 and period_start <= today < period_end:
+            check_thresholds(budget, row)
+
+
+def _seed(budget, period_start, period_end, delta):
+    """Create a period's counter from an aggregate, which already counts the change being applied"""
+    spent = _aggregate_spent(budget, period_start, period_end)
+    try:
+        with transaction.atomic():
+            return BudgetPeriodSpend.objects.create(
+                budget=budget, period_start=period_start, period_end=period_end, spent=spent
+            )
+    except IntegrityError:
+        # Another writer seeded the row first, without this transaction's change
+        BudgetPeriodSpend.objects.filter(budget=budget, period_start=period_start).update(
+            spent=F('spent') + delta
+        )
+        return BudgetPeriodSpend.objects.get(budget=budget, period_start=period_start)
+
+
+def check_thresholds(budget, row):
+    """Queue alerts for thresholds the period has reached since the last alert; returns how many"""
+    percentage = row.spent / budget.amount * 100 if budget.amount > 0 else 0
+    reached = [threshold for threshold in thresholds() if row.alerted_threshold < threshold <= percentage]
+    if not reached:
+        return 0
+    BudgetAlert.objects.bulk_create([
+        BudgetAlert(budget=budget, period_start=row.period_start, threshold=threshold,
+                    spent=row.spent, budget_amount=budget.amount)
+        for threshold in reached
+    ], ignore_conflicts=True)
+    BudgetPeriodSpend.objects.filter(pk=row.pk, alerted_threshold__lt=reached[-1]).update(
+        alerted_threshold=reached[-1]
+    )
+    row.alerted_threshold = reached[-1]
+    queue_sending()
+    return len(reached)
+
+
+def queue_sending():
+    """Queue a send_budget_alerts task once the transaction commits, unless one is waiting"""
+    def enqueue():
+        if not Task.objects.filter(kind='send_budget_alerts', status=Task.PENDING).exists():
+            tasks.enqueue('send_budget_alerts')
+
+    transaction.on_commit(enqueue)
+
+
+def forget_periods(budget):
+    """Drop an edited budget's counters; they are seeded again with its new settings"""
+    BudgetPeriodSpend.objects.filter(budget=budget).delete()
+
+
+def forget_users(users=None):
+    """Drop the counters of ``users`` (all when None), e.g. after their home currency changed"""
+    rows = BudgetPeriodSpend.objects.all()
+    if users is not None:
+        rows = rows.filter(budget__user__in=users)
+    rows.delete()
+
+
+def _wants_email(user):
+    try:
+        profile = user.profile
+    except UserProfile.DoesNotExist:
+        return bool(user.email)
+    return bool(user.email) and profile.budget_alerts and profile.email_notifications
+
+
+def _message(user, alerts):
+    currency = user_currency(user)
+    if len(alerts) == 1:
+        alert = alerts[0]
+        subject = f'Budget alert: {alert.budget.category.name} reached {alert.threshold}%'
+    else:
+        subject = f'Budget alerts: {len(alerts)} budget thresholds reached'
+    lines = [f'Hi {user.get_short_name() or user.username},', '']
+    for alert in alerts:
+        lines.append(
+            f'- {alert.budget.category.name} ({alert.budget.period_type}, from {alert.period_start:%d %b %Y}): '
+            f'{format_amount(alert.spent, currency)} of {format_amount(alert.budget_amount, currency)} spent, '
+            f'past the {alert.threshold}% threshold'
+        )
+    return EmailMessage(subject, '\n'.join(lines), to=[user.email])
+
+
+def send_pending():
+    """Email every pending alert, one message per user; returns ``(messages, alerts)`` sent"""
+    pending = BudgetAlert.objects.filter(sent_at__isnull=True).select_related(
+        'budget__user__profile', 'budget__category'
+    ).order_by('budget__user_id', 'created_at')
+    by_user = defaultdict(list)
+    for alert in pending:
+        by_user[alert.budget.user].append(alert)
+    if not by_user:
+        return 0, 0
+
+    muted = [alert.pk for user, alerts in by_user.items() if not _wants_email(user) for alert in alerts]
+    BudgetAlert.objects.filter(pk__in=muted).update(sent_at=timezone.now())
+    outgoing = [(user, alerts) for user, alerts in by_user.items() if _wants_email(user)]
+
+    sent_messages = sent_alerts = 0
+    with get_connection() as connection:
+        for offset in range(0, len(outgoing), batch_size()):
+            batch = outgoing[offset:offset + batch_size()]
+            connection.send_messages([_message(user, alerts) for user, alerts in batch])
+            alert_ids = [alert.pk for _, alerts in batch for alert in alerts]
+            # Marked per batch, so a failure part way only resends the unsent batches
+            BudgetAlert.objects.filter(pk__in=alert_ids).update(sent_at=timezone.now(), emailed=True)
+            sent_messages += len(batch)
+            sent_alerts += len(alert_ids)
+    return sent_messages, sent_alerts
+
+
+def reconcile(today=None):
+    """
+    Re-aggregate the current period of every active budget, fix drifted
+    counters and queue missed alerts. Returns ``(checked, corrected, alerts)``.
+    """
+    today = today or timezone.localdate()
+    checked = corrected = queued = 0
+    budgets = Budget.objects.filter(is_active=True).select_related('category').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(budgets.filter(pk__gt=last_pk)[:RECONCILE_BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        statuses = evaluate_budgets(batch, today)
+        stored = {
+            (row.budget_id, row.period_start): row
+            for row in BudgetPeriodSpend.objects.filter(
+                budget__in=batch, period_start__in={status['period_start'] for status in statuses}
+            )
+        }
+        for status in statuses:
+            budget, spent = status['budget'], status['spent']
+            row = stored.get((budget.pk, status['period_start']))
+            if row is None:
+                row = BudgetPeriodSpend.objects.create(
+                    budget=budget, period_start=status['period_start'],
+                    period_end=status['period_end'], spent=spent,
+                )
+            elif row.spent != spent:
+                BudgetPeriodSpend.objects.filter(pk=row.pk).update(spent=spent)
+                row.spent = spent
+                corrected += 1
+            queued += check_thresholds(budget, row)
+            checked += 1
+    return checked, corrected, queued
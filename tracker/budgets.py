@@ -0,0 +1,83 @@
+"""
+Budget evaluation.
+
+evaluate_budgets() works out spent, remaining, percentage and status for any
+number of budgets with a single aggregate query. Every budget is measured
+over its own current period, which depends on its ``period_type`` and is
+anchored on its ``start_date``.
+"""
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import fx
+from .models import Budget, Expense
+from .periods import period_window
+
+# Budgets evaluated per query; keeps the SQL statement a reasonable size
+QUERY_BATCH_SIZE = 100
+
+
+def budget_period(budget, today=None):
+    """Return the half-open (start, end) window of a budget's current period"""
+    today = today or timezone.localdate()
+    start_date = Budget._meta.get_field('start_date').to_python(budget.start_date)
+    return period_window(budget.period_type, start_date, today)
+
+
+def status_for(percentage):
+    """Map a spent percentage to the status used by templates and the admin"""
+    if percentage > 90:
+        return 'danger'
+    if percentage > 70:
+        return 'warning'
+    return 'success'
+
+
+def evaluate_budgets(budgets, today=None):
+    """
+    Evaluate budgets against their current periods.
+
+    Returns one dict per budget, in the order given, with ``budget``,
+    ``spent``, ``remaining``, ``percentage``, ``status``, ``period_start`` and
+    ``period_end`` (exclusive).
+    """
+    budgets = list(budgets)
+    today = today or timezone.localdate()
+    windows = {budget.pk: budget_period(budget, today) for budget in budgets}
+
+    spent = {}
+    for offset in range(0, len(budgets), QUERY_BATCH_SIZE):
+        batch = budgets[offset:offset + QUERY_BATCH_SIZE]
+        sums = {}
+        matches_any = Q()
+        for budget in batch:
+            period_start, period_end = windows[budget.pk]
+            matches = Q(
+                user_id=budget.user_id,
+                category_id=budget.category_id,
+                date__gte=period_start,
+                date__lt=period_end
+            )
+            sums[f'budget_{budget.pk}'] = Sum(fx.converted(), filter=matches)
+            matches_any |= matches
+        totals = Expense.objects.filter(matches_any).aggregate(**sums)
+        for budget in batch:
+            spent[budget.pk] = totals[f'budget_{budget.pk}'] or Decimal('0')
+
+    results = []
+    for budget in budgets:
+        period_start, period_end = windows[budget.pk]
+        budget_spent = spent[budget.pk]
+        percentage = float(budget_spent / budget.amount * 100) if budget.amount > 0 else 0
+        results.append({
+            'budget': budget,
+            'spent': budget_spent,
+            'remaining': budget.amount - budget_spent,
+            'percentage': percentage,
+            'status': status_for(percentage),
+            'period_start': period_start,
+            'period_end': period_end,
+        })
+    return results
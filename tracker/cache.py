@@ -0,0 +1,236 @@
+"""
+Per-user caching of analytics and chart data.
+
+Every user has a data version that is bumped (after commit) whenever one of
+their expenses, incomes or budgets is saved or deleted; category changes
+bump a global version shared by everyone. Cache keys include both versions,
+so stale entries are never read and simply expire. The same versions drive
+ETag/Last-Modified headers, letting browsers revalidate with a 304 instead
+of downloading the data again.
+
+The versions are DataVersion rows rather than cache entries, so a write in
+any process, including the ``run_tasks`` worker (imports, rollup rebuilds,
+receipts), invalidates what every other process cached; reading both
+versions costs one query per request. The cached data itself is in
+``TRACKER_CACHE_ALIAS`` (see CACHES in settings). With the default
+LocMemCache each process keeps its own copies, which are still never stale;
+avatar digests cached there are, and system check tracker.W001 warns about
+it when DEBUG is off.
+
+Versions used to be cache entries too, bumped in the writing process's own
+cache; they moved to the database once imports and rollup rebuilds ran in
+the task worker, whose bumps never reached the web processes.
+
+Hits and misses of the cached views are counted in the tracker cache and
+reported by the staff ``profiling_stats`` endpoint (per process with
+LocMemCache, like the data).
+"""
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.timezone import localdate
+from django.views.decorators.http import condition
+
+from .models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+GLOBAL = 'global'
+STATS_KEYS = {
+    True: 'tracker:stats:hits',
+    False: 'tracker:stats:misses',
+}
+
+
+def get_cache():
+    return caches[getattr(settings, 'TRACKER_CACHE_ALIAS', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'TRACKER_CACHE_TIMEOUT', 3600)
+
+
+def _new_version(owner):
+    # Start from the clock so a recreated counter never reuses an old version
+    now = time.time()
+    return DataVersion(owner=str(owner), version=int(now * 1000), modified=now)
+
+
+def _versions(*owners):
+    """Return ``{owner: (version, modified)}``, creating missing counters"""
+    owners = [str(owner) for owner in owners]
+    rows = DataVersion.objects.filter(owner__in=owners).values_list('owner', 'version', 'modified')
+    versions = {owner: (version, modified) for owner, version, modified in rows}
+    missing = [_new_version(owner) for owner in owners if owner not in versions]
+    if missing:
+        # Losing a race to create a counter only changes this request's version
+        DataVersion.objects.bulk_create(missing, ignore_conflicts=True)
+        versions.update((row.owner, (row.version, row.modified)) for row in missing)
+    return versions
+
+
+def bump(owner):
+    """Invalidate everything cached for ``owner`` (a user id or GLOBAL)"""
+    counters = DataVersion.objects.filter(owner=str(owner))
+    if not counters.update(version=F('version') + 1, modified=time.time()):
+        DataVersion.objects.bulk_create([_new_version(owner)], ignore_conflicts=True)
+        counters.update(version=F('version') + 1, modified=time.time())
+
+
+def bump_on_commit(owner):
+    """Bump once the current transaction commits, so readers see the new data"""
+    transaction.on_commit(lambda: bump(owner))
+
+
+def data_version(user_id):
+    """Return ``(version token, last modified timestamp)`` for a user's data"""
+    versions = _versions(user_id, GLOBAL)
+    user_version, user_modified = versions[str(user_id)]
+    global_version, global_modified = versions[GLOBAL]
+    return f'{user_version}.{global_version}', max(user_modified, global_modified)
+
+
+def request_version(request):
+    """data_version() of the request's user, read once per request"""
+    if not hasattr(request, '_tracker_data_version'):
+        request._tracker_data_version = data_version(request.user.pk)
+    return request._tracker_data_version
+
+
+def record(hit):
+    """Count a cache hit or miss"""
+    cache = get_cache()
+    key = STATS_KEYS[hit]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    """Return the hit/miss counters, as shown by the profiling_stats endpoint"""
+    values = get_cache().get_many(STATS_KEYS.values())
+    return {
+        'hits': values.get(STATS_KEYS[True], 0),
+        'misses': values.get(STATS_KEYS[False], 0),
+    }
+
+
+def user_cache_key(name, user_id, params='', version=None):
+    """
+    Build the cache key for one piece of a user's data.
+
+    Today's date is part of the key because default ranges ("last 30 days",
+    "this year") move with the calendar even when the data does not.
+    """
+    if version is None:
+        version, _ = data_version(user_id)
+    digest = hashlib.md5(f'{localdate()}:{params}'.encode()).hexdigest()
+    return f'tracker:data:{name}:{user_id}:{version}:{digest}'
+
+
+def cached_for_user(name, user_id, compute, params='', version=None):
+    """
+    Return ``compute()`` from the cache, keyed by user and data version
+    (pass ``version`` when it was already read, e.g. by request_version())
+    """
+    cache = get_cache()
+    key = user_cache_key(name, user_id, params, version)
+    value = cache.get(key)
+    if value is not None:
+        record(True)
+        return value
+    record(False)
+    logger.debug('Cache miss for %s', key)
+    value = compute()
+    cache.set(key, value, cache_timeout())
+    return value
+
+
+def _etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    version, _ = request_version(request)
+    view_name = getattr(request.resolver_match, 'view_name', '')
+    raw = f'{view_name}:{request.user.pk}:{version}:{localdate()}:{request.GET.urlencode()}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    _, modified = request_version(request)
+    return datetime.fromtimestamp(int(modified), tz=timezone.utc)
+
+
+def conditional_user_view(view):
+    """Answer with 304 when the user's data has not changed since the client's copy"""
+    return condition(etag_func=_etag, last_modified_func=_last_modified)(view)
+
+
+def _cached_response(request, view):
+    """Return ``(key, cached HttpResponse or None)`` for a cached_user_view request"""
+    name = getattr(request.resolver_match, 'view_name', None) or view.__name__
+    version, _ = request_version(request)
+    key = user_cache_key(name, request.user.pk, request.GET.urlencode(), version)
+    cached = get_cache().get(key)
+    record(cached is not None)
+    if cached is None:
+        return key, None
+    content, content_type = cached
+    return key, HttpResponse(content, content_type=content_type)
+
+
+def _store_response(key, response):
+    if response.status_code == 200 and not response.streaming:
+        get_cache().set(key, (response.content, response['Content-Type']), cache_timeout())
+
+
+def cached_user_view(view):
+    """
+    Cache a JSON view's response per user and data version, with ETag support.
+
+    Only successful responses are stored; the query string is part of the key.
+    Works on sync and async views.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key, response = await sync_to_async(_cached_response)(request, view)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                await sync_to_async(_store_response)(key, response)
+            return response
+
+        conditional = conditional_user_view(async_wrapper)
+
+        @wraps(view)
+        async def resolve_user(request, *args, **kwargs):
+            # The ETag functions and the view read request.user and the
+            # data version synchronously
+            request.user = await request.auser()
+            if request.user.is_authenticated:
+                await sync_to_async(request_version)(request)
+            return await conditional(request, *args, **kwargs)
+
+        return resolve_user
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key, response = _cached_response(request, view)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            _store_response(key, response)
+        return response
+
+    return conditional_user_view(wrapper)
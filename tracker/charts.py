@@ -0,0 +1,138 @@
+"""
+Time series for the chart API endpoints.
+
+Each series is one ``Trunc*``-grouped query per model; buckets are exact
+calendar periods and periods without transactions are filled with zero in
+Python, so the query count does not depend on the size of the window.
+``aseries`` is the async counterpart used by the async chart views.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from . import fx
+from .periods import add_months
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+LABEL_FORMATS = {
+    'day': '%d %b %Y',
+    'week': 'Week of %d %b %Y',
+    'month': '%b %Y',
+    'year': '%Y',
+}
+
+MAX_MONTHS = 120
+MAX_BUCKETS = 1000
+
+
+class ChartRange:
+    """Inclusive date window split into buckets of one granularity"""
+
+    def __init__(self, start, end, granularity='month'):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+        if start > end:
+            raise ValueError('start must not be after end')
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.buckets = self._bucket_starts()
+        if len(self.buckets) > MAX_BUCKETS:
+            raise ValueError(f'range has more than {MAX_BUCKETS} {granularity} buckets')
+
+    @classmethod
+    def from_params(cls, params, default_months, today=None):
+        """
+        Read ``months=`` or ``start=``/``end=`` (YYYY-MM-DD) and ``granularity=``.
+
+        Without parameters the window is the last ``default_months`` calendar
+        months including the current one. Raises ValueError on bad input.
+        """
+        today = today or timezone.localdate()
+        granularity = params.get('granularity') or 'month'
+        end = date.fromisoformat(params['end']) if params.get('end') else today
+        if params.get('start'):
+            start = date.fromisoformat(params['start'])
+        else:
+            try:
+                months = int(params.get('months') or default_months)
+            except ValueError:
+                raise ValueError('months must be a whole number')
+            if not 1 <= months <= MAX_MONTHS:
+                raise ValueError(f'months must be between 1 and {MAX_MONTHS}')
+            start = add_months(end.replace(day=1), -(months - 1))
+        return cls(start, end, granularity)
+
+    def bucket_start(self, value):
+        """Return the start of the bucket containing ``value``"""
+        if self.granularity == 'week':
+            return value - timedelta(days=value.weekday())
+        if self.granularity == 'month':
+            return value.replace(day=1)
+        if self.granularity == 'year':
+            return value.replace(month=1, day=1)
+        return value
+
+    def next_bucket(self, value):
+        if self.granularity == 'day':
+            return value + timedelta(days=1)
+        if self.granularity == 'week':
+            return value + timedelta(days=7)
+        if self.granularity == 'month':
+            return add_months(value, 1)
+        return value.replace(year=value.year + 1)
+
+    def _bucket_starts(self):
+        buckets = []
+        current = self.bucket_start(self.start)
+        while current <= self.end and len(buckets) <= MAX_BUCKETS:
+            buckets.append(current)
+            current = self.next_bucket(current)
+        return buckets
+
+    @property
+    def labels(self):
+        label_format = LABEL_FORMATS[self.granularity]
+        return [bucket.strftime(label_format) for bucket in self.buckets]
+
+
+def series_query(queryset, chart_range):
+    """Grouped query returning ``(period, total)`` rows within the range"""
+    trunc = GRANULARITIES[chart_range.granularity]
+    return queryset.filter(
+        date__gte=chart_range.start,
+        date__lte=chart_range.end
+    ).annotate(
+        period=trunc('date')
+    ).values('period').annotate(
+        total=Sum(fx.converted())
+    ).order_by('period').values_list('period', 'total')
+
+
+def fill_series(rows, chart_range):
+    """Align grouped rows to the range's buckets, filling gaps with zero"""
+    totals = {}
+    for period, total in rows:
+        if hasattr(period, 'date'):
+            period = period.date()
+        totals[period] = float(total or 0)
+    return [totals.get(bucket, 0.0) for bucket in chart_range.buckets]
+
+
+def series(queryset, chart_range):
+    """Run series_query and return one total per bucket"""
+    return fill_series(series_query(queryset, chart_range), chart_range)
+
+
+async def aseries(queryset, chart_range):
+    """Async series(): iterate the grouped query with the async ORM"""
+    rows = [row async for row in series_query(queryset, chart_range)]
+    return fill_series(rows, chart_range)
@@ -0,0 +1,31 @@
+"""
+System checks for deployment settings the tracker depends on.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .cache import get_cache
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_tracker_cache(app_configs, **kwargs):
+    """Entries kept current by writes (avatar digests) must be seen by every process"""
+    # The development server is a single process
+    if settings.DEBUG:
+        return []
+    backend = f'{type(get_cache()).__module__}.{type(get_cache()).__name__}'
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'The tracker cache ({backend}) is local to each process.',
+        hint=('Cached data is keyed by the data versions in the database, so it is never stale, but '
+              'each process computes its own copy, and an avatar changed through one process keeps '
+              'its old URL in the others. Use it with a single process only, or set '
+              'TRACKER_CACHE_BACKEND=file (or point the tracker cache at Redis or Memcached).'),
+        id='tracker.W001',
+    )]
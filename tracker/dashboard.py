@@ -0,0 +1,112 @@
+"""
+Data for the combined dashboard API.
+
+``DashboardData`` builds every dashboard widget for one user from a few
+shared queries: the user's expense and income rollup rows (one row per
+month and category or source, so a handful of rows per month) feed the
+totals, the category breakdown and the trend series, while budgets and
+recent and unusual transactions have their own queries. Each query runs at most once
+and only when a requested widget needs it.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from functools import cached_property
+
+from django.utils import timezone
+
+from . import anomalies
+from .budgets import evaluate_budgets
+from .models import Budget, Expense, ExpenseRollup, Income, IncomeRollup
+
+FIELDS = ['totals', 'categories', 'budgets', 'recent', 'anomalies', 'trend']
+
+RECENT_EXPENSES = 5
+RECENT_INCOME = 3
+
+
+def parse_fields(value):
+    """Parse a comma-separated ``fields=`` value; raises ValueError on unknown names"""
+    if not value:
+        return list(FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}. Choose from {", ".join(FIELDS)}')
+    return [field for field in FIELDS if field in fields]
+
+
+class DashboardData:
+    """Dashboard widgets for one user; ``chart_range`` is the monthly trend window"""
+
+    def __init__(self, user, chart_range, today=None):
+        self.user = user
+        self.chart_range = chart_range
+        self.month = (today or timezone.localdate()).replace(day=1)
+
+    @cached_property
+    def expense_rollups(self):
+        return list(ExpenseRollup.objects.filter(user=self.user).values_list(
+            'month', 'category__name', 'category__color', 'total'
+        ))
+
+    @cached_property
+    def income_rollups(self):
+        return list(IncomeRollup.objects.filter(user=self.user).values_list('month', 'total'))
+
+    def _by_month(self, rows):
+        totals = defaultdict(Decimal)
+        for row in rows:
+            totals[row[0]] += row[-1]
+        return totals
+
+    def build(self, fields):
+        return {field: getattr(self, field)() for field in fields}
+
+    def totals(self):
+        expenses = self._by_month(self.expense_rollups)
+        income = self._by_month(self.income_rollups)
+        monthly_expenses, monthly_income = expenses[self.month], income[self.month]
+        total_expenses, total_income = sum(expenses.values(), Decimal('0')), sum(income.values(), Decimal('0'))
+        return {
+            'monthly_expenses': monthly_expenses,
+            'monthly_income': monthly_income,
+            'monthly_balance': monthly_income - monthly_expenses,
+            'total_expenses': total_expenses,
+            'total_income': total_income,
+            'total_balance': total_income - total_expenses,
+        }
+
+    def categories(self):
+        """This month's spending per category, largest first"""
+        rows = [
+            {'name': name, 'color': color, 'total': total}
+            for month, name, color, total in self.expense_rollups
+            if month == self.month
+        ]
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def budgets(self):
+        budgets = Budget.objects.filter(user=self.user, is_active=True).select_related('category')
+        return evaluate_budgets(budgets)
+
+    def recent(self):
+        return {
+            'expenses': list(Expense.objects.filter(user=self.user).select_related('category')
+                             .prefetch_related('tags')[:RECENT_EXPENSES]),
+            'income': list(Income.objects.filter(user=self.user)[:RECENT_INCOME]),
+        }
+
+    def anomalies(self):
+        """Recently flagged unusual expenses (see tracker/anomalies.py)"""
+        return list(anomalies.recent(self.user).prefetch_related('tags'))
+
+    def trend(self):
+        expenses = self._by_month(self.expense_rollups)
+        income = self._by_month(self.income_rollups)
+        buckets = self.chart_range.buckets
+        return {
+            'labels': self.chart_range.labels,
+            'periods': [bucket.isoformat() for bucket in buckets],
+            'expenses': [float(expenses.get(bucket, 0)) for bucket in buckets],
+            'income': [float(income.get(bucket, 0)) for bucket in buckets],
+        }
@@ -0,0 +1,92 @@
+"""
+CSV and XLSX export of expenses.
+
+Rows are fetched in chunks with ``QuerySet.iterator()`` (a server-side
+cursor on backends that support one) and written out one at a time, so
+memory use does not grow with the size of the export. Tags are looked up
+with one query per chunk.
+
+XLSX files are written by the background export task with openpyxl's
+write-only mode; openpyxl is only needed for that format.
+"""
+import csv
+import io
+from itertools import islice
+
+from .models import Expense
+from .tags import tag_names
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+EXPENSE_HEADER = [
+    'Date', 'Title', 'Category', 'Amount', 'Currency', 'Payment Method',
+    'Description', 'Tags', 'Location'
+]
+
+EXPENSE_COLUMNS = [
+    'pk', 'date', 'title', 'category__name', 'amount', 'currency', 'payment_method',
+    'description', 'location'
+]
+
+
+class Echo:
+    """File-like object whose write() hands the value straight back"""
+    
+    def write(self, value):
+        return value
+
+
+def expense_rows(expenses):
+    """Yield one CSV row per expense, header first"""
+    payment_methods = dict(Expense.PAYMENT_METHODS)
+    yield EXPENSE_HEADER
+    rows = expenses.values_list(*EXPENSE_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        tags = tag_names([row[0] for row in chunk])
+        for pk, date, title, category, amount, currency, payment_method, description, location in chunk:
+            yield [
+                date,
+                title,
+                category,
+                amount,
+                currency,
+                payment_methods.get(payment_method, payment_method),
+                description or '',
+                ', '.join(tags.get(pk, [])),
+                location or '',
+            ]
+
+
+def stream_csv(rows):
+    """Encode rows as CSV lines one by one"""
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(rows, fileobj):
+    """Write rows as UTF-8 CSV to a binary file"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    for row in rows:
+        writer.writerow(row)
+    text.detach()
+
+
+def write_xlsx(rows, fileobj):
+    """Write rows as a single-sheet XLSX workbook to a binary file"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Expenses')
+    for row in rows:
+        sheet.append(row)
+    workbook.save(fileobj)
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from . import fx
 from .models import Expense, Income, Category, Budget, UserProfile
+from .tags import parse_tags, set_tags
 
 class CustomUserCreationForm(UserCreationForm):
     """Enhanced user registration form"""
@@ -39,13 +41,36 @@ class CustomUserCreationForm(UserCreationForm):
             'placeholder': 'Confirm password'
         })
 
-class ExpenseForm(forms.ModelForm):
+class CurrencyFormMixin:
+    """Optional ``currency`` field defaulting to the owner's home currency (``home_currency``)"""
+    
+    def __init__(self, *args, home_currency=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['currency'].required = False
+        if home_currency and not self.instance.pk:
+            self.initial.setdefault('currency', home_currency)
+    
+    def clean_currency(self):
+        currency = self.cleaned_data['currency'] or self.initial.get('currency') or self.instance.currency
+        if currency != self.initial.get('currency') and not fx.rate_table().has_rates(currency):
+            raise forms.ValidationError(f'No exchange rates are loaded for {currency} yet.')
+        return currency
+
+class ExpenseForm(CurrencyFormMixin, forms.ModelForm):
     """Enhanced expense form with better widgets"""
+    tags = forms.CharField(
+        max_length=200,
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Add tags separated by commas (optional)'
+        })
+    )
     
     class Meta:
         model = Expense
-        fields = ['title', 'description', 'amount', 'category', 'date', 'payment_method', 
-                 'receipt_image', 'is_recurring', 'recurring_period', 'tags', 'location']
+        fields = ['title', 'description', 'amount', 'currency', 'category', 'date', 'payment_method', 
+                 'receipt_image', 'is_recurring', 'recurring_period', 'location']
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -62,6 +87,9 @@ class ExpenseForm(forms.ModelForm):
                 'min': '0.01',
                 'placeholder': '0.00'
             }),
+            'currency': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'category': forms.Select(attrs={
                 'class': 'form-select'
             }),
@@ -82,10 +110,6 @@ class ExpenseForm(forms.ModelForm):
             'recurring_period': forms.Select(attrs={
                 'class': 'form-select'
             }),
-            'tags': forms.TextInput(attrs={
-                'class': 'form-control',
-                'placeholder': 'Add tags separated by commas (optional)'
-            }),
             'location': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Where did you spend? (optional)'
@@ -95,13 +119,22 @@ class ExpenseForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['recurring_period'].required = False
+        if self.instance.pk:
+            self.initial.setdefault('tags', ', '.join(self.instance.get_tags_list()))
+    
+    def clean_tags(self):
+        return parse_tags(self.cleaned_data['tags'])
+    
+    def _save_m2m(self):
+        super()._save_m2m()
+        set_tags(self.instance, self.cleaned_data['tags'])
 
-class IncomeForm(forms.ModelForm):
+class IncomeForm(CurrencyFormMixin, forms.ModelForm):
     """Income form for tracking earnings"""
     
     class Meta:
         model = Income
-        fields = ['title', 'description', 'amount', 'source', 'date', 'is_recurring', 'recurring_period']
+        fields = ['title', 'description', 'amount', 'currency', 'source', 'date', 'is_recurring', 'recurring_period']
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -118,6 +151,9 @@ class IncomeForm(forms.ModelForm):
                 'min': '0.01',
                 'placeholder': '0.00'
             }),
+            'currency': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'source': forms.Select(attrs={
                 'class': 'form-select'
             }),
@@ -218,6 +254,35 @@ class UserProfileForm(forms.ModelForm):
             }),
         }
 
+class ExpenseImportForm(forms.Form):
+    """Form for uploading a bank statement to import"""
+    FORMAT_CHOICES = [
+        ('', 'Detect from file name'),
+        ('csv', 'CSV'),
+        ('ofx', 'OFX / QFX'),
+    ]
+    
+    statement = forms.FileField(widget=forms.FileInput(attrs={
+        'class': 'form-control',
+        'accept': '.csv,.ofx,.qfx'
+    }))
+    file_format = forms.ChoiceField(
+        choices=FORMAT_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-select'
+        })
+    )
+    default_category = forms.ModelChoiceField(
+        queryset=Category.objects.all(),
+        required=False,
+        empty_label="No default (rows need a category)",
+        help_text='Used for rows without a category column',
+        widget=forms.Select(attrs={
+            'class': 'form-select'
+        })
+    )
+
 class ExpenseFilterForm(forms.Form):
     """Form for filtering expenses"""
     date_from = forms.DateField(
@@ -264,4 +329,33 @@ class ExpenseFilterForm(forms.Form):
             'class': 'form-control',
             'placeholder': 'Max amount'
         })
-    )
\ No newline at end of file
+    )
+    tag = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Tags (comma-separated, all must match)'
+        })
+    )
+    
+    def filter_queryset(self, queryset):
+        """Apply the submitted filters to an expense queryset"""
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data.get('date_from'):
+            queryset = queryset.filter(date__gte=data['date_from'])
+        if data.get('date_to'):
+            queryset = queryset.filter(date__lte=data['date_to'])
+        if data.get('category'):
+            queryset = queryset.filter(category=data['category'])
+        if data.get('payment_method'):
+            queryset = queryset.filter(payment_method=data['payment_method'])
+        if data.get('amount_min'):
+            queryset = queryset.filter(amount__gte=data['amount_min'])
+        if data.get('amount_max'):
+            queryset = queryset.filter(amount__lte=data['amount_max'])
+        for name in parse_tags(data.get('tag')):
+            # One join per tag; a tag appears at most once per expense
+            queryset = queryset.filter(expense_tags__tag__name=name)
+        return queryset
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Exchange rates and conversion to a user's home currency.
+
+Expenses and income keep the currency they were paid in; budgets, rollups
+and all totals are in the owner's home currency (``UserProfile.currency``).
+FxRate holds daily rates loaded from CSV files by ``manage.py
+load_fx_rates``, each the value of one unit of a currency in
+``TRACKER_FX_BASE_CURRENCY``. A transaction converts at the latest rate on
+or before its date (the earliest rate for dates before the first one) as
+``amount * rate(currency) / rate(home)``, rounded to cents. A currency with
+no rates at all is counted at par.
+
+The rule has two implementations:
+
+- ``converted()`` is an SQL expression for aggregations, so a total over
+  any number of transactions stays one query. Rows already in the home
+  currency skip the lookups; the others find their rates through the
+  (currency, date) index in correlated subqueries.
+- ``convert()`` serves single transactions on the write path (rollups,
+  budget counters, anomaly stats). It reads a per-process RateTable that
+  holds every rate sorted by date per currency and finds one by binary
+  search. At most every ``VERSION_CHECK_INTERVAL`` seconds a process
+  compares the row count and latest ``updated_at`` of FxRate with the ones
+  its table was loaded from, and reloads when they differ. The check reads
+  the database rather than a cache, so every web and task worker process
+  notices new rates, whatever cache backend is configured.
+
+The home currency is read from the profile, once per transaction being
+written (``home_of()``; ``load_homes()`` for bulk inserts), never from a
+process-local cache, so a changed home currency applies to every process's
+next write.
+
+``load_csv()`` reads rates from CSV with ``date``, ``currency`` and ``rate``
+columns, replacing stored rates for the same currency and day. Rollups hold
+converted totals, so loading rates or changing a home currency queues a
+``rebuild_rollups`` task for the users affected. After loading rates the
+task waits ``REBUILD_DELAY`` seconds, until every process has reloaded its
+RateTable, so writes converted with the old rates in the meantime are
+rebuilt as well.
+"""
+import bisect
+import csv
+import io
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Case, Count, DecimalField, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Round
+
+from .models import Expense, FxRate, Income, UserProfile
+from .money import CURRENCIES, DEFAULT_CURRENCY
+
+VERSION_CHECK_INTERVAL = 60  # seconds
+
+# Rebuilds after loading rates wait until every process reloaded its RateTable
+REBUILD_DELAY = timedelta(seconds=VERSION_CHECK_INTERVAL + 5)
+
+CENT = Decimal('0.01')
+
+LOAD_BATCH_SIZE = 1000
+
+
+def base_currency():
+    return getattr(settings, 'TRACKER_FX_BASE_CURRENCY', DEFAULT_CURRENCY)
+
+
+class RateTable:
+    """Every rate in memory, as parallel date and rate lists per currency"""
+
+    def __init__(self, rows):
+        self.dates = defaultdict(list)
+        self.rates = defaultdict(list)
+        # Rows come sorted by currency and date
+        for currency, day, rate in rows:
+            self.dates[currency].append(day)
+            self.rates[currency].append(rate)
+
+    @classmethod
+    def load(cls):
+        return cls(FxRate.objects.order_by('currency', 'date').values_list('currency', 'date', 'rate').iterator())
+
+    def has_rates(self, currency):
+        return currency == base_currency() or bool(self.dates.get(currency))
+
+    def rate(self, currency, day):
+        """Rate of ``currency`` on ``day``, or None when it has no rates"""
+        if currency == base_currency():
+            return Decimal(1)
+        dates = self.dates.get(currency)
+        if not dates:
+            return None
+        index = max(bisect.bisect_right(dates, day) - 1, 0)
+        return self.rates[currency][index]
+
+    def convert(self, amount, currency, home, day):
+        if currency == home:
+            return amount
+        rate, home_rate = self.rate(currency, day), self.rate(home, day)
+        if rate is None or home_rate is None:
+            return amount
+        return (amount * rate / home_rate).quantize(CENT, ROUND_HALF_UP)
+
+
+_loaded = {'table': None, 'version': None, 'checked_at': 0.0}
+
+
+def _rates_version():
+    """Changes whenever rates are loaded, replaced or deleted"""
+    version = FxRate.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return version['count'], version['updated']
+
+
+def rate_table():
+    """This process's RateTable, reloaded within ``VERSION_CHECK_INTERVAL`` of a rate change"""
+    now = time.monotonic()
+    if _loaded['table'] is None or now - _loaded['checked_at'] >= VERSION_CHECK_INTERVAL:
+        version = _rates_version()
+        if _loaded['table'] is None or version != _loaded['version']:
+            _loaded['table'], _loaded['version'] = RateTable.load(), version
+        _loaded['checked_at'] = now
+    return _loaded['table']
+
+
+def rates_changed():
+    """Reload this process's RateTable now; other processes notice on their next check"""
+    _loaded['table'] = None
+
+
+def home_currency(user_id):
+    """The user's home currency, from their profile"""
+    currency = UserProfile.objects.filter(user_id=user_id).values_list('currency', flat=True).first()
+    return currency or DEFAULT_CURRENCY
+
+
+def home_expression(prefix=''):
+    """SQL expression for the owner's home currency, to load it with a transaction"""
+    return Coalesce(F(f'{prefix}user__profile__currency'), Value(DEFAULT_CURRENCY))
+
+
+def remember_home(instance, home):
+    """Note the home currency of a transaction's owner, for ``home_of()``"""
+    instance._fx_home = (instance.user_id, home)
+
+
+def home_of(instance):
+    """The home currency of a transaction's owner, read once per instance and owner"""
+    user_id, home = getattr(instance, '_fx_home', (None, None))
+    if user_id != instance.user_id:
+        home = home_currency(instance.user_id)
+        remember_home(instance, home)
+    return home
+
+
+def load_homes(instances):
+    """Read the home currencies of many transactions' owners with one query"""
+    missing = [
+        instance for instance in instances
+        if getattr(instance, '_fx_home', (None, None))[0] != instance.user_id
+    ]
+    if not missing:
+        return
+    homes = dict(UserProfile.objects.filter(
+        user_id__in={instance.user_id for instance in missing}
+    ).values_list('user_id', 'currency'))
+    for instance in missing:
+        remember_home(instance, homes.get(instance.user_id, DEFAULT_CURRENCY))
+
+
+def convert(amount, currency, home, day):
+    """A transaction amount in the ``home`` currency"""
+    if currency == home:
+        return amount
+    return rate_table().convert(amount, currency, home, day)
+
+
+def _rate(date, currency=None, column=None):
+    """SQL rate of a currency ``column`` (a field path) or a ``currency`` code on a date path"""
+    if currency is not None:
+        if currency == base_currency():
+            return Value(Decimal(1))
+        rates = FxRate.objects.filter(currency=currency)
+    else:
+        rates = FxRate.objects.filter(currency=OuterRef(column))
+    rates = rates.values('rate')
+    rate = Coalesce(
+        Subquery(rates.filter(date__lte=OuterRef(date)).order_by('-date')[:1]),
+        Subquery(rates.filter(date__gt=OuterRef(date)).order_by('date')[:1]),
+    )
+    if column is None:
+        return rate
+    return Case(When(**{column: base_currency()}, then=Value(Decimal(1))), default=rate)
+
+
+def converted(home=None, prefix=''):
+    """
+    SQL expression for transaction amounts in the home currency: ``home`` is
+    a currency code, or None for each owner's profile currency. ``prefix``
+    reaches the transaction through a relation, e.g. ``'expense__'``.
+    """
+    amount, currency, date = F(f'{prefix}amount'), f'{prefix}currency', f'{prefix}date'
+    if home is None:
+        home_column = f'{prefix}user__profile__currency'
+        same = Q(**{currency: home_expression(prefix)})
+        home_rate = _rate(date, column=home_column)
+    else:
+        same = Q(**{currency: home})
+        home_rate = _rate(date, currency=home)
+    value = Round(amount * _rate(date, column=currency) / home_rate, 2)
+    return Case(
+        When(same, then=amount),
+        default=Coalesce(value, amount),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def users_with_foreign_transactions():
+    """Ids of users with expenses or income outside their home currency"""
+    user_ids = set()
+    for model in (Expense, Income):
+        user_ids.update(model.objects.exclude(currency=home_expression()).values_list('user_id', flat=True).distinct())
+    return sorted(user_ids)
+
+
+def _parse_rate(row):
+    date_field, rate_field = FxRate._meta.get_field('date'), FxRate._meta.get_field('rate')
+    currency = (row.get('currency') or '').strip().upper()
+    if currency not in dict(CURRENCIES):
+        raise ValidationError(f'currency: unknown currency "{currency}"')
+    if currency == base_currency():
+        raise ValidationError(f'currency: {currency} is the base currency, its rate is always 1')
+    day = date_field.clean((row.get('date') or '').strip(), None)
+    rate = rate_field.clean((row.get('rate') or '').strip(), None)
+    if rate <= 0:
+        raise ValidationError('rate: must be positive')
+    return FxRate(currency=currency, date=day, rate=rate)
+
+
+def load_csv(fileobj):
+    """
+    Store the rates of a CSV file, replacing existing rates of the same
+    currency and day. Returns ``(loaded, errors)`` where ``errors`` are
+    ``(line, message)`` pairs of rejected rows.
+    """
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(fileobj)
+    loaded, errors, batch = 0, [], []
+
+    def write(batch):
+        FxRate.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['rate', 'updated_at']
+        )
+        return len(batch)
+
+    for line, row in enumerate(reader, start=2):
+        row = {(key or '').strip().lower(): value for key, value in row.items()}
+        try:
+            batch.append(_parse_rate(row))
+        except ValidationError as error:
+            errors.append((line, ' '.join(error.messages)))
+            continue
+        if len(batch) >= LOAD_BATCH_SIZE:
+            loaded += write(batch)
+            batch = []
+    if batch:
+        loaded += write(batch)
+    return loaded, errors
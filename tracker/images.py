@@ -0,0 +1,87 @@
+"""
+Image re-encoding with Pillow.
+
+This module has no Django imports, so process pools (see the
+process_receipts command) can import it and run ``encode_receipt`` in child
+processes without setting Django up.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+# Qualities tried in turn until the encoded image fits the byte cap
+QUALITY_STEPS = (82, 74, 66, 58, 50)
+
+THUMBNAIL_QUALITY = 72
+
+# Images still over the byte cap at the lowest quality are scaled down, but
+# not below this many pixels on the shorter side
+MIN_SIDE = 800
+
+FORMAT_EXTENSIONS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+
+def encode(image, image_format, quality):
+    """Encode ``image`` without any metadata and return the bytes"""
+    output = io.BytesIO()
+    if image_format == 'WEBP':
+        image.save(output, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def encode_capped(image, image_format, max_bytes):
+    """Encode at the highest quality step that fits ``max_bytes`` (or the lowest one)"""
+    for quality in QUALITY_STEPS:
+        data = encode(image, image_format, quality)
+        if len(data) <= max_bytes:
+            break
+    return data
+
+
+def open_upright(data, max_side):
+    """Decode ``data`` into an RGB image no larger than ``max_side``, with EXIF orientation applied"""
+    image = Image.open(io.BytesIO(data))
+    # Lets the JPEG decoder scale down by a power of two while decoding
+    image.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    # Drop EXIF (GPS position, camera serial), XMP and ICC data so the
+    # encoders have nothing to copy over
+    image.info = {}
+    return image
+
+
+def encode_receipt(data, image_format='WEBP', max_side=2000, max_bytes=400 * 1024, widths=(160, 320, 640)):
+    """
+    Re-encode an uploaded receipt photo.
+
+    Returns ``{'size': (width, height), 'full': bytes, 'thumbnails': {width: bytes}}``
+    with a thumbnail for each of ``widths`` narrower than the full image.
+    """
+    image = open_upright(data, max_side)
+    full = encode_capped(image, image_format, max_bytes)
+    while len(full) > max_bytes and min(image.size) * 0.8 >= MIN_SIDE:
+        image = image.resize((round(image.width * 0.8), round(image.height * 0.8)), Image.Resampling.LANCZOS)
+        full = encode(image, image_format, QUALITY_STEPS[-1])
+    thumbnails = {}
+    source = image
+    for width in sorted(widths, reverse=True):
+        if width >= image.width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        # Each thumbnail is scaled down from the next larger one
+        source = source.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        thumbnails[width] = encode(source, image_format, THUMBNAIL_QUALITY)
+    return {'size': image.size, 'full': full, 'thumbnails': thumbnails}
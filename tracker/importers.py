@@ -0,0 +1,313 @@
+"""
+Bulk import of expenses from bank statements.
+
+Statements are parsed as a stream (CSV or OFX), each row is validated
+against the Expense field definitions, categories are resolved through an
+in-memory cache and valid rows are written with ``bulk_create`` in batches,
+one transaction per batch. Categories new to a batch are created in its
+transaction, so a batch that fails leaves none behind. Invalid rows are
+reported and skipped; they never abort the rest of the file.
+"""
+import codecs
+import csv
+import os
+import re
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import fx
+from .models import Category, Expense
+from .signals import transactions_bulk_created
+from .tags import add_tags, parse_tags
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Only the first errors are kept in full; the rest are just counted
+MAX_REPORTED_ERRORS = 1000
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %b %Y', '%Y%m%d']
+
+# Accepted CSV header spellings for each Expense field
+CSV_COLUMNS = {
+    'date': ['date', 'transaction date', 'txn date', 'value date', 'posted date'],
+    'title': ['title', 'name', 'payee', 'narration', 'particulars', 'description'],
+    'amount': ['amount', 'debit', 'withdrawal', 'withdrawal amount', 'debit amount'],
+    'category': ['category'],
+    'payment_method': ['payment method', 'payment_method', 'mode'],
+    'description': ['description', 'memo', 'notes', 'remarks'],
+    'tags': ['tags'],
+    'location': ['location'],
+    'credit': ['credit', 'deposit', 'credit amount', 'deposit amount'],
+}
+
+VALIDATED_FIELDS = ['title', 'description', 'amount', 'date', 'payment_method', 'location']
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+class ImportResult:
+    """Outcome of an import run"""
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.categories_created = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def processed(self):
+        return self.created + self.skipped + self.error_count
+
+
+def text_stream(fileobj, encoding='utf-8-sig'):
+    """Decode a binary file object lazily, line by line"""
+    if hasattr(fileobj, 'chunks'):
+        fileobj.seek(0)
+    reader = codecs.getreader(encoding)(fileobj, errors='replace')
+    return iter(reader.readline, '')
+
+
+def parse_csv(fileobj):
+    """Yield ``(line_number, row)`` for each CSV record, with headers mapped to Expense fields"""
+    reader = csv.reader(text_stream(fileobj))
+    header = next(reader, None)
+    if header is None:
+        return
+    normalized = [column.strip().lower() for column in header]
+    positions = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized and normalized.index(alias) not in positions.values():
+                positions[field] = normalized.index(alias)
+                break
+
+    for record in reader:
+        if not any(value.strip() for value in record):
+            continue
+        row = {
+            field: record[index].strip() if index < len(record) else ''
+            for field, index in positions.items()
+        }
+        yield reader.line_num, row
+
+
+def parse_ofx(fileobj):
+    """
+    Yield ``(transaction_number, row)`` for each transaction in an OFX statement.
+
+    Both SGML (OFX 1.x, unclosed tags) and XML (OFX 2.x) files are read
+    incrementally; only the current <STMTTRN> block is held in memory.
+    """
+    current = None
+    number = 0
+    pending = ''
+    for line in text_stream(fileobj):
+        pending += line
+        last_tag = pending.rfind('<')
+        if last_tag == -1:
+            continue
+        chunk, pending = pending[:last_tag], pending[last_tag:]
+        for closing, tag, value in OFX_TAG.findall(chunk):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    number += 1
+                    yield number, _ofx_row(current)
+                    current = None
+                elif not closing:
+                    current = {}
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+    if current:
+        yield number + 1, _ofx_row(current)
+
+
+def _ofx_row(transaction):
+    amount = transaction.get('TRNAMT', '')
+    if not amount.startswith('-'):
+        return {'credit': amount}
+    return {
+        'date': transaction.get('DTPOSTED', '')[:8],
+        'title': transaction.get('NAME') or transaction.get('MEMO', ''),
+        'amount': amount,
+        'description': transaction.get('MEMO', ''),
+    }
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+}
+
+
+def inline_import_limit():
+    """Statements larger than this many bytes are imported by a background task"""
+    return getattr(settings, 'TRACKER_INLINE_IMPORT_MAX_BYTES', 1024 * 1024)
+
+
+def store_upload(user, upload):
+    """Save an uploaded statement for a background import and return its storage name"""
+    name = os.path.basename(upload.name) or 'statement'
+    return default_storage.save(f'tasks/uploads/{user.pk}/{uuid.uuid4().hex}/{name}', upload)
+
+
+def detect_format(filename):
+    """Guess the statement format from a file name"""
+    if filename.lower().endswith(('.ofx', '.qfx')):
+        return 'ofx'
+    return 'csv'
+
+
+class ExpenseImporter:
+    """Validate statement rows and write them as expenses in batches"""
+
+    def __init__(self, user, batch_size=DEFAULT_BATCH_SIZE, default_category=None,
+                 create_categories=True, date_formats=DATE_FORMATS, progress=None):
+        self.user = user
+        # Statements are read as amounts in the user's home currency
+        self.currency = fx.home_currency(user.pk)
+        # Called with the ImportResult after every written batch
+        self.progress = progress
+        self.batch_size = batch_size
+        self.default_category = default_category
+        self.create_categories = create_categories
+        self.date_formats = date_formats
+        self.fields = {name: Expense._meta.get_field(name) for name in VALIDATED_FIELDS}
+        self.payment_methods = {}
+        for key, label in Expense.PAYMENT_METHODS:
+            self.payment_methods[key] = key
+            self.payment_methods[label.lower()] = key
+        self.categories = {category.name.lower(): category.pk for category in Category.objects.all()}
+        # Categories to create with the next batch: lowercased name -> (name, expenses)
+        self.new_categories = {}
+
+    def run(self, rows):
+        """Import ``(line, row)`` pairs from a parser and return an ImportResult"""
+        result = ImportResult()
+        batch = []
+        for line, row in rows:
+            if self.is_deposit(row):
+                result.skipped += 1
+                continue
+            try:
+                batch.append((self.build_expense(row), parse_tags(row.get('tags', ''))))
+            except ValidationError as error:
+                result.add_error(line, '; '.join(error.messages))
+                continue
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, result)
+                batch = []
+        if batch:
+            self.write_batch(batch, result)
+        return result
+
+    def import_file(self, fileobj, file_format):
+        return self.run(PARSERS[file_format](fileobj))
+
+    def is_deposit(self, row):
+        """Deposits in a debit/credit statement (no or a zero debit) are not expenses"""
+        if not row.get('credit'):
+            return False
+        try:
+            return not self.parse_amount(row.get('amount', ''))
+        except ValidationError:
+            return not row.get('amount')
+
+    def write_batch(self, batch, result):
+        """Insert ``(expense, tag names)`` pairs with their tags and new categories in one transaction"""
+        expenses = [expense for expense, _ in batch]
+        new_categories, self.new_categories = self.new_categories, {}
+        created = {}
+        with transaction.atomic():
+            for key, (name, members) in new_categories.items():
+                category, was_created = Category.objects.get_or_create(name__iexact=name, defaults={'name': name})
+                created[key] = category.pk
+                result.categories_created += was_created
+                for expense in members:
+                    expense.category_id = category.pk
+            Expense.objects.bulk_create(expenses)
+            add_tags(self.user.pk, batch)
+            transactions_bulk_created.send(sender=Expense, instances=expenses)
+        # Only categories that were committed are reused by later batches
+        self.categories.update(created)
+        result.created += len(expenses)
+        if self.progress:
+            self.progress(result)
+
+    def build_expense(self, row):
+        """Turn a parsed row into an unsaved Expense, raising ValidationError when invalid"""
+        values = {
+            'title': row.get('title', ''),
+            'description': row.get('description') or None,
+            'amount': self.parse_amount(row.get('amount', '')),
+            'date': self.parse_date(row.get('date', '')),
+            'payment_method': self.parse_payment_method(row.get('payment_method', '')),
+            'location': row.get('location') or None,
+        }
+        if values['title'] and values['description'] == values['title']:
+            values['description'] = None
+
+        errors = {}
+        for name, field in self.fields.items():
+            try:
+                values[name] = field.clean(values[name], None)
+            except ValidationError as error:
+                errors[name] = error.messages
+        if errors:
+            raise ValidationError([f'{name}: {" ".join(messages)}' for name, messages in errors.items()])
+
+        category_id, new_category = self.resolve_category(row.get('category', ''))
+        expense = Expense(user=self.user, currency=self.currency, category_id=category_id, **values)
+        if new_category:
+            self.new_categories.setdefault(new_category.lower(), (new_category, []))[1].append(expense)
+        fx.remember_home(expense, self.currency)
+        return expense
+
+    def parse_amount(self, value):
+        cleaned = re.sub(r'[^\d.\-]', '', value or '')
+        try:
+            return abs(Decimal(cleaned))
+        except InvalidOperation:
+            raise ValidationError(f'amount: "{value}" is not a number')
+
+    def parse_date(self, value):
+        for date_format in self.date_formats:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        raise ValidationError(f'date: "{value}" is not a recognised date')
+
+    def parse_payment_method(self, value):
+        if not value:
+            return Expense._meta.get_field('payment_method').default
+        return self.payment_methods.get(value.strip().lower(), value)
+
+    def resolve_category(self, name):
+        """Return ``(category_id, None)``, or ``(None, name)`` for a category created with the batch"""
+        name = name.strip()
+        if not name:
+            if self.default_category is None:
+                raise ValidationError('category: a category is required')
+            return self.default_category.pk, None
+
+        key = name.lower()
+        if key in self.categories:
+            return self.categories[key], None
+        if not self.create_categories:
+            raise ValidationError(f'category: "{name}" does not exist')
+        if len(name) > Category._meta.get_field('name').max_length:
+            raise ValidationError(f'category: "{name}" is too long')
+        return None, self.new_categories.get(key, (name,))[0]
@@ -0,0 +1,211 @@
+"""
+Spending statistics computed with NumPy.
+
+``load_columns()`` reads a user's expenses with a single ``values_list``
+query into column arrays, and ``compute()`` derives every statistic from
+those arrays with vectorized operations (``bincount``, ``cumsum``, matrix
+products), so the cost is a few passes over the arrays rather than a Python
+loop per row:
+
+- daily totals of the last ``HISTORY_DAYS`` days with 7 and 30 day rolling
+  averages
+- percentiles of the expense amounts
+- anomaly flags: expenses more than ``ANOMALY_Z`` standard deviations above
+  the mean of their category (categories with at least
+  ``ANOMALY_MIN_SAMPLES`` expenses)
+- a month-ahead forecast per category from a least-squares line through the
+  last ``FORECAST_MONTHS`` complete months
+- the share of each payment method
+
+NumPy is optional: without it ``user_insights()`` returns None and the
+analytics page and API say the statistics are unavailable. Results are
+cached per user (see tracker.cache). ``manage.py benchmark_insights`` times
+``compute()`` on synthetic data.
+"""
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import fx
+from .cache import cached_for_user
+from .models import Category, Expense
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HISTORY_DAYS = 90
+ROLLING_WINDOWS = (7, 30)
+PERCENTILES = (50, 75, 90, 95, 99)
+ANOMALY_Z = 3.0
+ANOMALY_MIN_SAMPLES = 5
+ANOMALY_LIMIT = 10
+FORECAST_MONTHS = 6
+
+# Payment methods are held as indexes into this list, so they can be counted
+# with bincount instead of sorting strings
+METHODS = [value for value, _ in Expense.PAYMENT_METHODS]
+
+
+def available():
+    return np is not None
+
+
+class Columns:
+    """A user's expenses as parallel NumPy arrays"""
+
+    def __init__(self, ids, days, amounts, categories, methods):
+        self.ids = ids                # int64 expense ids
+        self.days = days              # datetime64[D]
+        self.amounts = amounts        # float64
+        self.categories = categories  # int64 category ids
+        self.methods = methods        # int64 indexes into METHODS
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def load_columns(user):
+    """Read the user's expenses into Columns with one query"""
+    rows = Expense.objects.filter(user=user).order_by().values_list(
+        'id', 'date', Cast(fx.converted(), FloatField()), 'category_id', 'payment_method'
+    )
+    ids, days, amounts, categories, methods = list(zip(*rows)) or [()] * 5
+    method_index = {method: index for index, method in enumerate(METHODS)}
+    other = method_index['other']
+    return Columns(
+        np.array(ids, dtype=np.int64),
+        np.array(days, dtype='datetime64[D]'),
+        np.array(amounts, dtype=np.float64),
+        np.array(categories, dtype=np.int64),
+        np.array([method_index.get(method, other) for method in methods], dtype=np.int64),
+    )
+
+
+def _rounded(values):
+    return [round(float(value), 2) for value in values]
+
+
+def daily_trend(columns, today):
+    """Daily totals of the last HISTORY_DAYS days, with their rolling averages"""
+    longest = max(ROLLING_WINDOWS)
+    first = np.datetime64(today, 'D') - (HISTORY_DAYS + longest - 1)
+    offsets = (columns.days - first).astype(np.int64)
+    keep = (offsets >= 0) & (offsets < HISTORY_DAYS + longest)
+    daily = np.bincount(offsets[keep], weights=columns.amounts[keep], minlength=HISTORY_DAYS + longest)
+    running = np.concatenate(([0.0], np.cumsum(daily)))
+    trend = {
+        'days': [str(day) for day in np.arange(first + longest, first + longest + HISTORY_DAYS)],
+        'totals': _rounded(daily[longest:]),
+    }
+    for window in ROLLING_WINDOWS:
+        # Sum of the window ending on each day, from the running total
+        end = np.arange(longest + 1, HISTORY_DAYS + longest + 1)
+        trend[f'rolling_{window}'] = _rounded((running[end] - running[end - window]) / window)
+    return trend
+
+
+def percentiles(columns):
+    if not len(columns):
+        return {}
+    values = np.percentile(columns.amounts, PERCENTILES)
+    result = {f'p{p}': round(float(value), 2) for p, value in zip(PERCENTILES, values)}
+    result['mean'] = round(float(columns.amounts.mean()), 2)
+    return result
+
+
+def anomalies(columns):
+    """The most recent expenses far above their category's mean"""
+    if not len(columns):
+        return []
+    category_ids, codes = np.unique(columns.categories, return_inverse=True)
+    counts = np.bincount(codes)
+    means = np.bincount(codes, weights=columns.amounts) / counts
+    deviations = columns.amounts - means[codes]
+    stds = np.sqrt(np.bincount(codes, weights=deviations ** 2) / counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(stds[codes] > 0, deviations / stds[codes], 0.0)
+    flagged = np.flatnonzero((scores > ANOMALY_Z) & (counts[codes] >= ANOMALY_MIN_SAMPLES))
+    # Most recent first
+    flagged = flagged[np.argsort(columns.days[flagged])[::-1][:ANOMALY_LIMIT]]
+    return [{
+        'id': int(columns.ids[i]),
+        'date': str(columns.days[i]),
+        'amount': round(float(columns.amounts[i]), 2),
+        'category_id': int(category_ids[codes[i]]),
+        'category_mean': round(float(means[codes[i]]), 2),
+        'z_score': round(float(scores[i]), 2),
+    } for i in flagged]
+
+
+def forecasts(columns, today):
+    """Next month's spending per category, extrapolated from the last complete months"""
+    if not len(columns):
+        return []
+    first = np.datetime64(today, 'M') - FORECAST_MONTHS
+    offsets = (columns.days.astype('datetime64[M]') - first).astype(np.int64)
+    keep = (offsets >= 0) & (offsets < FORECAST_MONTHS)
+    if not keep.any():
+        return []
+    category_ids, codes = np.unique(columns.categories[keep], return_inverse=True)
+    totals = np.bincount(
+        codes * FORECAST_MONTHS + offsets[keep],
+        weights=columns.amounts[keep],
+        minlength=len(category_ids) * FORECAST_MONTHS,
+    ).reshape(len(category_ids), FORECAST_MONTHS)
+    # Least-squares line through each category's months at once
+    x = np.arange(FORECAST_MONTHS) - (FORECAST_MONTHS - 1) / 2
+    averages = totals.mean(axis=1)
+    slopes = (totals - averages[:, None]) @ x / (x @ x)
+    predicted = np.maximum(averages + slopes * (FORECAST_MONTHS - (FORECAST_MONTHS - 1) / 2), 0)
+    order = np.argsort(predicted)[::-1]
+    return [{
+        'category_id': int(category_ids[i]),
+        'forecast': round(float(predicted[i]), 2),
+        'last_month': round(float(totals[i, -1]), 2),
+        'average': round(float(averages[i]), 2),
+        'trend': round(float(slopes[i]), 2),
+    } for i in order]
+
+
+def payment_methods(columns):
+    if not len(columns):
+        return []
+    totals = np.bincount(columns.methods, weights=columns.amounts, minlength=len(METHODS))
+    order = np.argsort(totals)[::-1]
+    return [{
+        'payment_method': METHODS[i],
+        'total': round(float(totals[i]), 2),
+        'share': round(float(totals[i] / totals.sum() * 100), 1),
+    } for i in order if totals[i]]
+
+
+def compute(columns, today):
+    """Every statistic for ``columns`` as plain JSON-ready values"""
+    return {
+        'count': len(columns),
+        'trend': daily_trend(columns, today),
+        'percentiles': percentiles(columns),
+        'anomalies': anomalies(columns),
+        'forecasts': forecasts(columns, today),
+        'payment_methods': payment_methods(columns),
+    }
+
+
+def _build(user, today):
+    result = compute(load_columns(user), today)
+    category_ids = {row['category_id'] for row in result['anomalies'] + result['forecasts']}
+    names = dict(Category.objects.filter(pk__in=category_ids).values_list('pk', 'name'))
+    for row in result['anomalies'] + result['forecasts']:
+        row['category'] = names.get(row['category_id'])
+    return result
+
+
+def user_insights(user, version=None):
+    """The user's spending statistics (cached; ``version`` as for cached_for_user), or None without NumPy"""
+    if not available():
+        return None
+    today = timezone.localdate()
+    return cached_for_user('insights', user.pk, lambda: _build(user, today), params=today.isoformat(),
+                           version=version)
@@ -0,0 +1,170 @@
+"""
+Handlers for the built-in background tasks (see tracker.tasks).
+"""
+import csv
+import io
+import tempfile
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.http import QueryDict
+
+from . import anomalies, budget_alerts, cache, receipts, rollups
+from .exports import expense_rows, write_csv, write_xlsx
+from .forms import ExpenseFilterForm
+from .importers import ExpenseImporter
+from .models import Category, Expense
+from .reports import report_summary
+from .tasks import TaskError, handler, report_progress, save_result
+
+EXPORT_WRITERS = {
+    'csv': write_csv,
+    'xlsx': write_xlsx,
+}
+
+
+def _with_progress(task, rows, total):
+    """Pass rows through, reporting how many data rows have gone by"""
+    for done, row in enumerate(rows):
+        if done % 1000 == 0:
+            report_progress(task, done, total, f'{done} of {total} rows')
+        yield row
+
+
+@handler('export_expenses')
+def export_expenses(task):
+    """Params: ``filters`` (expense list filter values as lists) and ``format``"""
+    file_format = task.params.get('format', 'csv')
+    if file_format not in EXPORT_WRITERS:
+        raise TaskError(f'Unsupported export format "{file_format}"')
+    if file_format == 'xlsx':
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise TaskError('XLSX export needs openpyxl installed')
+
+    filters = QueryDict(mutable=True)
+    for key, values in task.params.get('filters', {}).items():
+        filters.setlist(key, values)
+    expenses = ExpenseFilterForm(filters).filter_queryset(
+        Expense.objects.filter(user=task.user)
+    ).order_by('-date', '-created_at')
+    total = expenses.count()
+
+    with tempfile.TemporaryFile() as output:
+        EXPORT_WRITERS[file_format](_with_progress(task, expense_rows(expenses), total), output)
+        output.seek(0)
+        save_result(task, f'expenses-{date.today():%Y%m%d}.{file_format}', output)
+    report_progress(task, total, total, f'{total} expenses exported')
+
+
+@handler('report_pdf')
+def report_pdf(task):
+    """Params: ``start_date`` and ``end_date`` (ISO dates)"""
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+    except ImportError:
+        raise TaskError('PDF reports need reportlab installed')
+
+    start_date = date.fromisoformat(task.params['start_date'])
+    end_date = date.fromisoformat(task.params['end_date'])
+    summary = report_summary(task.user, start_date, end_date)
+    report_progress(task, 50, message='Totals computed')
+
+    lines = [
+        (16, f'Report for {task.user.username}: {start_date:%d %b %Y} - {end_date:%d %b %Y}'),
+        (11, ''),
+        (11, f"Total expenses: {summary['total_expenses']:.2f} ({summary['expenses_count']} transactions)"),
+        (11, f"Total income: {summary['total_income']:.2f} ({summary['incomes_count']} transactions)"),
+        (11, f"Net savings: {summary['net_savings']:.2f}"),
+        (11, ''),
+        (13, 'Expenses by category'),
+    ]
+    lines += [(11, f"{row['category__name']}: {row['total']:.2f} ({row['count']})")
+              for row in summary['category_breakdown']]
+    lines += [(11, ''), (13, 'Income by source')]
+    lines += [(11, f"{row['source']}: {row['total']:.2f} ({row['count']})")
+              for row in summary['income_breakdown']]
+
+    output = io.BytesIO()
+    pdf = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+    y = height - 60
+    for size, text in lines:
+        if y < 60:
+            pdf.showPage()
+            y = height - 60
+        pdf.setFont('Helvetica', size)
+        pdf.drawString(50, y, text)
+        y -= size + 8
+    pdf.save()
+    output.seek(0)
+    save_result(task, f'report-{start_date:%Y%m%d}-{end_date:%Y%m%d}.pdf', output)
+    report_progress(task, 100, message='Report ready')
+
+
+@handler('import_expenses')
+def import_expenses(task):
+    """Params: ``path`` (storage name of the upload), ``name``, ``file_format`` and ``default_category``"""
+    default_category = None
+    if task.params.get('default_category'):
+        default_category = Category.objects.filter(pk=task.params['default_category']).first()
+    path = task.params['path']
+    if not default_storage.exists(path):
+        raise TaskError(f'The uploaded statement {task.params.get("name", path)} is gone')
+    size = default_storage.size(path)
+
+    with default_storage.open(path, 'rb') as statement:
+        importer = ExpenseImporter(
+            task.user,
+            default_category=default_category,
+            progress=lambda result: report_progress(
+                task, statement.tell(), size, f'{result.created} expenses imported'
+            ),
+        )
+        result = importer.import_file(statement, task.params.get('file_format', 'csv'))
+
+    if result.errors:
+        errors = io.StringIO()
+        writer = csv.writer(errors)
+        writer.writerow(['Row', 'Error'])
+        writer.writerows(result.errors)
+        save_result(task, 'import-errors.csv', io.BytesIO(errors.getvalue().encode()))
+    report_progress(task, 100, message=(
+        f'Imported {result.created} expenses ({result.skipped} skipped, {result.error_count} errors)'
+    ))
+    default_storage.delete(path)
+
+
+@handler('rebuild_rollups')
+def rebuild_rollups(task):
+    """Params: ``user_ids`` (optional; all users when missing)"""
+    users = None
+    if task.params.get('user_ids'):
+        users = list(User.objects.filter(pk__in=task.params['user_ids']))
+    counts = rollups.rebuild_all(users)
+    counts['ExpenseCategoryStats'] = anomalies.rebuild(users)
+    budget_alerts.forget_users(users)
+    for owner in [user.pk for user in users] if users is not None else [cache.GLOBAL]:
+        cache.bump(owner)
+    report_progress(task, 100, message=', '.join(f'{name}: {count} rows' for name, count in counts.items()))
+
+
+@handler('process_receipt')
+def process_receipt(task):
+    """Params: ``expense_id`` and ``name`` (storage name of the uploaded receipt)"""
+    name = task.params['name']
+    try:
+        attached = receipts.process(task.params['expense_id'], name)
+    except FileNotFoundError:
+        raise TaskError(f'The uploaded receipt {name} is gone')
+    report_progress(task, 100, message='Receipt processed' if attached else 'Receipt was replaced or removed')
+
+
+@handler('send_budget_alerts')
+def send_budget_alerts(task):
+    """Email pending budget alerts (see tracker/budget_alerts.py)"""
+    messages, alerts = budget_alerts.send_pending()
+    report_progress(task, 100, message=f'Sent {messages} emails covering {alerts} alerts')
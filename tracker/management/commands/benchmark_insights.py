@@ -0,0 +1,51 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import insights
+
+
+def synthetic_columns(rows, categories, days, today, seed=0):
+    """``rows`` random expenses spread over the ``days`` days up to ``today``"""
+    np = insights.np
+    rng = np.random.default_rng(seed)
+    return insights.Columns(
+        ids=np.arange(1, rows + 1, dtype=np.int64),
+        days=np.datetime64(today, 'D') - rng.integers(0, days, rows),
+        amounts=np.round(rng.lognormal(6, 1, rows), 2),
+        categories=rng.integers(1, categories + 1, rows),
+        methods=rng.integers(0, len(insights.METHODS), rows),
+    )
+
+
+class Command(BaseCommand):
+    help = ('Time the NumPy spending statistics (tracker/insights.py) on synthetic expenses; '
+            'fails when the best run is slower than --budget')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Expenses (default: 1,000,000)')
+        parser.add_argument('--categories', type=int, default=20, help='Categories (default: 20)')
+        parser.add_argument('--days', type=int, default=3 * 365, help='Days of history (default: 3 years)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs (default: 5)')
+        parser.add_argument('--budget', type=float, default=1.0, help='Seconds allowed for the best run (default: 1)')
+
+    def handle(self, *args, **options):
+        if not insights.available():
+            raise CommandError('NumPy is not installed')
+        today = datetime.date.today()
+        columns = synthetic_columns(options['rows'], options['categories'], options['days'], today)
+        timings = []
+        for _ in range(max(options['repeat'], 1)):
+            started = time.perf_counter()
+            result = insights.compute(columns, today)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        self.stdout.write(
+            f"{len(columns):,} rows: best {best * 1000:.0f} ms, median "
+            f"{sorted(timings)[len(timings) // 2] * 1000:.0f} ms; "
+            f"{len(result['anomalies'])} anomalies, {len(result['forecasts'])} forecasts"
+        )
+        if best > options['budget']:
+            raise CommandError(f"Best run took {best:.2f}s, over the {options['budget']:.2f}s budget")
+        self.stdout.write(self.style.SUCCESS(f"Within the {options['budget']:.2f}s budget"))
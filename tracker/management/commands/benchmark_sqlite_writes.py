@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expensetracker.db import PROFILES, apply_pragmas, profile_settings
+
+# A cut-down expense table and monthly rollup with the same indexes as the
+# tracker tables, written the way add_expense writes: one insert and one
+# rollup upsert per transaction.
+SCHEMA = [
+    'CREATE TABLE expense (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, '
+    'category_id INTEGER NOT NULL, title VARCHAR(200) NOT NULL, amount DECIMAL NOT NULL, date DATE NOT NULL)',
+    'CREATE INDEX expense_user_date ON expense (user_id, date)',
+    'CREATE INDEX expense_category_date ON expense (category_id, date)',
+    'CREATE TABLE rollup (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, '
+    'category_id INTEGER NOT NULL, month DATE NOT NULL, total DECIMAL NOT NULL, count INTEGER NOT NULL, '
+    'UNIQUE (user_id, category_id, month))',
+]
+
+
+def write_worker(path, profile_name, seconds, seed):
+    """Write expenses until the deadline; return (committed, lock errors)"""
+    profile = profile_settings(profile_name)
+    timeout = int(profile['pragmas'].get('busy_timeout', 5000)) / 1000
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    apply_pragmas(connection.cursor(), profile['pragmas'])
+    begin = f"BEGIN {profile['transaction_mode'] or 'DEFERRED'}"
+    rng = random.Random(seed)
+    committed = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        user_id, category_id = rng.randint(1, 100), rng.randint(1, 12)
+        amount = rng.randint(100, 100000) / 100
+        try:
+            connection.execute(begin)
+            connection.execute(
+                'SELECT total FROM rollup WHERE user_id = ? AND category_id = ? AND month = ?',
+                (user_id, category_id, '2024-01-01'),
+            ).fetchone()
+            connection.execute(
+                'INSERT INTO expense (user_id, category_id, title, amount, date) VALUES (?, ?, ?, ?, ?)',
+                (user_id, category_id, 'Benchmark', amount, '2024-01-15'),
+            )
+            connection.execute(
+                'INSERT INTO rollup (user_id, category_id, month, total, count) VALUES (?, ?, ?, ?, 1) '
+                'ON CONFLICT (user_id, category_id, month) DO UPDATE SET total = total + excluded.total, '
+                'count = count + 1',
+                (user_id, category_id, '2024-01-01', amount),
+            )
+            connection.execute('COMMIT')
+            committed += 1
+        except sqlite3.OperationalError:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            errors += 1
+    connection.close()
+    return committed, errors
+
+
+class Command(BaseCommand):
+    help = ('Measure SQLite write throughput with concurrent worker processes '
+            'for each database profile (see expensetracker/db.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, action='append',
+            help='Concurrent writer processes (repeatable, default: 1, 4 and 8)',
+        )
+        parser.add_argument(
+            '--profile', action='append', choices=sorted(PROFILES),
+            help='Database profile to test (repeatable, default: all)',
+        )
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run (default: 5)')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or [1, 4, 8]
+        profiles = options['profile'] or sorted(PROFILES)
+        if min(workers) < 1:
+            raise CommandError('--workers must be at least 1')
+
+        self.stdout.write(f"{'profile':<10} {'workers':>7} {'writes/s':>10} {'lock errors':>12}")
+        for profile_name in profiles:
+            for count in workers:
+                committed, errors = self.run(profile_name, count, options['seconds'])
+                self.stdout.write(
+                    f"{profile_name:<10} {count:>7} {committed / options['seconds']:>10.0f} {errors:>12}"
+                )
+
+    def run(self, profile_name, workers, seconds):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            setup = sqlite3.connect(path)
+            apply_pragmas(setup.cursor(), profile_settings(profile_name)['pragmas'])
+            for statement in SCHEMA:
+                setup.execute(statement)
+            setup.commit()
+            setup.close()
+
+            with multiprocessing.get_context('spawn').Pool(workers) as pool:
+                results = pool.starmap(
+                    write_worker, [(path, profile_name, seconds, seed) for seed in range(workers)]
+                )
+        return sum(result[0] for result in results), sum(result[1] for result in results)
@@ -0,0 +1,91 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from tracker import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database at one or more scales, request every tracker URL '
+            'and report query counts, timings and peak memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', action='append', dest='scales',
+            help=f'Number of expenses, or one of {", ".join(benchmarks.SCALES)} (repeatable, default: 1k)',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Timed requests per view; the median is reported (default: 3)',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to check for regressions')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Allowed slowdown against the baseline as a fraction (default: 0.5)',
+        )
+
+    def handle(self, *args, **options):
+        scales = [self.parse_scale(scale) for scale in options['scales'] or ['1k']]
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = benchmarks.load_report(options['compare']) if options['compare'] else None
+
+        reports = []
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for index, (label, expenses) in enumerate(scales):
+                if index:
+                    call_command('flush', interactive=False, verbosity=0)
+                self.stdout.write(f'Seeding {expenses} expenses...')
+                fixture = benchmarks.seed(expenses)
+                results = benchmarks.run_cases(fixture, repeat=options['repeat'])
+                reports.append(benchmarks.build_report(label, fixture, results))
+                self.print_results(label, results)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                json.dump(reports, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        failures = []
+        for report in reports:
+            for row in benchmarks.over_budget(report['results']):
+                failures.append(f"[{report['scale']}] {row['view']}: {row['queries']} queries, budget {row['budget']}")
+            previous = next((old for old in baseline or [] if old['scale'] == report['scale']), None)
+            if previous is not None:
+                failures.extend(
+                    f"[{report['scale']}] {message}"
+                    for message in benchmarks.compare_reports(previous, report, options['tolerance'])
+                )
+        if failures:
+            raise CommandError('Performance regressions:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All views within their query budgets.'))
+
+    def parse_scale(self, value):
+        if value.lower() in benchmarks.SCALES:
+            return value.lower(), benchmarks.SCALES[value.lower()]
+        try:
+            expenses = int(value)
+        except ValueError:
+            raise CommandError(f'Unknown scale "{value}"')
+        if expenses < 1:
+            raise CommandError('--scale must be at least 1 expense')
+        return value, expenses
+
+    def print_results(self, label, results):
+        self.stdout.write(f'\n{label}:')
+        self.stdout.write(f"{'view':<34} {'status':>6} {'queries':>9} {'median ms':>10} {'peak KiB':>10}")
+        for row in results:
+            line = (f"{row['view']:<34} {row['status']:>6} {row['queries']:>4}/{row['budget']:<4} "
+                    f"{row['time_ms']:>10.1f} {row['peak_kb']:>10.1f}")
+            if row['queries'] > row['budget']:
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
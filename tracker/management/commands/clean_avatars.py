@@ -0,0 +1,54 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from tracker import avatars
+from tracker.models import UserProfile
+
+
+def _stored_files(directory):
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for subdirectory in directories:
+        yield from _stored_files(posixpath.join(directory, subdirectory))
+
+
+class Command(BaseCommand):
+    help = ('Normalize avatars uploaded before normalization existed, delete avatar files no '
+            'profile uses and trim the resized avatar cache to its size cap')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be changed',
+        )
+
+    def handle(self, *args, **options):
+        legacy = [profile for profile in UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+                  if not avatars.digest_of(profile.avatar.name)]
+        if options['dry_run']:
+            self.stdout.write(f'Would normalize {len(legacy)} legacy avatars '
+                              f'and remove {len(self.orphans())} orphaned files.')
+            return
+
+        for profile in legacy:
+            # The profile signals normalize the file and delete the original
+            profile.save(update_fields=['avatar', 'updated_at'])
+        orphans = self.orphans()
+        for name in orphans:
+            avatars.purge(name)
+        trimmed = avatars.trim_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f'Normalized {len(legacy)} legacy avatars, removed {len(orphans)} orphaned files '
+            f'and evicted {trimmed} resized avatars from the cache.'
+        ))
+
+    def orphans(self):
+        """Stored avatar files no profile uses"""
+        directory = avatars.AVATAR_DIR.rstrip('/')
+        if not default_storage.exists(directory):
+            return []
+        used = set(UserProfile.objects.exclude(avatar='').values_list('avatar', flat=True))
+        return [name for name in _stored_files(directory) if name not in used]
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from tracker import benchmarks, query_plans
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database, request every tracker URL and run EXPLAIN QUERY PLAN '
+            'on the SELECTs each view issues, flagging full scans of tracker tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', default='1k',
+            help=f'Number of expenses, or one of {", ".join(benchmarks.SCALES)} (default: 1k)',
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Print the plan of every distinct query, not only the flagged ones',
+        )
+
+    def handle(self, *args, **options):
+        expenses = benchmarks.SCALES.get(options['scale'].lower())
+        if expenses is None:
+            try:
+                expenses = int(options['scale'])
+            except ValueError:
+                raise CommandError(f'Unknown scale "{options["scale"]}"')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans are only checked on SQLite')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f'Seeding {expenses} expenses...')
+            fixture = benchmarks.seed(expenses)
+            tables = query_plans.tracker_tables()
+            flagged = 0
+            seen = set()
+            for label, sql in query_plans.capture_queries(fixture):
+                plan = query_plans.explain(sql)
+                scans = query_plans.full_scans(plan, tables)
+                if (label, tuple(plan)) in seen or not (scans or options['plans']):
+                    continue
+                seen.add((label, tuple(plan)))
+                flagged += bool(scans)
+                self.stdout.write(self.style.ERROR(f'{label}: full scan') if scans else f'{label}:')
+                self.stdout.write(f'  {sql}')
+                for step in plan:
+                    self.stdout.write(f'    {step}')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if flagged:
+            raise CommandError(f'{flagged} view queries scan a whole table')
+        self.stdout.write(self.style.SUCCESS('Every view query searches an index.'))
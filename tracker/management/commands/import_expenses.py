@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.importers import DEFAULT_BATCH_SIZE, PARSERS, ExpenseImporter, detect_format
+from tracker.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Import expenses for a user from a CSV or OFX bank statement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file to import')
+        parser.add_argument('--user', required=True, help='Username that owns the imported expenses')
+        parser.add_argument(
+            '--format', choices=sorted(PARSERS), dest='file_format',
+            help='Statement format (default: detect from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help=f'Rows written per bulk insert (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument('--default-category', help='Category for rows without one')
+        parser.add_argument(
+            '--no-create-categories', action='store_false', dest='create_categories',
+            help='Reject rows whose category does not exist instead of creating it',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['user']}")
+
+        default_category = None
+        if options['default_category']:
+            try:
+                default_category = Category.objects.get(name__iexact=options['default_category'])
+            except Category.DoesNotExist:
+                raise CommandError(f"Unknown category: {options['default_category']}")
+
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        importer = ExpenseImporter(
+            user,
+            batch_size=options['batch_size'],
+            default_category=default_category,
+            create_categories=options['create_categories'],
+        )
+        file_format = options['file_format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as statement:
+                result = importer.import_file(statement, file_format)
+        except OSError as error:
+            raise CommandError(str(error))
+
+        for line, message in result.errors:
+            self.stderr.write(f'Row {line}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} expenses ({result.skipped} skipped, '
+            f'{result.error_count} errors, {result.categories_created} new categories).'
+        ))
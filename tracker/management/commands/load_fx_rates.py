@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import fx, tasks
+
+
+class Command(BaseCommand):
+    help = ('Load exchange rates from CSV files with date, currency and rate columns (the value of '
+            'one unit in TRACKER_FX_BASE_CURRENCY) and rebuild the rollups of users they affect')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', metavar='path', help='CSV file of rates')
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Do not queue a rollup rebuild for users with transactions in other currencies',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for path in options['paths']:
+            try:
+                with open(path, 'rb') as rates:
+                    loaded, errors = fx.load_csv(rates)
+            except OSError as error:
+                raise CommandError(str(error))
+            for line, message in errors:
+                self.stderr.write(f'{path}, row {line}: {message}')
+            self.stdout.write(f'{path}: {loaded} rates loaded, {len(errors)} rows rejected')
+            total += loaded
+        if not total:
+            return
+        fx.rates_changed()
+
+        user_ids = [] if options['no_rebuild'] else fx.users_with_foreign_transactions()
+        if user_ids:
+            # Runs once every process has reloaded its rates
+            task = tasks.enqueue('rebuild_rollups', params={'user_ids': user_ids}, delay=fx.REBUILD_DELAY)
+            self.stdout.write(f'Queued task {task.pk} to rebuild the rollups of {len(user_ids)} users.')
+        self.stdout.write(self.style.SUCCESS(f'{total} rates loaded.'))
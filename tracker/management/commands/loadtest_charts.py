@@ -0,0 +1,157 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import count
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from tracker import benchmarks
+
+# The three requests the dashboard fires at once
+CHART_URLS = [
+    '/api/expense-chart-data/',
+    '/api/category-chart-data/',
+    '/api/monthly-trend-data/',
+]
+
+SERVERS = ['asgi', 'wsgi']
+
+
+async def fetch(port, path, cookie):
+    """GET ``path`` over a fresh connection and return the status code"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+        f'Cookie: {settings.SESSION_COOKIE_NAME}={cookie}\r\nConnection: close\r\n\r\n'
+    ).encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(response.split(b' ', 2)[1])
+
+
+async def load(port, cookie, users, seconds, cached):
+    """Run ``users`` virtual dashboards for ``seconds``; return page latencies and error count"""
+    latencies = []
+    errors = 0
+    counter = count()
+    deadline = time.monotonic() + seconds
+
+    async def dashboard():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            # A distinct query string skips the per-user response cache
+            suffix = '' if cached else f'?_={next(counter)}'
+            start = time.perf_counter()
+            statuses = await asyncio.gather(*(fetch(port, url + suffix, cookie) for url in CHART_URLS))
+            latencies.append(time.perf_counter() - start)
+            errors += sum(status != 200 for status in statuses)
+
+    await asyncio.gather(*(dashboard() for _ in range(users)))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database, then load test the three chart endpoints '
+            'under uvicorn (ASGI) and the threaded WSGI server, reporting requests per second')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=10000, help='Expenses to seed (default: 10000)')
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Concurrent virtual users, each loading the three charts at once (default: 20)',
+        )
+        parser.add_argument('--seconds', type=float, default=10, help='Duration per server (default: 10)')
+        parser.add_argument(
+            '--server', action='append', dest='servers', choices=SERVERS,
+            help='Server to test (repeatable, default: both)',
+        )
+        parser.add_argument('--port', type=int, default=8765, help='Port for the server under test (default: 8765)')
+        parser.add_argument(
+            '--cached', action='store_true',
+            help='Let repeated requests hit the response cache instead of the database',
+        )
+
+    def handle(self, *args, **options):
+        servers = options['servers'] or SERVERS
+        if 'asgi' in servers and importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('The ASGI run needs uvicorn: pip install uvicorn')
+        if options['users'] < 1 or options['expenses'] < 1:
+            raise CommandError('--users and --expenses must be at least 1')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'loadtest.sqlite3')
+            cookie = self.seed(path, options['expenses'])
+            self.stdout.write(f"{'server':<8} {'requests/s':>11} {'pages/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+            for server in servers:
+                latencies, errors = self.run(server, path, cookie, options)
+                pages = len(latencies)
+                ordered = sorted(latencies) or [0.0]
+                self.stdout.write(
+                    f"{server:<8} {pages * len(CHART_URLS) / options['seconds']:>11.1f} "
+                    f"{pages / options['seconds']:>9.1f} {statistics.median(ordered) * 1000:>8.1f} "
+                    f"{ordered[int(0.95 * (len(ordered) - 1))] * 1000:>8.1f} {errors:>7}"
+                )
+
+    def seed(self, path, expenses):
+        """Create and seed the database file, returning a logged-in session id"""
+        self.stdout.write(f'Seeding {expenses} expenses...')
+        connection.settings_dict['TEST']['NAME'] = path
+        setup_test_environment()
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            fixture = benchmarks.seed(expenses)
+            client = Client()
+            client.force_login(fixture.user)
+            return client.cookies[settings.SESSION_COOKIE_NAME].value
+        finally:
+            connection.close()
+            teardown_test_environment()
+
+    def run(self, server, path, cookie, options):
+        port = options['port']
+        env = {**os.environ, 'DB_PATH': path, 'DJANGO_SETTINGS_MODULE': 'expensetracker.settings'}
+        env.pop('DB_REPLICA_PATH', None)
+        env.pop('TRACKER_PROFILING', None)
+        if server == 'asgi':
+            command = [
+                sys.executable, '-m', 'uvicorn', 'expensetracker.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', '--no-access-log',
+            ]
+        else:
+            command = [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver',
+                f'127.0.0.1:{port}', '--noreload', '--skip-checks',
+            ]
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            self.wait_until_listening(process, port)
+            return asyncio.run(load(port, cookie, options['users'], options['seconds'], options['cached']))
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait_until_listening(self, process, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with status {process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Server did not start listening on port {port}')
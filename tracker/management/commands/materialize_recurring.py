@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.models import Expense, Income
+from tracker.recurring import DEFAULT_USER_BATCH_SIZE, materialize
+
+
+class Command(BaseCommand):
+    help = 'Generate the missing occurrences of recurring expenses and income (run daily from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--until', help='Generate occurrences up to this date, YYYY-MM-DD (default: today)',
+        )
+        parser.add_argument(
+            '--user-batch-size', type=int, default=DEFAULT_USER_BATCH_SIZE,
+            help=f'Users processed per transaction (default: {DEFAULT_USER_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Count what would be generated without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            try:
+                until = date.fromisoformat(options['until'])
+            except ValueError:
+                raise CommandError('--until must be a date in YYYY-MM-DD format')
+        if options['user_batch_size'] < 1:
+            raise CommandError('--user-batch-size must be at least 1')
+
+        result = materialize(
+            until=until,
+            user_batch_size=options['user_batch_size'],
+            dry_run=options['dry_run'],
+        )
+
+        prefix = 'Would generate' if options['dry_run'] else 'Generated'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {result.created[Expense]} expenses and {result.created[Income]} incomes "
+            f"from {result.templates} templates for {result.users} users."
+        ))
+        if result.failed_batches:
+            self.stderr.write(f'{result.failed_batches} batches skipped after conflicting writes.')
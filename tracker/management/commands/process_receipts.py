@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import images, receipts
+from tracker.models import Expense
+
+
+class Command(BaseCommand):
+    help = ('Process receipt images that have not been processed yet (uploads from before '
+            'the receipt pipeline, or ones whose task failed), encoding them in a process pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help='Encoder processes (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--limit', type=int,
+            help='Process at most this many receipts',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        pending = Expense.objects.exclude(receipt_image='').exclude(receipt_image__isnull=True).exclude(
+            receipt_image__startswith=receipts.PROCESSED_DIR
+        ).order_by('pk').values_list('pk', 'receipt_image')
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        self.counts = {'processed': 0, 'deduplicated': 0, 'missing': 0, 'failed': 0}
+        encode_options = receipts.encode_options()
+        # Reading files, hashing and database writes stay in this process;
+        # only the decode/resize/encode work goes to the pool
+        with ProcessPoolExecutor(max_workers=options['processes']) as pool:
+            running = {}
+            for pk, name in pending.iterator():
+                try:
+                    with default_storage.open(name, 'rb') as upload:
+                        data = upload.read()
+                except FileNotFoundError:
+                    self.stderr.write(f'Expense {pk}: {name} is missing')
+                    self.counts['missing'] += 1
+                    continue
+                content_digest = receipts.digest(data)
+                processed = receipts.find_processed(content_digest)
+                if processed is not None:
+                    receipts.attach(pk, name, processed)
+                    self.counts['deduplicated'] += 1
+                    continue
+                future = pool.submit(images.encode_receipt, data, **encode_options)
+                running[future] = (pk, name, content_digest)
+                # Keep a bounded number of images in memory
+                if len(running) >= options['processes'] * 2:
+                    self.collect(running, FIRST_COMPLETED)
+            self.collect(running)
+
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {label}' for label, count in self.counts.items())
+        ))
+
+    def collect(self, running, return_when='ALL_COMPLETED'):
+        done, _ = wait(running, return_when=return_when)
+        for future in done:
+            pk, name, content_digest = running.pop(future)
+            try:
+                encoded = future.result()
+            except Exception as error:
+                self.stderr.write(f'Expense {pk}: could not process {name}: {error}')
+                self.counts['failed'] += 1
+                continue
+            # Two uploads of the same photo may have been encoded at once
+            processed = receipts.find_processed(content_digest) or receipts.store(content_digest, encoded)
+            receipts.attach(pk, name, processed)
+            self.counts['processed'] += 1
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import anomalies, budget_alerts, cache, rollups, tasks
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the monthly and daily expense and income rollups and the expense category '
+            'statistics (see tracker/anomalies.py) from the transaction tables, and reset the '
+            'budget spend counters')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', metavar='USERNAME',
+            help='Only rebuild rollups for this user (can be repeated)',
+        )
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Queue the rebuild for the run_tasks worker instead of running it now',
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = list(User.objects.filter(username__in=options['usernames']))
+            missing = set(options['usernames']) - {user.username for user in users}
+            if missing:
+                raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+
+        if options['background']:
+            params = {'user_ids': [user.pk for user in users]} if users else {}
+            task = tasks.enqueue('rebuild_rollups', params=params)
+            self.stdout.write(self.style.SUCCESS(f'Queued task {task.pk}.'))
+            return
+
+        counts = rollups.rebuild_all(users)
+        counts['ExpenseCategoryStats'] = anomalies.rebuild(users)
+        budget_alerts.forget_users(users)
+        for owner in [user.pk for user in users] if users is not None else [cache.GLOBAL]:
+            cache.bump(owner)
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: {count} rows')
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tracker.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the expense full-text search index from the expense table'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{type(backend).__name__}: indexed {count} expenses.'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from tracker import budget_alerts
+
+
+class Command(BaseCommand):
+    help = ('Re-aggregate the current period of every active budget, correct drifted spend '
+            'counters, queue missed alerts and email pending ones (run nightly)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-send', action='store_true',
+            help='Leave pending alerts for the send_budget_alerts task instead of emailing them now',
+        )
+
+    def handle(self, *args, **options):
+        checked, corrected, queued = budget_alerts.reconcile()
+        self.stdout.write(f'{checked} budgets checked, {corrected} counters corrected, {queued} alerts queued')
+        if not options['no_send']:
+            messages, alerts = budget_alerts.send_pending()
+            self.stdout.write(f'Sent {messages} emails covering {alerts} alerts')
+        self.stdout.write(self.style.SUCCESS('Budgets reconciled.'))
@@ -0,0 +1,68 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker import tasks
+
+
+class Command(BaseCommand):
+    help = ('Run queued background tasks (exports, imports, PDF reports, rollup rebuilds). '
+            'SIGTERM or Ctrl-C stops after the current task.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Worker processes to run (default: 1)',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no task is due instead of waiting for new ones',
+        )
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='Seconds between checks of an empty queue (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        if options['processes'] > 1:
+            return self.supervise(options)
+
+        # Finish the current task before exiting, so it is not left running
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Worker {worker} started')
+        processed = tasks.work(
+            worker, once=options['once'], poll=options['poll'], should_stop=lambda: self.stopping
+        )
+        self.stdout.write(f'Worker {worker} ran {processed} tasks')
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def supervise(self, options):
+        """Start single-process workers and wait for them, forwarding SIGTERM"""
+        command = [sys.executable, sys.argv[0], 'run_tasks', '--poll', str(options['poll'])]
+        if options['once']:
+            command.append('--once')
+        children = [subprocess.Popen(command) for _ in range(options['processes'])]
+
+        def forward(signum, frame):
+            for child in children:
+                child.send_signal(signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, forward)
+        # Ctrl-C reaches the children directly through the terminal
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for child in children:
+            child.wait()
+        failed = [child.returncode for child in children if child.returncode != 0]
+        if failed:
+            raise CommandError(f'{len(failed)} worker(s) exited with an error')
@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.replicas import replica_aliases
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database onto the configured replica files, '
+            'once or every --interval seconds (local stand-in for replication)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep copying with this many seconds between copies (the simulated replica lag)',
+        )
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas configured; set DB_REPLICA_PATH')
+        primary = settings.DATABASES['default']
+        for alias in ['default', *aliases]:
+            if settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'sync_replica only copies SQLite databases, "{alias}" is not one')
+
+        while True:
+            for alias in aliases:
+                start = time.perf_counter()
+                self.copy(primary['NAME'], settings.DATABASES[alias]['NAME'])
+                self.stdout.write(f'Copied default to {alias} in {(time.perf_counter() - start) * 1000:.0f} ms')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source_path, target_path):
+        # The backup API takes a consistent snapshot while the primary stays writable
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
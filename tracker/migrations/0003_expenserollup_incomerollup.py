@@ -0,0 +1,71 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:26
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    for model_name, rollup_name, group_field in [
+        ('Expense', 'ExpenseRollup', 'category_id'),
+        ('Income', 'IncomeRollup', 'source'),
+    ]:
+        model = apps.get_model('tracker', model_name)
+        rollup_model = apps.get_model('tracker', rollup_name)
+        grouped = model.objects.annotate(
+            month=TruncMonth('date')
+        ).values('user_id', group_field, 'month').annotate(
+            total=Sum('amount'),
+            count=Count('id')
+        ).order_by()
+        rollup_model.objects.bulk_create(
+            (rollup_model(**row) for row in grouped.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0002_category_income_userprofile_alter_expense_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='tracker.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-month'],
+                'indexes': [models.Index(fields=['user', 'month'], name='tracker_exp_user_id_0b0ab0_idx')],
+                'unique_together': {('user', 'category', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='IncomeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('salary', 'Salary'), ('freelance', 'Freelance'), ('business', 'Business'), ('investment', 'Investment'), ('gift', 'Gift'), ('bonus', 'Bonus'), ('other', 'Other')], max_length=20)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='income_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-month'],
+                'indexes': [models.Index(fields=['user', 'month'], name='tracker_inc_user_id_b39d3b_idx')],
+                'unique_together': {('user', 'source', 'month')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
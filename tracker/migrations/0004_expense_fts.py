@@ -0,0 +1,48 @@
+from django.db import migrations
+
+FTS_TABLE = 'tracker_expense_fts'
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def create_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if not fts5_available(connection):
+        # Other databases use the icontains fallback or their own backend
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"owner, title, description, tags, location, category, "
+            f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, owner, title, description, tags, location, category) "
+            f"SELECT e.id, 'u' || e.user_id, e.title, COALESCE(e.description, ''), e.tags, "
+            f"COALESCE(e.location, ''), c.name "
+            f"FROM tracker_expense e JOIN tracker_category c ON c.id = e.category_id"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_expenserollup_incomerollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 02:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0004_expense_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='recurring_last_date',
+            field=models.DateField(blank=True, help_text='Date of the last generated occurrence', null=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='recurring_source',
+            field=models.ForeignKey(blank=True, help_text='Recurring expense this entry was generated from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='tracker.expense'),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='recurring_last_date',
+            field=models.DateField(blank=True, help_text='Date of the last generated occurrence', null=True),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='recurring_source',
+            field=models.ForeignKey(blank=True, help_text='Recurring income this entry was generated from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='tracker.income'),
+        ),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(fields=('recurring_source', 'date'), name='unique_expense_occurrence'),
+        ),
+        migrations.AddConstraint(
+            model_name='income',
+            constraint=models.UniqueConstraint(fields=('recurring_source', 'date'), name='unique_income_occurrence'),
+        ),
+    ]
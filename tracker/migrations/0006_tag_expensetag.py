@@ -0,0 +1,113 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:10
+
+import django.db.models.deletion
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def parse_tags(value):
+    names = []
+    for part in (value or '').split(','):
+        name = ' '.join(part.split()).lower()[:50].strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def split_tag_strings(apps, schema_editor):
+    """Turn the comma-separated Expense.tags strings into Tag/ExpenseTag rows"""
+    Expense = apps.get_model('tracker', 'Expense')
+    Tag = apps.get_model('tracker', 'Tag')
+    ExpenseTag = apps.get_model('tracker', 'ExpenseTag')
+    db_alias = schema_editor.connection.alias
+
+    rows = Expense.objects.using(db_alias).exclude(tags='').values_list(
+        'pk', 'user_id', 'tags'
+    ).order_by('pk').iterator(chunk_size=BATCH_SIZE)
+    while True:
+        chunk = list(islice(rows, BATCH_SIZE))
+        if not chunk:
+            break
+        names_by_user = defaultdict(set)
+        for _, user_id, tags in chunk:
+            names_by_user[user_id].update(parse_tags(tags))
+        tag_ids = {}
+        for user_id, names in names_by_user.items():
+            Tag.objects.using(db_alias).bulk_create(
+                [Tag(user_id=user_id, name=name) for name in names], ignore_conflicts=True
+            )
+            for pk, name in Tag.objects.using(db_alias).filter(
+                    user_id=user_id, name__in=names).values_list('pk', 'name'):
+                tag_ids[user_id, name] = pk
+        ExpenseTag.objects.using(db_alias).bulk_create(
+            [ExpenseTag(expense_id=pk, tag_id=tag_ids[user_id, name])
+             for pk, user_id, tags in chunk for name in parse_tags(tags)],
+            ignore_conflicts=True,
+        )
+
+
+def join_tag_strings(apps, schema_editor):
+    """Write tags back as comma-separated strings"""
+    Expense = apps.get_model('tracker', 'Expense')
+    ExpenseTag = apps.get_model('tracker', 'ExpenseTag')
+    db_alias = schema_editor.connection.alias
+
+    names = defaultdict(list)
+    links = ExpenseTag.objects.using(db_alias).values_list('expense_id', 'tag__name').order_by(
+        'expense_id', 'tag__name'
+    )
+    for expense_id, name in links.iterator(chunk_size=BATCH_SIZE):
+        names[expense_id].append(name)
+    expenses = [Expense(pk=pk, tags=', '.join(tags)[:200]) for pk, tags in names.items()]
+    Expense.objects.using(db_alias).bulk_update(expenses, ['tags'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_recurring_occurrences'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_per_user')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_tags', to='tracker.expense')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_tags', to='tracker.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', 'expense'], name='tracker_exp_tag_id_40c90a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('expense', 'tag'), name='unique_expense_tag')],
+            },
+        ),
+        migrations.RunPython(split_tag_strings, join_tag_strings),
+        migrations.RemoveField(
+            model_name='expense',
+            name='tags',
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='expenses', through='tracker.ExpenseTag', to='tracker.tag'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0007_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='receipt_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='receipt_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='receipt_image',
+            field=models.ImageField(blank=True, help_text='Processed in the background, see tracker/receipts.py', null=True, upload_to='receipts/uploads/'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:12
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def populate_daily_rollups(apps, schema_editor):
+    for model_name, rollup_name, group_field in [
+        ('Expense', 'ExpenseDailyRollup', 'category_id'),
+        ('Income', 'IncomeDailyRollup', 'source'),
+    ]:
+        model = apps.get_model('tracker', model_name)
+        rollup_model = apps.get_model('tracker', rollup_name)
+        grouped = model.objects.values('user_id', group_field, day=F('date')).annotate(
+            total=Sum('amount'),
+            count=Count('id')
+        ).order_by()
+        rollup_model.objects.bulk_create(
+            (rollup_model(**row) for row in grouped.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_receipt_processing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='tracker.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['user', 'day'], name='tracker_exp_user_id_017c2d_idx')],
+                'unique_together': {('user', 'category', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='IncomeDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('salary', 'Salary'), ('freelance', 'Freelance'), ('business', 'Business'), ('investment', 'Investment'), ('gift', 'Gift'), ('bonus', 'Bonus'), ('other', 'Other')], max_length=20)),
+                ('day', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='income_daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['user', 'day'], name='tracker_inc_user_id_fb1b24_idx')],
+                'unique_together': {('user', 'source', 'day')},
+            },
+        ),
+        migrations.RunPython(populate_daily_rollups, migrations.RunPython.noop),
+    ]
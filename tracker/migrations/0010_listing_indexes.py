@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_daily_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='tracker_exp_user_id_bcd9ed_idx',
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'date', 'created_at'], name='tracker_exp_user_id_3bce64_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'amount'], name='tracker_exp_user_id_cd01f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'payment_method', 'amount'], name='tracker_exp_user_id_6d002d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['user', 'date', 'created_at'], name='tracker_inc_user_id_af55ec_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, Variance
+from django.db.models.functions import Cast
+
+
+def populate_category_stats(apps, schema_editor):
+    Expense = apps.get_model('tracker', 'Expense')
+    ExpenseCategoryStats = apps.get_model('tracker', 'ExpenseCategoryStats')
+    amount = Cast('amount', FloatField())
+    grouped = Expense.objects.values('user_id', 'category_id').annotate(
+        count=Count('id'), mean=Avg(amount), variance=Variance(amount),
+    ).order_by()
+    ExpenseCategoryStats.objects.bulk_create(
+        (ExpenseCategoryStats(m2=row.pop('variance') * row['count'], **row) for row in grouped.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0, help_text='Sum of squared deviations from the mean')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, editable=False, help_text='Standard deviations above the category mean when saved, set for outliers only; see tracker/anomalies.py', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('anomaly_score__isnull', False)), fields=['user', 'date'], name='tracker_expense_anomaly_idx'),
+        ),
+        migrations.AddField(
+            model_name='expensecategorystats',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_stats', to='tracker.category'),
+        ),
+        migrations.AddField(
+            model_name='expensecategorystats',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_category_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='expensecategorystats',
+            unique_together={('user', 'category')},
+        ),
+        migrations.RunPython(populate_category_stats, migrations.RunPython.noop),
+    ]
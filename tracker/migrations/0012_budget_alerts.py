@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:24
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_expense_anomalies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('threshold', models.PositiveSmallIntegerField(help_text='Percent of the budget')),
+                ('spent', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('budget_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('emailed', models.BooleanField(default=False, help_text='False when the user has alerts turned off')),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='tracker.budget')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['created_at'], name='tracker_alert_pending_idx')],
+                'unique_together': {('budget', 'period_start', 'threshold')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetPeriodSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField(help_text='First day after the period')),
+                ('spent', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('alerted_threshold', models.PositiveSmallIntegerField(default=0, help_text='Highest alert threshold (percent) queued so far')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_spends', to='tracker.budget')),
+            ],
+            options={
+                'unique_together': {('budget', 'period_start')},
+            },
+        ),
+    ]
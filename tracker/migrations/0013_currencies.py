@@ -0,0 +1,52 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:29
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def use_profile_currency(apps, schema_editor):
+    # Amounts entered so far were in the owner's home currency
+    UserProfile = apps.get_model('tracker', 'UserProfile')
+    for model_name in ['Expense', 'Income']:
+        model = apps.get_model('tracker', model_name)
+        currency = UserProfile.objects.filter(user_id=OuterRef('user_id')).values('currency')[:1]
+        model.objects.filter(user__profile__isnull=False).update(currency=Subquery(currency))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_budget_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc'), ('CNY', 'Chinese Yuan'), ('SGD', 'Singapore Dollar')], default='INR', help_text='Totals are converted to the home currency, see tracker/fx.py', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc'), ('CNY', 'Chinese Yuan'), ('SGD', 'Singapore Dollar')], default='INR', help_text='Totals are converted to the home currency, see tracker/fx.py', max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='currency',
+            field=models.CharField(choices=[('INR', 'Indian Rupee'), ('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('JPY', 'Japanese Yen'), ('AED', 'UAE Dirham'), ('AUD', 'Australian Dollar'), ('CAD', 'Canadian Dollar'), ('CHF', 'Swiss Franc'), ('CNY', 'Chinese Yuan'), ('SGD', 'Singapore Dollar')], default='INR', help_text='Home currency: budgets and totals are in this currency', max_length=3),
+        ),
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+            ],
+            options={
+                'ordering': ['currency', '-date'],
+                'unique_together': {('currency', 'date')},
+            },
+        ),
+        migrations.RunPython(use_profile_currency, migrations.RunPython.noop),
+    ]
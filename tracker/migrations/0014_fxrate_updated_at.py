@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0013_currencies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fxrate',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
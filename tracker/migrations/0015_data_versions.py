@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0014_fxrate_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=32, unique=True)),
+                ('version', models.BigIntegerField()),
+                ('modified', models.FloatField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0015_data_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(condition=models.Q(('is_recurring', True), ('recurring_source__isnull', True)), fields=['user'], name='tracker_expense_template_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(condition=models.Q(('is_recurring', True), ('recurring_source__isnull', True)), fields=['user'], name='tracker_income_template_idx'),
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.core.validators import MinValueValidator
 from django.utils import timezone
 from decimal import Decimal
 
+from .money import CURRENCIES, DEFAULT_CURRENCY, format_amount, user_currency
+
 class Category(models.Model):
     """Category model for organizing expenses"""
     name = models.CharField(max_length=50, unique=True)
@@ -19,6 +21,21 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class Tag(models.Model):
+    """Per-user tag attached to expenses"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_tag_per_user'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
 class Budget(models.Model):
     """Budget model for setting spending limits"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets')
@@ -40,7 +57,8 @@ class Budget(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.user.username} - {self.category.name} - ₹{self.amount}/{self.period_type}"
+        amount = format_amount(self.amount, user_currency(self.user))
+        return f"{self.user.username} - {self.category.name} - {amount}/{self.period_type}"
 
 class Expense(models.Model):
     """Enhanced Expense model with more features"""
@@ -58,10 +76,15 @@ class Expense(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    currency = models.CharField(max_length=3, choices=CURRENCIES, default=DEFAULT_CURRENCY,
+                                help_text='Totals are converted to the home currency, see tracker/fx.py')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='expenses')
     date = models.DateField(default=timezone.now)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='cash')
-    receipt_image = models.ImageField(upload_to='receipts/', blank=True, null=True)
+    receipt_image = models.ImageField(upload_to='receipts/uploads/', blank=True, null=True,
+                                      help_text='Processed in the background, see tracker/receipts.py')
+    receipt_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    receipt_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
     is_recurring = models.BooleanField(default=False)
     recurring_period = models.CharField(max_length=20, choices=[
         ('daily', 'Daily'),
@@ -69,7 +92,15 @@ class Expense(models.Model):
         ('monthly', 'Monthly'),
         ('yearly', 'Yearly'),
     ], blank=True, null=True)
-    tags = models.CharField(max_length=200, blank=True, help_text='Comma-separated tags')
+    recurring_source = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True,
+                                         related_name='occurrences',
+                                         help_text='Recurring expense this entry was generated from')
+    recurring_last_date = models.DateField(blank=True, null=True,
+                                           help_text='Date of the last generated occurrence')
+    anomaly_score = models.FloatField(blank=True, null=True, editable=False,
+                                      help_text='Standard deviations above the category mean when saved, '
+                                                'set for outliers only; see tracker/anomalies.py')
+    tags = models.ManyToManyField(Tag, through='ExpenseTag', related_name='expenses', blank=True)
     location = models.CharField(max_length=200, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -77,18 +108,46 @@ class Expense(models.Model):
     class Meta:
         ordering = ['-date', '-created_at']
         indexes = [
-            models.Index(fields=['user', 'date']),
+            # Listings and date ranges; read backwards it yields the
+            # (-date, -created_at, -id) order without sorting
+            models.Index(fields=['user', 'date', 'created_at']),
             models.Index(fields=['category', 'date']),
+            # Top expenses by amount and the payment method breakdown
+            models.Index(fields=['user', 'amount']),
+            models.Index(fields=['user', 'payment_method', 'amount']),
+            # Flagged expenses only, for the dashboard's unusual expenses
+            models.Index(fields=['user', 'date'], condition=models.Q(anomaly_score__isnull=False),
+                         name='tracker_expense_anomaly_idx'),
+            # Recurring templates only, for materialization runs; see tracker/recurring.py
+            models.Index(fields=['user'], condition=models.Q(is_recurring=True, recurring_source__isnull=True),
+                         name='tracker_expense_template_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recurring_source', 'date'], name='unique_expense_occurrence'),
         ]
     
     def __str__(self):
-        return f"{self.title} - ₹{self.amount}"
+        return f"{self.title} - {format_amount(self.amount, self.currency)}"
     
     def get_tags_list(self):
-        """Return tags as a list"""
-        if self.tags:
-            return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
-        return []
+        """Return tag names as a list (uses prefetched tags when available)"""
+        return [tag.name for tag in self.tags.all()]
+
+class ExpenseTag(models.Model):
+    """Link between an expense and one of its tags"""
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='expense_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='expense_tags')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['expense', 'tag'], name='unique_expense_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'expense']),
+        ]
+    
+    def __str__(self):
+        return f"{self.expense_id} - {self.tag_id}"
 
 class Income(models.Model):
     """Income model to track earnings"""
@@ -106,6 +165,8 @@ class Income(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    currency = models.CharField(max_length=3, choices=CURRENCIES, default=DEFAULT_CURRENCY,
+                                help_text='Totals are converted to the home currency, see tracker/fx.py')
     source = models.CharField(max_length=20, choices=INCOME_SOURCES, default='salary')
     date = models.DateField(default=timezone.now)
     is_recurring = models.BooleanField(default=False)
@@ -115,14 +176,28 @@ class Income(models.Model):
         ('monthly', 'Monthly'),
         ('yearly', 'Yearly'),
     ], blank=True, null=True)
+    recurring_source = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True,
+                                         related_name='occurrences',
+                                         help_text='Recurring income this entry was generated from')
+    recurring_last_date = models.DateField(blank=True, null=True,
+                                           help_text='Date of the last generated occurrence')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            models.Index(fields=['user', 'date', 'created_at']),
+            # Recurring templates only, for materialization runs; see tracker/recurring.py
+            models.Index(fields=['user'], condition=models.Q(is_recurring=True, recurring_source__isnull=True),
+                         name='tracker_income_template_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recurring_source', 'date'], name='unique_income_occurrence'),
+        ]
     
     def __str__(self):
-        return f"{self.title} - ₹{self.amount}"
+        return f"{self.title} - {format_amount(self.amount, self.currency)}"
 
 class UserProfile(models.Model):
     """Extended user profile"""
@@ -130,7 +205,8 @@ class UserProfile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     phone = models.CharField(max_length=15, blank=True, null=True)
     date_of_birth = models.DateField(blank=True, null=True)
-    currency = models.CharField(max_length=3, default='INR')
+    currency = models.CharField(max_length=3, choices=CURRENCIES, default=DEFAULT_CURRENCY,
+                                help_text='Home currency: budgets and totals are in this currency')
     monthly_budget = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
     timezone = models.CharField(max_length=50, default='Asia/Kolkata')
     email_notifications = models.BooleanField(default=True)
@@ -139,4 +215,202 @@ class UserProfile(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"{self.user.username}'s Profile"
\ No newline at end of file
+        return f"{self.user.username}'s Profile"
+
+class ExpenseRollup(models.Model):
+    """Running monthly expense totals per user and category"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='rollups')
+    month = models.DateField(help_text='First day of the month')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'category', 'month']
+        ordering = ['-month']
+        indexes = [
+            models.Index(fields=['user', 'month']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.category.name} - {self.month:%b %Y}"
+
+class IncomeRollup(models.Model):
+    """Running monthly income totals per user and source"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='income_rollups')
+    source = models.CharField(max_length=20, choices=Income.INCOME_SOURCES)
+    month = models.DateField(help_text='First day of the month')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'source', 'month']
+        ordering = ['-month']
+        indexes = [
+            models.Index(fields=['user', 'month']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.get_source_display()} - {self.month:%b %Y}"
+
+class ExpenseDailyRollup(models.Model):
+    """Running daily expense totals per user and category, for the partial months of a range"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_daily_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'category', 'day']
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['user', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.category.name} - {self.day}"
+
+class IncomeDailyRollup(models.Model):
+    """Running daily income totals per user and source, for the partial months of a range"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='income_daily_rollups')
+    source = models.CharField(max_length=20, choices=Income.INCOME_SOURCES)
+    day = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'source', 'day']
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['user', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.get_source_display()} - {self.day}"
+
+class ExpenseCategoryStats(models.Model):
+    """Running count, mean and sum of squared deviations of expense amounts per user and category"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_category_stats')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='expense_stats')
+    count = models.IntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0, help_text='Sum of squared deviations from the mean')
+    
+    class Meta:
+        unique_together = ['user', 'category']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.category.name}"
+
+class BudgetPeriodSpend(models.Model):
+    """Running amount spent against a budget in one of its periods, see tracker/budget_alerts.py"""
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name='period_spends')
+    period_start = models.DateField()
+    period_end = models.DateField(help_text='First day after the period')
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    alerted_threshold = models.PositiveSmallIntegerField(default=0,
+                                                         help_text='Highest alert threshold (percent) queued so far')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['budget', 'period_start']
+    
+    def __str__(self):
+        return f"{self.budget} - {self.period_start}"
+
+class BudgetAlert(models.Model):
+    """A budget threshold reached in one period, emailed by the send_budget_alerts task"""
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name='alerts')
+    period_start = models.DateField()
+    threshold = models.PositiveSmallIntegerField(help_text='Percent of the budget')
+    spent = models.DecimalField(max_digits=14, decimal_places=2)
+    budget_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    emailed = models.BooleanField(default=False, help_text='False when the user has alerts turned off')
+    
+    class Meta:
+        unique_together = ['budget', 'period_start', 'threshold']
+        indexes = [
+            # Alerts still waiting to be sent
+            models.Index(fields=['created_at'], condition=models.Q(sent_at__isnull=True),
+                         name='tracker_alert_pending_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.budget} - {self.threshold}% of {self.period_start:%d %b %Y}"
+
+class FxRate(models.Model):
+    """Value of one unit of a currency in the base currency on one day, see tracker/fx.py"""
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    # With the row count, tells processes their in-memory rates are stale
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        # Also the index the conversion subqueries search
+        unique_together = ['currency', 'date']
+        ordering = ['currency', '-date']
+    
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
+
+def task_result_path(instance, filename):
+    """Results live under MEDIA_ROOT/tasks/<user id>/<task id>/"""
+    return f'tasks/{instance.user_id or "system"}/{instance.pk}/{filename}'
+
+class DataVersion(models.Model):
+    """Version of a user's (or everyone's) cached data, shared by every process; see tracker/cache.py"""
+    owner = models.CharField(max_length=32, unique=True)
+    version = models.BigIntegerField()
+    modified = models.FloatField()
+    
+    def __str__(self):
+        return f"{self.owner} v{self.version}"
+
+class Task(models.Model):
+    """Background job queued in the database and run by the run_tasks worker"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tasks', blank=True, null=True)
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.PositiveSmallIntegerField(default=0, help_text='Percent complete')
+    message = models.CharField(max_length=200, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    timeout = models.PositiveIntegerField(default=600, help_text='Seconds per attempt')
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    result = models.FileField(upload_to=task_result_path, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['user', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
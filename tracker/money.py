@@ -0,0 +1,41 @@
+"""
+Currency codes and amount formatting.
+
+Kept free of model imports so the models can use it; conversion between
+currencies lives in tracker.fx.
+"""
+DEFAULT_CURRENCY = 'INR'
+
+CURRENCIES = [
+    ('INR', 'Indian Rupee'),
+    ('USD', 'US Dollar'),
+    ('EUR', 'Euro'),
+    ('GBP', 'British Pound'),
+    ('JPY', 'Japanese Yen'),
+    ('AED', 'UAE Dirham'),
+    ('AUD', 'Australian Dollar'),
+    ('CAD', 'Canadian Dollar'),
+    ('CHF', 'Swiss Franc'),
+    ('CNY', 'Chinese Yuan'),
+    ('SGD', 'Singapore Dollar'),
+]
+
+SYMBOLS = {
+    'INR': '₹',
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'JPY': '¥',
+}
+
+
+def format_amount(amount, currency):
+    """``₹12.50`` for currencies with a symbol, ``AED 12.50`` otherwise"""
+    symbol = SYMBOLS.get(currency)
+    return f'{symbol}{amount}' if symbol else f'{currency} {amount}'
+
+
+def user_currency(user):
+    """The home currency of a user, from their profile (without a query when it is loaded)"""
+    profile = getattr(user, 'profile', None)
+    return profile.currency if profile is not None else DEFAULT_CURRENCY
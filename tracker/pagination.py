@@ -0,0 +1,127 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page continues from the sort key of the last row
+of the previous page, so the database seeks straight to it through the
+``(user, date, created_at)`` index however deep the page is. The position is
+handed to clients as an opaque URL-safe token.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+# Matches the Meta.ordering of Expense and Income, with id as tie-breaker
+DEFAULT_ORDERING = ('-date', '-created_at', '-id')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset"""
+
+    def __init__(self, object_list, next_cursor, cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return bool(self.cursor)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset by seeking past the sort key of the previous page"""
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        model = queryset.model
+        self.model_fields = [model._meta.get_field(name) for name in self.fields]
+
+    def encode(self, obj):
+        """Build the cursor token that continues after ``obj``"""
+        values = [field.value_to_string(obj) for field in self.model_fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode(self, token):
+        """Turn a cursor token back into typed sort key values"""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.model_fields):
+                raise InvalidCursor(token)
+            values = [field.to_python(value) for field, value in zip(self.model_fields, values)]
+            for field, value in zip(self.model_fields, values):
+                # Tampered tokens must not reach the query as NULLs or out-of-range integers
+                if value is None:
+                    raise InvalidCursor(token)
+                field.run_validators(value)
+            return values
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidCursor(token)
+
+    def seek(self, values):
+        """Q object selecting the rows that sort after ``values``"""
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {self.fields[i]: values[i] for i in range(position)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[position]})
+        # The OR alone gives the index no bound; a range on the leading key
+        # lets it start at the cursor instead of the first row
+        lead = 'lte' if self.ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{self.fields[0]}__{lead}': values[0]}) & condition
+
+    def page(self, cursor=None):
+        """Return the page after ``cursor`` (the first page when empty)"""
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.seek(self.decode(cursor)))
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode(rows[-1])
+        return KeysetPage(rows, next_cursor, cursor)
+
+    def get_page(self, cursor=None):
+        """Like page(), but fall back to the first page for a bad cursor"""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+def paginate_request(request, queryset, per_page, count=None):
+    """
+    Paginate a listing from the request's query string.
+
+    A ``cursor`` parameter (empty for the first page) selects keyset
+    pagination; otherwise Django's Paginator is used with ``page``. A known
+    ``count`` spares the offset paginator its own COUNT query.
+    """
+    if 'cursor' in request.GET:
+        return KeysetPaginator(queryset, per_page).get_page(request.GET['cursor'])
+    paginator = Paginator(queryset, per_page)
+    if count is not None:
+        paginator.count = count
+    return paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,65 @@
+"""
+Calendar helpers for recurring periods (budgets, recurring transactions).
+"""
+import calendar
+from datetime import timedelta
+
+PERIOD_MONTHS = {
+    'monthly': 1,
+    'yearly': 12,
+}
+
+PERIOD_DAYS = {
+    'daily': 1,
+    'weekly': 7,
+}
+
+
+def add_months(value, months):
+    """Shift a date by whole months, clamping the day to the target month's length"""
+    year, month = divmod(value.month - 1 + months, 12)
+    year += value.year
+    month += 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def nth_occurrence(anchor, period_type, n):
+    """
+    Return the n-th occurrence (0 = anchor) of a period starting at ``anchor``.
+
+    Occurrences are always computed from the anchor, so a series anchored on
+    the 31st lands on the last day of shorter months and returns to the 31st
+    afterwards instead of drifting.
+    """
+    if period_type in PERIOD_DAYS:
+        return anchor + timedelta(days=PERIOD_DAYS[period_type] * n)
+    if period_type in PERIOD_MONTHS:
+        return add_months(anchor, PERIOD_MONTHS[period_type] * n)
+    raise ValueError(f'Unknown period type: {period_type!r}')
+
+
+def occurrence_index(anchor, period_type, value):
+    """Return n such that ``value`` falls in [occurrence n, occurrence n + 1)"""
+    if value <= anchor:
+        return 0
+    if period_type in PERIOD_DAYS:
+        return (value - anchor).days // PERIOD_DAYS[period_type]
+    if period_type in PERIOD_MONTHS:
+        months = (value.year - anchor.year) * 12 + value.month - anchor.month
+        n = months // PERIOD_MONTHS[period_type]
+        if nth_occurrence(anchor, period_type, n) > value:
+            n -= 1
+        return n
+    raise ValueError(f'Unknown period type: {period_type!r}')
+
+
+def period_window(period_type, anchor, today):
+    """
+    Return the half-open ``(start, end)`` window of the period containing ``today``.
+
+    Periods repeat from ``anchor``; before the anchor the first period is
+    returned.
+    """
+    n = occurrence_index(anchor, period_type, today)
+    return nth_occurrence(anchor, period_type, n), nth_occurrence(anchor, period_type, n + 1)
@@ -0,0 +1,247 @@
+"""
+Opt-in request profiling.
+
+``ProfilingMiddleware`` times a sample of requests and records, per
+request, the wall time, the time spent in the database, the query count and
+repeated queries: exact duplicates (same SQL and parameters) and similar
+queries (same SQL, different parameters), the signature of an N+1 loop.
+Sampled responses carry a ``Server-Timing`` header, and each URL name keeps
+a rolling window of its latest samples, summarised at the staff-only
+``profiling_stats`` endpoint.
+
+Settings:
+
+- ``TRACKER_PROFILING``: enable the middleware (off by default; when off
+  it removes itself from the middleware chain)
+- ``TRACKER_PROFILING_SAMPLE_RATE``: fraction of requests profiled (0-1)
+- ``TRACKER_PROFILING_WINDOW``: samples kept per URL name
+- ``TRACKER_PROFILING_SIMILAR_THRESHOLD``: repeats of one SQL statement
+  reported as a likely N+1
+
+Statistics live in process memory, so each worker reports its own.
+Queries run while a streaming response is consumed are not counted. The
+middleware runs natively in both sync and async chains; under ASGI the
+query wrappers are installed from the request's thread-sensitive sync
+thread, where its ORM queries run.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+def profiling_enabled():
+    return getattr(settings, 'TRACKER_PROFILING', False)
+
+
+def sample_rate():
+    return getattr(settings, 'TRACKER_PROFILING_SAMPLE_RATE', 1.0)
+
+
+def similar_threshold():
+    return getattr(settings, 'TRACKER_PROFILING_SIMILAR_THRESHOLD', 5)
+
+
+class QueryRecorder:
+    """Database execute wrapper that times every query of one request"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, _freeze(params), time.perf_counter() - start))
+
+    @property
+    def db_time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def duplicates(self):
+        """Number of queries that repeat an earlier one exactly"""
+        counts = Counter((sql, params) for sql, params, _ in self.queries)
+        return sum(count - 1 for count in counts.values())
+
+    def similar(self, threshold):
+        """``{sql: count}`` for statements run at least ``threshold`` times"""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+
+def _freeze(params):
+    if isinstance(params, (list, tuple)):
+        return tuple(_freeze(param) for param in params)
+    if isinstance(params, dict):
+        return tuple(sorted((key, _freeze(value)) for key, value in params.items()))
+    try:
+        hash(params)
+    except TypeError:
+        return repr(params)
+    return params
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class ViewStats:
+    """Rolling window of samples for one URL name"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.total = 0
+        self.similar = Counter()
+
+    def add(self, sample, similar):
+        self.samples.append(sample)
+        self.total += 1
+        self.similar.update(similar.keys())
+
+    def summary(self):
+        samples = list(self.samples)
+        times = sorted(sample['time_ms'] for sample in samples)
+        histogram = {f'<={bound}ms': 0 for bound in HISTOGRAM_BOUNDS_MS}
+        histogram[f'>{HISTOGRAM_BOUNDS_MS[-1]}ms'] = 0
+        for value in times:
+            for bound in HISTOGRAM_BOUNDS_MS:
+                if value <= bound:
+                    histogram[f'<={bound}ms'] += 1
+                    break
+            else:
+                histogram[f'>{HISTOGRAM_BOUNDS_MS[-1]}ms'] += 1
+        count = len(samples) or 1
+        return {
+            'sampled': self.total,
+            'window': len(samples),
+            'time_ms': {
+                'p50': _percentile(times, 0.5),
+                'p90': _percentile(times, 0.9),
+                'p99': _percentile(times, 0.99),
+                'max': times[-1] if times else 0.0,
+            },
+            'db_ms_mean': round(sum(sample['db_ms'] for sample in samples) / count, 3),
+            'queries_mean': round(sum(sample['queries'] for sample in samples) / count, 2),
+            'queries_max': max((sample['queries'] for sample in samples), default=0),
+            'duplicates_max': max((sample['duplicates'] for sample in samples), default=0),
+            'histogram': histogram,
+            'n_plus_one': [
+                {'sql': sql, 'requests': requests} for sql, requests in self.similar.most_common(5)
+            ],
+        }
+
+
+class ProfileStore:
+    """Per-URL-name statistics shared by the threads of one process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, name, sample, similar=None):
+        window = getattr(settings, 'TRACKER_PROFILING_WINDOW', 1000)
+        with self.lock:
+            if name not in self.views:
+                self.views[name] = ViewStats(window)
+            self.views[name].add(sample, similar or {})
+
+    def summary(self):
+        with self.lock:
+            return {name: stats.summary() for name, stats in sorted(self.views.items())}
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """Profile a sample of requests; see the module docstring for settings"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= sample_rate():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with self.wrap_connections(recorder):
+            start = time.perf_counter()
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - start
+        return self.finish(request, response, recorder, elapsed)
+
+    async def __acall__(self, request):
+        if random.random() >= sample_rate():
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        # Connections are per thread, so wrap the ones of the sync thread the ORM runs in
+        stack = await sync_to_async(self.wrap_connections)(recorder)
+        try:
+            start = time.perf_counter()
+            response = await self.get_response(request)
+            elapsed = time.perf_counter() - start
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, elapsed)
+
+    def wrap_connections(self, recorder):
+        """Install ``recorder`` on this thread's connections until the returned stack is closed"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    def finish(self, request, response, recorder, elapsed):
+        self.record(request, recorder, elapsed)
+        response['Server-Timing'] = self.server_timing(recorder, elapsed)
+        return response
+
+    def record(self, request, recorder, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        name = (match.view_name if match else None) or 'unresolved'
+        similar = recorder.similar(similar_threshold())
+        sample = {
+            'time_ms': round(elapsed * 1000, 3),
+            'db_ms': round(recorder.db_time * 1000, 3),
+            'queries': len(recorder.queries),
+            'duplicates': recorder.duplicates(),
+        }
+        store.record(name, sample, similar)
+        for sql, count in similar.items():
+            logger.info('Possible N+1 in %s: %d runs of %s', name, count, sql[:200])
+
+    def server_timing(self, recorder, elapsed):
+        return (
+            f'total;dur={elapsed * 1000:.1f}, '
+            f'db;dur={recorder.db_time * 1000:.1f};desc="{len(recorder.queries)} queries", '
+            f'dup;desc="{recorder.duplicates()} duplicate queries"'
+        )
@@ -0,0 +1,74 @@
+"""
+Query plan checks.
+
+``capture_queries()`` requests every benchmark case (see tracker.benchmarks)
+and records the SELECT statements each view runs. ``explain()`` asks SQLite
+for their plans with EXPLAIN QUERY PLAN and ``full_scans()`` picks out the
+steps that read a whole tracker table (or a whole index of one) instead of
+searching an index. Used by ``manage.py explain_views`` and by
+tracker.tests, so a view query that loses its index fails the test suite.
+"""
+import re
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import benchmarks
+from .cache import get_cache
+
+SCAN = re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?(?P<index> USING (?:COVERING )?INDEX \w+)?')
+
+# Tables a full scan is fine for: a handful of rows per user, or shared
+# lookup rows
+SMALL_TABLES = {
+    'tracker_category',
+}
+
+
+def tracker_tables():
+    return {model._meta.db_table for model in apps.get_app_config('tracker').get_models()} - SMALL_TABLES
+
+
+def capture_queries(fixture, cases=benchmarks.CASES):
+    """Return ``[(case label, sql)]`` for the SELECTs every case runs from a cold cache"""
+    captured = []
+    with benchmarks.case_environment(fixture) as client:
+        for case in cases:
+            url, payload = case.request(fixture)
+            get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                benchmarks._consume(getattr(client, case.method)(url, payload))
+            if case.url_name == 'logout':
+                client.force_login(fixture.user)
+            captured.extend(
+                (case.label, query['sql']) for query in queries.captured_queries
+                if query['sql'].lstrip().upper().startswith(('SELECT', 'WITH'))
+            )
+    return captured
+
+
+def explain(sql, params=None):
+    """EXPLAIN QUERY PLAN steps of an SQLite statement"""
+    if connection.vendor != 'sqlite':
+        raise NotImplementedError('Query plans are only checked on SQLite')
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan, tables=None):
+    """Plan steps that scan a whole tracker table or index"""
+    tables = tracker_tables() if tables is None else tables
+    return [step for step in plan if (match := SCAN.match(step)) and match['table'] in tables]
+
+
+def check_cases(fixture, cases=benchmarks.CASES):
+    """``[(case label, sql, scan steps)]`` for every view query with a full scan"""
+    tables = tracker_tables()
+    problems = []
+    for label, sql in capture_queries(fixture, cases):
+        scans = full_scans(explain(sql), tables)
+        if scans:
+            problems.append((label, sql, scans))
+    return problems
@@ -0,0 +1,157 @@
+"""
+Receipt image processing.
+
+Uploaded receipts are saved as-is under ``receipts/uploads/`` and a
+``process_receipt`` background task (see tracker.tasks) replaces them with
+a processed copy, so the upload request never decodes or encodes images:
+
+- the photo is turned upright from its EXIF orientation, then all metadata
+  (EXIF with GPS position, XMP, ICC) is dropped
+- it is scaled to fit ``TRACKER_RECEIPT_MAX_SIDE`` pixels and re-encoded as
+  ``TRACKER_RECEIPT_FORMAT`` (WEBP or JPEG), lowering the quality until it
+  fits ``TRACKER_RECEIPT_MAX_BYTES``
+- a thumbnail is made for each of ``TRACKER_RECEIPT_THUMBNAIL_WIDTHS``
+  narrower than the image
+
+Processed files are stored by the SHA-256 of the uploaded bytes, as
+``receipts/sha256/<ab>/<digest>/full.webp`` with ``<width>.webp`` thumbnails
+next to it, so the same photo uploaded twice is processed and stored once.
+The full image is written last and marks a complete set. Expense rows keep
+the full image's name and dimensions; thumbnail names and the ``srcset``
+are derived from them (see ``receipt_sources``).
+"""
+import hashlib
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from . import images, tasks
+from .models import Expense, Task
+
+PROCESSED_DIR = 'receipts/sha256/'
+
+
+def receipt_format():
+    return getattr(settings, 'TRACKER_RECEIPT_FORMAT', 'WEBP').upper()
+
+
+def encode_options():
+    """Keyword arguments for ``images.encode_receipt`` from the settings"""
+    return {
+        'image_format': receipt_format(),
+        'max_side': getattr(settings, 'TRACKER_RECEIPT_MAX_SIDE', 2000),
+        'max_bytes': getattr(settings, 'TRACKER_RECEIPT_MAX_BYTES', 400 * 1024),
+        'widths': tuple(thumbnail_widths()),
+    }
+
+
+def thumbnail_widths():
+    return sorted(getattr(settings, 'TRACKER_RECEIPT_THUMBNAIL_WIDTHS', [160, 320, 640]))
+
+
+def is_processed(name):
+    return bool(name) and name.startswith(PROCESSED_DIR)
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def processed_name(content_digest, variant='full'):
+    extension = images.FORMAT_EXTENSIONS[receipt_format()]
+    return f'{PROCESSED_DIR}{content_digest[:2]}/{content_digest}/{variant}.{extension}'
+
+
+def variant_name(name, width):
+    """Name of the ``width`` pixel thumbnail of the processed image ``name``"""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, f'{width}{posixpath.splitext(filename)[1]}')
+
+
+def find_processed(content_digest):
+    """``(name, width, height)`` of an already processed copy of the same upload, or None"""
+    name = processed_name(content_digest)
+    if not default_storage.exists(name):
+        return None
+    with default_storage.open(name, 'rb') as stored:
+        width, height = Image.open(stored).size
+    return name, width, height
+
+
+def _write(name, data):
+    saved = default_storage.save(name, ContentFile(data))
+    if saved != name:
+        # Another worker stored the same image first
+        default_storage.delete(saved)
+
+
+def store(content_digest, encoded):
+    """Write an ``images.encode_receipt`` result and return ``(name, width, height)``"""
+    name = processed_name(content_digest)
+    for width, data in encoded['thumbnails'].items():
+        _write(variant_name(name, width), data)
+    _write(name, encoded['full'])
+    return (name, *encoded['size'])
+
+
+def attach(expense_id, original, processed):
+    """Point the expense at its processed receipt, unless the upload was replaced meanwhile"""
+    name, width, height = processed
+    updated = Expense.objects.filter(pk=expense_id, receipt_image=original).update(
+        receipt_image=name, receipt_width=width, receipt_height=height
+    )
+    if updated and not Expense.objects.filter(receipt_image=original).exists():
+        default_storage.delete(original)
+    return bool(updated)
+
+
+def process(expense_id, original, data=None):
+    """Process the upload ``original`` of an expense; returns False if it is no longer attached"""
+    if not Expense.objects.filter(pk=expense_id, receipt_image=original).exists():
+        return False
+    if data is None:
+        with default_storage.open(original, 'rb') as upload:
+            data = upload.read()
+    content_digest = digest(data)
+    processed = find_processed(content_digest)
+    if processed is None:
+        processed = store(content_digest, images.encode_receipt(data, **encode_options()))
+    return attach(expense_id, original, processed)
+
+
+def queue(expense):
+    """Queue processing of the expense's newly uploaded receipt once the transaction commits"""
+    name = expense.receipt_image.name
+    params = {'expense_id': expense.pk, 'name': name}
+
+    def enqueue():
+        if not Task.objects.filter(kind='process_receipt', params=params,
+                                   status__in=[Task.PENDING, Task.RUNNING]).exists():
+            tasks.enqueue('process_receipt', params=params)
+
+    transaction.on_commit(enqueue)
+
+
+def receipt_sources(expense):
+    """
+    ``{'url', 'srcset', 'width', 'height'}`` for showing an expense's receipt,
+    or None without one. Unprocessed uploads have no srcset or dimensions.
+    """
+    field = expense.receipt_image
+    if not field:
+        return None
+    if not is_processed(field.name) or not expense.receipt_width:
+        return {'url': field.url, 'srcset': '', 'width': None, 'height': None}
+    candidates = [(default_storage.url(variant_name(field.name, width)), width)
+                  for width in thumbnail_widths() if width < expense.receipt_width]
+    candidates.append((field.url, expense.receipt_width))
+    return {
+        'url': field.url,
+        'srcset': ', '.join(f'{url} {width}w' for url, width in candidates),
+        'width': expense.receipt_width,
+        'height': expense.receipt_height,
+    }
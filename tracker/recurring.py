@@ -0,0 +1,144 @@
+"""
+Materialization of recurring expenses and income.
+
+A transaction with ``is_recurring`` and a ``recurring_period`` that was not
+itself generated is a template. Its own date is occurrence 0; later
+occurrences are computed from that anchor (tracker.periods), so monthly
+templates on the 31st land on the last day of shorter months.
+
+Each template remembers the date of its last generated occurrence in
+``recurring_last_date``, updated in the same transaction as the inserted
+rows, which makes runs idempotent; the unique (recurring_source, date)
+constraint guards against overlapping runs. Templates are processed a batch
+of users at a time, with a cap on occurrences per template per run, so a
+run over many users needs bounded memory. A partial index on the user of
+templates lets each batch seek to its users without scanning the
+generated occurrences.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Expense, Income
+from .periods import nth_occurrence, occurrence_index
+from .signals import transactions_bulk_created
+from .tags import copy_tags
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_BATCH_SIZE = 500
+MAX_OCCURRENCES_PER_RUN = 1000
+INSERT_BATCH_SIZE = 5000
+
+# Fields copied from a template to each generated occurrence
+COPIED_FIELDS = {
+    Expense: ['user_id', 'title', 'description', 'amount', 'currency', 'category_id', 'payment_method', 'location'],
+    Income: ['user_id', 'title', 'description', 'amount', 'currency', 'source'],
+}
+
+
+def templates(model):
+    """Queryset of the recurring templates of a model"""
+    return model.objects.filter(
+        is_recurring=True,
+        recurring_source__isnull=True,
+        recurring_period__in=['daily', 'weekly', 'monthly', 'yearly'],
+    )
+
+
+def due_dates(template, until, limit=MAX_OCCURRENCES_PER_RUN):
+    """Return the dates of a template's occurrences not yet generated, up to ``until``"""
+    anchor = template.date
+    period = template.recurring_period
+    last = template.recurring_last_date or anchor
+    n = occurrence_index(anchor, period, last) + 1
+    dates = []
+    occurrence = nth_occurrence(anchor, period, n)
+    while occurrence <= until and len(dates) < limit:
+        dates.append(occurrence)
+        n += 1
+        occurrence = nth_occurrence(anchor, period, n)
+    return dates
+
+
+def build_occurrences(model, template, dates):
+    """Unsaved copies of a template for the given dates"""
+    values = {field: getattr(template, field) for field in COPIED_FIELDS[model]}
+    return [
+        model(date=date, is_recurring=False, recurring_source_id=template.pk, **values)
+        for date in dates
+    ]
+
+
+class RunResult:
+    """Counts from one materialization run"""
+
+    def __init__(self):
+        self.users = 0
+        self.templates = 0
+        self.created = {Expense: 0, Income: 0}
+        self.failed_batches = 0
+
+
+def materialize(until=None, user_batch_size=DEFAULT_USER_BATCH_SIZE, dry_run=False):
+    """Generate missing occurrences of every recurring template up to ``until``"""
+    until = until or timezone.localdate()
+    result = RunResult()
+    for model in (Expense, Income):
+        last_user_id = 0
+        while True:
+            user_ids = list(
+                templates(model).filter(user_id__gt=last_user_id)
+                .order_by('user_id').values_list('user_id', flat=True).distinct()[:user_batch_size]
+            )
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+            result.users += len(user_ids)
+            materialize_users(model, user_ids, until, result, dry_run)
+    return result
+
+
+def materialize_users(model, user_ids, until, result, dry_run=False):
+    """Generate occurrences for one batch of users, in one transaction"""
+    try:
+        with transaction.atomic():
+            batch_templates = list(
+                templates(model).filter(user_id__in=user_ids, date__lte=until)
+                .select_for_update().order_by('pk')
+            )
+            pending = []
+            updated_templates = []
+            for template in batch_templates:
+                dates = due_dates(template, until)
+                if not dates:
+                    continue
+                pending.extend(build_occurrences(model, template, dates))
+                template.recurring_last_date = dates[-1]
+                updated_templates.append(template)
+                if len(pending) >= INSERT_BATCH_SIZE:
+                    result.created[model] += _insert(model, pending, dry_run)
+                    pending = []
+            result.created[model] += _insert(model, pending, dry_run)
+            result.templates += len(updated_templates)
+            if updated_templates and not dry_run:
+                model.objects.bulk_update(updated_templates, ['recurring_last_date'], batch_size=1000)
+            if dry_run:
+                transaction.set_rollback(True)
+    except IntegrityError:
+        # Another run generated some of these occurrences first; the next
+        # run picks up from the recurring_last_date it committed.
+        logger.warning('Skipped %s batch for users %s..%s after a conflicting run',
+                       model.__name__, user_ids[0], user_ids[-1])
+        result.failed_batches += 1
+
+
+def _insert(model, occurrences, dry_run):
+    if dry_run or not occurrences:
+        return len(occurrences)
+    created = model.objects.bulk_create(occurrences, batch_size=1000)
+    if model is Expense:
+        copy_tags(created)
+    transactions_bulk_created.send(sender=model, instances=created)
+    return len(created)
@@ -0,0 +1,164 @@
+"""
+Read-replica routing for analytics traffic.
+
+Views decorated with ``replica_reads`` (analytics, reports and the chart
+endpoints) run their queries against one of the ``TRACKER_DB_REPLICAS``
+aliases; everything else, and every write, uses ``default``. Replicas lag
+behind the primary, so ``ReadYourWritesMiddleware`` remembers in the
+session when a request last wrote, and for ``TRACKER_READ_YOUR_WRITES``
+seconds afterwards that session reads from the primary too. A write made
+inside a replica view switches the rest of that request to the primary.
+The cache versions (``DataVersion``) are always read from the primary,
+since a lagging version would serve cached responses older than the
+latest write.
+
+Settings:
+
+- ``TRACKER_DB_REPLICAS``: replica aliases from ``DATABASES`` (none by
+  default; without replicas the middleware removes itself)
+- ``TRACKER_READ_YOUR_WRITES``: seconds a session stays on the primary
+  after writing; keep it above the replica lag
+
+Locally, set ``DB_REPLICA_PATH`` to a second SQLite file and refresh it
+with ``manage.py sync_replica``.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+SESSION_KEY = '_tracker_last_write'
+
+# Writes to these apps do not make a session's own data stale
+UNTRACKED_APPS = {'sessions'}
+
+# Always read from the primary: a lagging cache version would serve stale data
+PRIMARY_MODELS = {'tracker.DataVersion'}
+
+_state = ContextVar('tracker_replica_state', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in getattr(settings, 'TRACKER_DB_REPLICAS', []) if alias in settings.DATABASES]
+
+
+def read_your_writes_window():
+    return getattr(settings, 'TRACKER_READ_YOUR_WRITES', 10)
+
+
+class RequestState:
+    """Routing state of the current request"""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica = None
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """Send reads inside ``replica_reads`` views to a replica, all else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if model._meta.label in PRIMARY_MODELS:
+            return 'default'
+        if state is not None and state.replica:
+            return state.replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in UNTRACKED_APPS:
+            state.wrote = True
+            state.replica = None
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and are never migrated directly
+        return db not in replica_aliases()
+
+
+class ReadYourWritesMiddleware:
+    """Track writes per session; must come after SessionMiddleware"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(self.pinned(request.session.get(SESSION_KEY)))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            request.session[SESSION_KEY] = time.time()
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(self.pinned(await request.session.aget(SESSION_KEY)))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            await request.session.aset(SESSION_KEY, time.time())
+        return response
+
+    def pinned(self, last_write):
+        return last_write is not None and time.time() - last_write < read_your_writes_window()
+
+
+def _use_replica(state):
+    aliases = replica_aliases()
+    if state is None or state.pinned or state.wrote or not aliases:
+        return None
+    return random.choice(aliases)
+
+
+def replica_reads(view):
+    """Run a read-only view against a replica unless the session just wrote"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            state = _state.get()
+            replica = _use_replica(state)
+            if replica is None:
+                return await view(request, *args, **kwargs)
+            state.replica = replica
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                state.replica = None
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _state.get()
+        replica = _use_replica(state)
+        if replica is None:
+            return view(request, *args, **kwargs)
+        state.replica = replica
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.replica = None
+    return wrapper
@@ -0,0 +1,47 @@
+"""
+Date-range report totals shared by the reports page and the PDF report task.
+
+Totals come from the monthly and daily rollups (see tracker.rollups), and
+each range's result is cached per user until their data changes.
+"""
+from decimal import Decimal
+
+from . import rollups
+from .cache import cached_for_user
+from .models import Expense, Income
+
+
+def report_summary(user, start_date, end_date):
+    """Totals and breakdowns of a user's expenses and income in an inclusive date range"""
+    return cached_for_user(
+        'report', user.pk,
+        lambda: _summarize(user, start_date, end_date),
+        params=f'{start_date}:{end_date}',
+    )
+
+
+def _summarize(user, start_date, end_date):
+    # Whole months come from the monthly rollups, the partial months at
+    # either end from the daily ones
+    category_breakdown = rollups.range_breakdown(
+        Expense, user, start_date, end_date,
+        ['category__name', 'category__color']
+    )
+    income_breakdown = rollups.range_breakdown(
+        Income, user, start_date, end_date, ['source']
+    )
+
+    total_expenses = sum((row['total'] for row in category_breakdown), Decimal('0'))
+    total_income = sum((row['total'] for row in income_breakdown), Decimal('0'))
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_expenses': total_expenses,
+        'total_income': total_income,
+        'net_savings': total_income - total_expenses,
+        'category_breakdown': category_breakdown,
+        'income_breakdown': income_breakdown,
+        'expenses_count': sum(row['count'] for row in category_breakdown),
+        'incomes_count': sum(row['count'] for row in income_breakdown),
+    }
@@ -0,0 +1,273 @@
+"""
+Monthly and daily rollups of expense and income totals.
+
+ExpenseRollup and IncomeRollup hold one row per (user, category/source, month)
+with the summed amount and the number of transactions; ExpenseDailyRollup and
+IncomeDailyRollup hold the same per day. The rows are kept current by the
+receivers in tracker.signals, so pages that only need totals can read a
+handful of rollup rows instead of aggregating every transaction. A date
+range is answered from the monthly rows for its whole months and the daily
+rows for the days at either end, so a five year report reads about as many
+rows as a one month report.
+
+Bulk writes that skip model signals (``QuerySet.update()``, raw SQL) leave the
+rollups stale; run ``manage.py rebuild_rollups`` after those.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from . import fx, upserts
+from .models import Expense, ExpenseDailyRollup, ExpenseRollup, Income, IncomeDailyRollup, IncomeRollup
+
+# Transaction model -> (monthly rollup model, name of the grouping column)
+ROLLUPS = {
+    Expense: (ExpenseRollup, 'category_id'),
+    Income: (IncomeRollup, 'source'),
+}
+
+# Transaction model -> daily rollup model, grouped like the monthly one
+DAILY_ROLLUPS = {
+    Expense: ExpenseDailyRollup,
+    Income: IncomeDailyRollup,
+}
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def month_start(value):
+    """Return the first day of the month containing ``value``"""
+    return value.replace(day=1)
+
+
+def next_month(value):
+    """Return the first day of the month after ``value``"""
+    return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def rollup_key(model, values):
+    """Build the rollup lookup for a transaction given its field values"""
+    rollup_model, group_field = ROLLUPS[model]
+    date = model._meta.get_field('date').to_python(values['date'])
+    return {
+        'user_id': values['user_id'],
+        group_field: values[group_field],
+        'month': month_start(date),
+    }
+
+
+def daily_key(model, values):
+    """Build the daily rollup lookup for a transaction given its field values"""
+    key = rollup_key(model, values)
+    del key['month']
+    key['day'] = model._meta.get_field('date').to_python(values['date'])
+    return key
+
+
+def rollup_keys(model, values):
+    """Yield ``(rollup model, lookup)`` for every rollup a transaction is counted in"""
+    rollup_model, _ = ROLLUPS[model]
+    yield rollup_model, rollup_key(model, values)
+    yield DAILY_ROLLUPS[model], daily_key(model, values)
+
+
+def rollup_values(instance):
+    """Return the fields of a transaction that its rollup depends on"""
+    model = type(instance)
+    _, group_field = ROLLUPS[model]
+    return in_home_currency(model, {
+        'user_id': instance.user_id,
+        group_field: getattr(instance, group_field),
+        'date': instance.date,
+        'amount': instance.amount,
+        'currency': instance.currency,
+        'home': fx.home_of(instance),
+    })
+
+
+def bulk_rollup_values(instances):
+    """rollup_values() of many transactions, reading their owners' home currencies with one query"""
+    fx.load_homes(instances)
+    return [rollup_values(instance) for instance in instances]
+
+
+def in_home_currency(model, values):
+    """Replace the ``amount``, ``currency`` and ``home`` of transaction values with the amount in ``home``"""
+    amount = model._meta.get_field('amount').to_python(values['amount'])
+    date = model._meta.get_field('date').to_python(values['date'])
+    values['amount'] = fx.convert(amount, values.pop('currency'), values.pop('home'), date)
+    return values
+
+
+def apply_delta(model, values, sign):
+    """Add (sign=1) or remove (sign=-1) one transaction from its rollups"""
+    apply_deltas(model, collect_deltas(model, [values], sign))
+
+
+def collect_deltas(model, rows, sign=1):
+    """Sum the rollup changes for many transactions, keyed by rollup model and row"""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for values in rows:
+        for rollup_model, key in rollup_keys(model, values):
+            delta = deltas[rollup_model, _freeze(key)]
+            delta[0] += sign * values['amount']
+            delta[1] += sign
+    return deltas
+
+
+def apply_deltas(model, deltas):
+    """
+    Apply deltas from collect_deltas. Additions are written with one upsert
+    per rollup table; removals and edits update their rows one by one and
+    drop rows that no longer count any transaction.
+    """
+    additions = defaultdict(list)
+    for (rollup_model, frozen_key), (amount, count) in deltas.items():
+        if not amount and not count:
+            continue
+        key = dict(frozen_key)
+        if count > 0:
+            additions[rollup_model].append(dict(key, total=amount, count=count))
+            continue
+        updated = rollup_model.objects.filter(**key).update(
+            total=F('total') + amount,
+            count=F('count') + count,
+        )
+        # A missing row is already gone, e.g. removed by a cascading delete
+        if updated and count < 0:
+            rollup_model.objects.filter(count__lte=0, **key).delete()
+    for rollup_model, rows in additions.items():
+        upserts.upsert(rollup_model, rows, rollup_model._meta.unique_together[0], upserts.added('total', 'count'))
+
+
+def _freeze(key):
+    return tuple(sorted(key.items()))
+
+
+def rebuild(model, users=None, daily=False):
+    """Recompute the monthly (or daily) rollup rows of one transaction model from scratch"""
+    rollup_model, group_field = ROLLUPS[model]
+    transactions = model.objects.all()
+    if daily:
+        rollup_model = DAILY_ROLLUPS[model]
+        period = {'day': F('date')}
+    else:
+        period = {'month': TruncMonth('date')}
+    rollups = rollup_model.objects.all()
+    if users is not None:
+        transactions = transactions.filter(user__in=users)
+        rollups = rollups.filter(user__in=users)
+
+    grouped = transactions.values('user_id', group_field, **period).annotate(
+        total=Sum(fx.converted()),
+        count=Count('id')
+    ).order_by()
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(rollup_model(**row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                rollup_model.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            rollup_model.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def rebuild_all(users=None):
+    """Recompute every rollup table, returning the number of rows per model"""
+    counts = {}
+    for model, (rollup_model, _) in ROLLUPS.items():
+        counts[rollup_model.__name__] = rebuild(model, users)
+        counts[DAILY_ROLLUPS[model].__name__] = rebuild(model, users, daily=True)
+    return counts
+
+
+def month_totals(user, month):
+    """Return (month total, all-time total) of expenses and income for a user"""
+    totals = {}
+    for model, (rollup_model, _) in ROLLUPS.items():
+        totals[model] = rollup_model.objects.filter(user=user).aggregate(
+            month_total=Sum('total', filter=Q(month=month)),
+            total=Sum('total'),
+        )
+    expenses, income = totals[Expense], totals[Income]
+    return {
+        'monthly_expenses': expenses['month_total'] or Decimal('0'),
+        'monthly_income': income['month_total'] or Decimal('0'),
+        'total_expenses': expenses['total'] or Decimal('0'),
+        'total_income': income['total'] or Decimal('0'),
+    }
+
+
+def split_range(start_date, end_date):
+    """
+    Split the inclusive range [start_date, end_date] into whole months and edges.
+
+    Returns ``(months, edges)`` where ``months`` is a half-open
+    ``(first_month, end_month)`` pair covered by monthly rollups (or None) and
+    ``edges`` lists the inclusive date ranges read from the daily rollups.
+    """
+    first_month = start_date if start_date.day == 1 else next_month(start_date)
+    end_month = month_start(end_date + timedelta(days=1))
+    if first_month >= end_month:
+        return None, [(start_date, end_date)]
+
+    edges = []
+    if start_date < first_month:
+        edges.append((start_date, first_month - timedelta(days=1)))
+    if end_month <= end_date:
+        edges.append((end_month, end_date))
+    return (first_month, end_month), edges
+
+
+def range_breakdown(model, user, start_date, end_date, group_fields):
+    """
+    Total and count a user's transactions in a date range, grouped by ``group_fields``.
+
+    Whole months are read from the monthly rollups and the partial months at
+    either end from the daily rollups, so no transaction rows are read.
+    ``group_fields`` are lookups that exist on both rollup tables, e.g.
+    ``['category__name', 'category__color']``.
+    """
+    rollup_model, _ = ROLLUPS[model]
+    months, edges = split_range(start_date, end_date)
+
+    merged = {}
+
+    def merge(rows):
+        for row in rows:
+            key = tuple(row[field] for field in group_fields)
+            entry = merged.setdefault(key, dict(row, total=Decimal('0'), count=0))
+            entry['total'] += row['total']
+            entry['count'] += row['count']
+
+    if months:
+        merge(rollup_model.objects.filter(
+            user=user,
+            month__gte=months[0],
+            month__lt=months[1]
+        ).values(*group_fields).annotate(
+            total=Sum('total'),
+            count=Sum('count')
+        ).order_by())
+
+    if edges:
+        edge_filter = Q()
+        for edge_start, edge_end in edges:
+            edge_filter |= Q(day__gte=edge_start, day__lte=edge_end)
+        merge(DAILY_ROLLUPS[model].objects.filter(edge_filter, user=user).values(*group_fields).annotate(
+            total=Sum('total'),
+            count=Sum('count')
+        ).order_by())
+
+    return sorted(merged.values(), key=lambda row: row['total'], reverse=True)
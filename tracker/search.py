@@ -0,0 +1,241 @@
+"""
+Full-text search over expenses.
+
+The search backend is chosen once per process. On SQLite with FTS5 the
+``tracker_expense_fts`` virtual table (created by migration 0004) holds one
+row per expense, keyed by the expense id and kept in sync by the receivers in
+tracker.signals. Other databases fall back to ``icontains`` filtering unless
+``TRACKER_SEARCH_BACKEND`` names a backend class that uses their own
+full-text engine. A process that started before migration 0004 ran falls
+back to ``icontains`` for the time being and looks for the FTS5 table again
+at most every ``DETECT_INTERVAL`` seconds.
+
+Run ``manage.py rebuild_search_index`` after writes that skip model signals,
+or that a process still on the fallback made after the migration.
+"""
+import re
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Category, Expense, ExpenseTag
+from .tags import tag_names
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+DETECT_INTERVAL = 60  # seconds
+
+
+class SearchBackend(ABC):
+    """Interface for expense search backends"""
+
+    @abstractmethod
+    def search(self, user, query):
+        """Return ranked matches as a sliceable object with a count() method"""
+
+    @abstractmethod
+    def filter(self, queryset, user, query):
+        """Restrict a user's expense queryset to matches, keeping its ordering"""
+
+    def index(self, expenses):
+        """Add or refresh expenses in the index"""
+
+    def remove(self, expense_ids):
+        """Drop expenses from the index"""
+
+    def reindex_category(self, category):
+        """Refresh the category name stored for a category's expenses"""
+
+    def rebuild(self):
+        """Rebuild the index from the expense table, returning the row count"""
+        return 0
+
+
+class DatabaseSearchBackend(SearchBackend):
+    """Fallback that scans with icontains; needs no index"""
+
+    def match(self, query):
+        return (
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Exists(ExpenseTag.objects.filter(expense=OuterRef('pk'), tag__name__icontains=query)) |
+            Q(location__icontains=query) |
+            Q(category__name__icontains=query)
+        )
+
+    def search(self, user, query):
+        return Expense.objects.filter(self.match(query), user=user).select_related(
+            'category'
+        ).prefetch_related('tags')
+
+    def filter(self, queryset, user, query):
+        return queryset.filter(self.match(query), user=user)
+
+
+class SearchResults:
+    """Lazily fetched, ranked page of FTS matches usable with Paginator"""
+
+    def __init__(self, backend, user, match):
+        self.backend = backend
+        self.user = user
+        self.match = match
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.match)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        limit = -1 if key.stop is None else max(key.stop - start, 0)
+        ids = self.backend.ranked_ids(self.match, limit, start)
+        expenses = Expense.objects.filter(user=self.user).select_related('category').prefetch_related(
+            'tags'
+        ).in_bulk(ids)
+        return [expenses[pk] for pk in ids if pk in expenses]
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    FTS5 index with bm25 ranking and prefix matching.
+
+    Every row carries an ``owner`` token (``u<user id>``) so the per-user
+    restriction is answered by the full-text index itself.
+    """
+    table = 'tracker_expense_fts'
+    # bm25 weights for owner, title, description, tags, location, category
+    weights = (0.0, 10.0, 2.0, 5.0, 2.0, 5.0)
+
+    def match_expression(self, user, query):
+        """Build an FTS5 query: every word of ``query`` as a prefix, ANDed"""
+        terms = TOKEN.findall(query.lower())
+        if not terms:
+            return None
+        words = ' AND '.join(f'"{term}"*' for term in terms)
+        return f'owner : "u{user.pk}" AND {{title description tags location category}} : ({words})'
+
+    def search(self, user, query):
+        match = self.match_expression(user, query)
+        if match is None:
+            return Expense.objects.none()
+        return SearchResults(self, user, match)
+
+    def filter(self, queryset, user, query):
+        match = self.match_expression(user, query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]
+        ))
+
+    def count(self, match):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {self.table} WHERE {self.table} MATCH %s', [match])
+            return cursor.fetchone()[0]
+
+    def ranked_ids(self, match, limit, offset):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, {weights}) LIMIT %s OFFSET %s',
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, expenses):
+        expenses = list(expenses)
+        if not expenses:
+            return
+        categories = dict(Category.objects.filter(
+            pk__in={expense.category_id for expense in expenses}
+        ).values_list('pk', 'name'))
+        tags = tag_names([expense.pk for expense in expenses])
+        rows = [
+            (
+                expense.pk,
+                f'u{expense.user_id}',
+                expense.title,
+                expense.description or '',
+                ' '.join(tags.get(expense.pk, [])),
+                expense.location or '',
+                categories.get(expense.category_id, ''),
+            )
+            for expense in expenses
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, owner, title, description, tags, location, category) '
+                f'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, expense_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in expense_ids])
+
+    def reindex_category(self, category):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {self.table} SET category = %s '
+                f'WHERE rowid IN (SELECT id FROM tracker_expense WHERE category_id = %s)',
+                [category.name, category.pk],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, owner, title, description, tags, location, category) '
+                f"SELECT e.id, 'u' || e.user_id, e.title, COALESCE(e.description, ''), "
+                f"COALESCE((SELECT group_concat(t.name, ' ') FROM tracker_expensetag et "
+                f"JOIN tracker_tag t ON t.id = et.tag_id WHERE et.expense_id = e.id), ''), "
+                f"COALESCE(e.location, ''), c.name "
+                f'FROM tracker_expense e JOIN tracker_category c ON c.id = e.category_id'
+            )
+            cursor.execute(f'SELECT count(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+def _detect_backend():
+    """Return ``(backend, final)``; a backend that is not final is detected again later"""
+    backend_path = getattr(settings, 'TRACKER_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)(), True
+    if connection.vendor != 'sqlite':
+        return DatabaseSearchBackend(), True
+    if SQLiteFTS5Backend.table in connection.introspection.table_names():
+        return SQLiteFTS5Backend(), True
+    # The FTS5 table may not be migrated yet
+    return DatabaseSearchBackend(), False
+
+
+_detected = {'backend': None, 'final': False, 'checked_at': 0.0}
+
+
+def get_search_backend():
+    """Return the configured search backend, detecting FTS5 on SQLite"""
+    now = time.monotonic()
+    if _detected['backend'] is None or (
+        not _detected['final'] and now - _detected['checked_at'] >= DETECT_INTERVAL
+    ):
+        _detected['backend'], _detected['final'] = _detect_backend()
+        _detected['checked_at'] = now
+    return _detected['backend']
+
+
+def forget_search_backend():
+    """Detect the backend again on next use, e.g. after migrations"""
+    _detected['backend'] = None
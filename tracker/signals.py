@@ -0,0 +1,280 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_migrate, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver, Signal
+
+from . import anomalies, avatars, budget_alerts, cache, fx, receipts, rollups, tasks
+from .models import Budget, Category, Expense, Income, Tag, UserProfile
+from .search import forget_search_backend, get_search_backend
+
+# Sent after bulk_create() of Expense or Income rows, which skips post_save.
+# Arguments: sender (the model), instances (the created objects)
+transactions_bulk_created = Signal()
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+def remember_rollup_values(sender, instance, **kwargs):
+    """Load the stored row so post_save can move it out of its old rollup"""
+    instance._rollup_previous = None
+    if instance.pk and not instance._state.adding:
+        _, group_field = rollups.ROLLUPS[sender]
+        previous = sender.objects.filter(pk=instance.pk).values(
+            'user_id', group_field, 'date', 'amount', 'currency', home=fx.home_expression()
+        ).first()
+        if previous is not None:
+            if previous['user_id'] == instance.user_id:
+                fx.remember_home(instance, previous['home'])
+            instance._rollup_previous = rollups.in_home_currency(sender, previous)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """Keep the monthly rollups in step with a saved transaction"""
+    if raw:
+        return
+    current = rollups.rollup_values(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        if (rollups.daily_key(sender, previous) == rollups.daily_key(sender, current)
+                and previous['amount'] == current['amount']):
+            return
+        rollups.apply_delta(sender, previous, -1)
+    rollups.apply_delta(sender, current, 1)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """Remove a deleted transaction from its monthly rollup"""
+    rollups.apply_delta(sender, rollups.rollup_values(instance), -1)
+
+
+@receiver(transactions_bulk_created)
+def update_rollups_on_bulk_create(sender, instances, **kwargs):
+    """Add bulk-created transactions to the monthly rollups"""
+    rollups.apply_deltas(sender, rollups.collect_deltas(sender, rollups.bulk_rollup_values(instances)))
+
+
+@receiver(pre_save, sender=Expense)
+def flag_anomaly(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Score a new or changed expense against its category's stats before it is written"""
+    if raw or (update_fields is not None and 'anomaly_score' not in update_fields):
+        return
+    current = rollups.rollup_values(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None and anomalies.stats_key(previous) == anomalies.stats_key(current) \
+            and previous['amount'] == current['amount']:
+        return
+    anomalies.flag(instance, current, previous)
+
+
+@receiver(post_save, sender=Expense)
+def update_anomaly_stats_on_save(sender, instance, raw=False, **kwargs):
+    """Keep the category stats in step with a saved expense"""
+    if raw:
+        return
+    current = rollups.rollup_values(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        if anomalies.stats_key(previous) == anomalies.stats_key(current) and previous['amount'] == current['amount']:
+            return
+        anomalies.apply(previous, -1)
+    anomalies.apply(current, 1)
+
+
+@receiver(post_delete, sender=Expense)
+def update_anomaly_stats_on_delete(sender, instance, **kwargs):
+    """Take a deleted expense out of its category stats"""
+    anomalies.apply(rollups.rollup_values(instance), -1)
+
+
+@receiver(transactions_bulk_created, sender=Expense)
+def flag_bulk_anomalies(sender, instances, **kwargs):
+    """Score bulk-created expenses and add them to the category stats"""
+    anomalies.apply_bulk(instances, rollups.bulk_rollup_values(instances))
+
+
+@receiver(post_save, sender=Expense)
+def update_budget_spend_on_save(sender, instance, raw=False, **kwargs):
+    """Move a saved expense's amount between budget spend counters"""
+    if raw:
+        return
+    current = rollups.rollup_values(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    changes = [(current, 1)]
+    if previous is not None:
+        changes.insert(0, (previous, -1))
+    budget_alerts.apply_changes(changes)
+
+
+@receiver(post_delete, sender=Expense)
+def update_budget_spend_on_delete(sender, instance, **kwargs):
+    """Take a deleted expense out of its budget spend counters"""
+    budget_alerts.apply_changes([(rollups.rollup_values(instance), -1)])
+
+
+@receiver(transactions_bulk_created, sender=Expense)
+def update_budget_spend_on_bulk_create(sender, instances, **kwargs):
+    """Add bulk-created expenses to the budget spend counters"""
+    budget_alerts.apply_changes([(values, 1) for values in rollups.bulk_rollup_values(instances)])
+
+
+@receiver(post_save, sender=Budget)
+def reset_budget_spend(sender, instance, created, raw=False, **kwargs):
+    """An edited budget's periods or category may have changed; its counters are seeded again"""
+    if not created and not raw:
+        budget_alerts.forget_periods(instance)
+
+
+@receiver(post_save, sender=Expense)
+def index_expense(sender, instance, raw=False, **kwargs):
+    """Refresh a saved expense in the search index"""
+    if not raw:
+        get_search_backend().index([instance])
+
+
+@receiver(post_save, sender=Expense)
+def queue_receipt_processing(sender, instance, raw=False, **kwargs):
+    """Process a newly uploaded receipt in the background"""
+    if not raw and instance.receipt_image and not receipts.is_processed(instance.receipt_image.name):
+        receipts.queue(instance)
+
+
+@receiver(post_migrate)
+def redetect_search_backend(sender, **kwargs):
+    """Migrations may have created the FTS5 table"""
+    forget_search_backend()
+
+
+@receiver(post_delete, sender=Expense)
+def unindex_expense(sender, instance, **kwargs):
+    """Drop a deleted expense from the search index"""
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(transactions_bulk_created, sender=Expense)
+def index_bulk_expenses(sender, instances, **kwargs):
+    """Add bulk-created expenses to the search index"""
+    get_search_backend().index(instances)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, raw=False, **kwargs):
+    """Keep the category name stored in the search index current"""
+    if not created and not raw:
+        get_search_backend().reindex_category(instance)
+
+
+@receiver(m2m_changed, sender=Expense.tags.through)
+def reindex_expense_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refresh the tags stored in the search index and cached tag totals"""
+    if reverse:
+        # instance is a Tag and pk_set holds expense ids (None for a clear)
+        if action == 'pre_clear':
+            remember_tagged_expenses(sender, instance)
+            return
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_tagged_expense_ids', None)
+        expenses = Expense.objects.filter(pk__in=pk_set or [])
+    else:
+        expenses = [instance]
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        get_search_backend().index(expenses)
+        cache.bump_on_commit(instance.user_id)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_expenses(sender, instance, **kwargs):
+    """Note which expenses lose this tag before the links are deleted"""
+    instance._tagged_expense_ids = list(instance.expense_tags.values_list('expense_id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reindex_tag(sender, instance, created=False, raw=False, **kwargs):
+    """Keep tag names stored in the search index current after a rename or delete"""
+    if created or raw:
+        return
+    expense_ids = instance.__dict__.pop('_tagged_expense_ids', None)
+    if expense_ids is None:
+        expense_ids = instance.expense_tags.values_list('expense_id', flat=True)
+    get_search_backend().index(Expense.objects.filter(pk__in=list(expense_ids)))
+    cache.bump_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+@receiver(post_delete, sender=Budget)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Bump the owner's data version so cached analytics are recomputed"""
+    cache.bump_on_commit(instance.user_id)
+
+
+@receiver(transactions_bulk_created)
+def invalidate_user_cache_on_bulk_create(sender, instances, **kwargs):
+    """Bump the data version of every user in a bulk insert"""
+    for user_id in {instance.user_id for instance in instances}:
+        cache.bump_on_commit(user_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    """Category names and colours appear in everyone's charts"""
+    cache.bump_on_commit(cache.GLOBAL)
+
+
+@receiver(pre_save, sender=UserProfile)
+def normalize_avatar(sender, instance, raw=False, **kwargs):
+    """Store a new avatar normalized and remember the previous file for clean-up"""
+    instance._avatar_previous = None
+    if raw:
+        return
+    if instance.pk and not instance._state.adding:
+        instance._avatar_previous = sender.objects.filter(pk=instance.pk).values_list('avatar', flat=True).first()
+    if instance.avatar and not avatars.digest_of(instance.avatar.name):
+        avatars.normalize_field(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+def remove_replaced_avatar(sender, instance, raw=False, **kwargs):
+    """Delete the previous avatar file once nothing uses it"""
+    if raw:
+        return
+    name = instance.avatar.name if instance.avatar else ''
+    previous = getattr(instance, '_avatar_previous', None)
+    transaction.on_commit(lambda: avatars.remember(instance.user_id, name))
+    if previous and previous != name:
+        transaction.on_commit(lambda: avatars.purge(previous))
+
+
+@receiver(post_delete, sender=UserProfile)
+def remove_deleted_avatar(sender, instance, **kwargs):
+    """Delete a deleted profile's avatar file once nothing uses it"""
+    name = instance.avatar.name if instance.avatar else ''
+    transaction.on_commit(lambda: avatars.remember(instance.user_id, ''))
+    if name:
+        transaction.on_commit(lambda: avatars.purge(name))
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_home_currency(sender, instance, raw=False, **kwargs):
+    """Load the stored currency so post_save can tell whether it changed"""
+    instance._currency_previous = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._currency_previous = sender.objects.filter(pk=instance.pk).values_list('currency', flat=True).first()
+
+
+@receiver(post_save, sender=UserProfile)
+def rebuild_on_home_currency_change(sender, instance, created, raw=False, **kwargs):
+    """Totals are kept in the home currency, so a new one means rebuilding the user's rollups"""
+    if raw:
+        return
+    user_id, previous = instance.user_id, getattr(instance, '_currency_previous', None)
+    if created or previous is None or previous == instance.currency:
+        return
+    transaction.on_commit(lambda: tasks.enqueue('rebuild_rollups', params={'user_ids': [user_id]}))
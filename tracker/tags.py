@@ -0,0 +1,85 @@
+"""
+Expense tags.
+
+Tags are rows of ``Tag``, unique per user, linked to expenses through
+``ExpenseTag``. Names are normalised (trimmed, single-spaced, lower case) so
+"Work" and " work " are the same tag. Filtering and per-tag totals are joins
+on the ``(user, name)`` and ``(tag, expense)`` indexes.
+"""
+from collections import defaultdict
+
+from .models import ExpenseTag, Tag
+
+MAX_TAG_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def normalize(name):
+    return ' '.join(name.split()).lower()[:MAX_TAG_LENGTH].strip()
+
+
+def parse_tags(value):
+    """Split a comma-separated string into unique, normalised tag names"""
+    names = []
+    for part in (value or '').split(','):
+        name = normalize(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def get_or_create_tags(user_id, names):
+    """Return ``{name: tag id}`` for a user's tags, creating missing ones in one insert"""
+    names = set(names)
+    if not names:
+        return {}
+    tag_ids = dict(Tag.objects.filter(user_id=user_id, name__in=names).values_list('name', 'pk'))
+    missing = names - tag_ids.keys()
+    if missing:
+        Tag.objects.bulk_create([Tag(user_id=user_id, name=name) for name in missing], ignore_conflicts=True)
+        tag_ids.update(Tag.objects.filter(user_id=user_id, name__in=missing).values_list('name', 'pk'))
+    return tag_ids
+
+
+def set_tags(expense, names):
+    """Replace the tags of a saved expense"""
+    tag_ids = get_or_create_tags(expense.user_id, names)
+    expense.tags.set(tag_ids.values())
+
+
+def add_tags(user_id, expense_names):
+    """Tag freshly inserted expenses from ``(expense, [names])`` pairs in bulk"""
+    expense_names = [(expense, names) for expense, names in expense_names if names]
+    if not expense_names:
+        return
+    tag_ids = get_or_create_tags(user_id, {name for _, names in expense_names for name in names})
+    ExpenseTag.objects.bulk_create(
+        [ExpenseTag(expense_id=expense.pk, tag_id=tag_ids[name])
+         for expense, names in expense_names for name in names],
+        ignore_conflicts=True,
+    )
+
+
+def copy_tags(occurrences):
+    """Give generated recurring occurrences the tags of their templates"""
+    template_tags = defaultdict(list)
+    links = ExpenseTag.objects.filter(
+        expense_id__in={occurrence.recurring_source_id for occurrence in occurrences}
+    ).values_list('expense_id', 'tag_id')
+    for expense_id, tag_id in links:
+        template_tags[expense_id].append(tag_id)
+    ExpenseTag.objects.bulk_create(
+        [ExpenseTag(expense_id=occurrence.pk, tag_id=tag_id)
+         for occurrence in occurrences for tag_id in template_tags[occurrence.recurring_source_id]],
+        ignore_conflicts=True,
+    )
+
+
+def tag_names(expense_ids):
+    """Return ``{expense id: [tag names]}`` for many expenses in one query"""
+    names = defaultdict(list)
+    links = ExpenseTag.objects.filter(expense_id__in=expense_ids).values_list(
+        'expense_id', 'tag__name'
+    ).order_by('tag__name')
+    for expense_id, name in links:
+        names[expense_id].append(name)
+    return names
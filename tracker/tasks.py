@@ -0,0 +1,235 @@
+"""
+Database-backed background tasks.
+
+Long jobs (exports, imports, PDF reports, rollup rebuilds) are queued as
+Task rows with ``enqueue()`` and picked up by ``manage.py run_tasks``, so no
+external broker is needed. A worker claims a pending task with a
+conditional UPDATE, which only one worker can win, runs its handler and
+stores the outcome on the row:
+
+- progress: handlers call ``report_progress()``, which also refreshes the
+  heartbeat that shows the worker is alive
+- results: handlers call ``save_result()``; files are stored under
+  MEDIA_ROOT/tasks/<user id>/<task id>/ and served by ``task_download``
+- timeouts: an attempt running longer than ``task.timeout`` seconds is
+  interrupted with TaskTimeout (SIGALRM, so on POSIX systems only)
+- retries: a failed attempt is retried after an exponential backoff until
+  ``max_attempts`` is reached; TaskError fails the task immediately
+- crashed workers: running tasks whose heartbeat is older than their
+  timeout are treated as a failed attempt by ``recover_stale()``
+
+Handlers are registered with ``@handler('kind')``; the built-in ones are in
+tracker.jobs, imported when the app is ready.
+
+Settings: ``TRACKER_TASK_TIMEOUT``, ``TRACKER_TASK_MAX_ATTEMPTS`` and
+``TRACKER_TASK_RETRY_DELAY`` (seconds before the first retry, doubled for
+each further attempt).
+"""
+import logging
+import signal
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+# Progress is written at most this often (seconds), unless it completes
+PROGRESS_INTERVAL = 1.0
+
+# Extra seconds past its timeout before a silent running task is recovered
+STALE_GRACE = 60
+
+
+class TaskError(Exception):
+    """Permanent failure; the task is not retried"""
+
+
+class TaskTimeout(Exception):
+    """The attempt ran past the task's timeout"""
+
+
+def default_timeout():
+    return getattr(settings, 'TRACKER_TASK_TIMEOUT', 600)
+
+
+def default_max_attempts():
+    return getattr(settings, 'TRACKER_TASK_MAX_ATTEMPTS', 3)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying after ``attempts`` failed attempts"""
+    return getattr(settings, 'TRACKER_TASK_RETRY_DELAY', 30) * 2 ** (attempts - 1)
+
+
+def handler(kind):
+    """Register ``func(task)`` as the handler for tasks of ``kind``"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, user=None, params=None, timeout=None, max_attempts=None, delay=None):
+    """Queue a task and return it; with a ``delay`` (timedelta) it runs no sooner than that"""
+    if kind not in HANDLERS:
+        raise ValueError(f'No task handler registered for "{kind}"')
+    return Task.objects.create(
+        kind=kind,
+        user=user,
+        params=params or {},
+        timeout=timeout or default_timeout(),
+        max_attempts=max_attempts or default_max_attempts(),
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+
+
+def claim(worker):
+    """Mark the next due pending task as running for ``worker`` and return it, or None"""
+    now = timezone.now()
+    candidates = Task.objects.filter(
+        status=Task.PENDING, run_after__lte=now
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        # Only one worker can move the row out of pending
+        claimed = Task.objects.filter(pk=pk, status=Task.PENDING).update(
+            status=Task.RUNNING,
+            worker=worker,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+            progress=0,
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def report_progress(task, done, total=None, message=None):
+    """Record progress (``done`` of ``total``, or a percentage when total is None)"""
+    percent = done if total is None else int(done * 100 / total) if total else 100
+    percent = max(0, min(100, percent))
+    now = time.monotonic()
+    if percent < 100 and now - getattr(task, '_progress_written', 0) < PROGRESS_INTERVAL:
+        return
+    task._progress_written = now
+    task.progress = percent
+    fields = {'progress': percent, 'heartbeat_at': timezone.now()}
+    if message is not None:
+        task.message = fields['message'] = message[:200]
+    Task.objects.filter(pk=task.pk).update(**fields)
+
+
+def save_result(task, filename, fileobj):
+    """Store ``fileobj`` as the task's downloadable result"""
+    if task.result:
+        task.result.delete(save=False)
+    task.result.save(filename, File(fileobj), save=False)
+    Task.objects.filter(pk=task.pk).update(result=task.result.name)
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise TaskTimeout in the block after ``seconds`` (POSIX main thread only)"""
+    if not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expired(signum, frame):
+        raise TaskTimeout(f'Timed out after {seconds} seconds')
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run(task):
+    """Run a claimed task's handler and record success, a retry or failure"""
+    func = HANDLERS.get(task.kind)
+    # Like the claim, only touch the row while this worker still owns it:
+    # a recovered task may already be queued again or run elsewhere
+    owned = {'status': Task.RUNNING, 'worker': task.worker}
+    try:
+        if func is None:
+            raise TaskError(f'No task handler registered for "{task.kind}"')
+        with time_limit(task.timeout):
+            func(task)
+    except Exception as error:
+        retry = not isinstance(error, TaskError)
+        logger.warning('Task %s attempt %d failed: %s', task, task.attempts, error)
+        updated = fail(task, traceback.format_exc(), retry=retry, only_if=owned)
+    else:
+        updated = Task.objects.filter(pk=task.pk, **owned).update(
+            status=Task.SUCCEEDED, progress=100, error='', finished_at=timezone.now()
+        )
+    if not updated:
+        logger.warning('Task %s was recovered while %s ran it; its outcome is dropped', task, task.worker)
+    task.refresh_from_db()
+    return task
+
+
+def fail(task, error, retry=True, only_if=None):
+    """
+    Put a failed attempt back in the queue, or fail the task once out of
+    attempts. ``only_if`` are lookups the row must still match, checked in
+    the same UPDATE; returns whether the task was updated.
+    """
+    now = timezone.now()
+    rows = Task.objects.filter(pk=task.pk, **(only_if or {}))
+    if retry and task.attempts < task.max_attempts:
+        updated = rows.update(
+            status=Task.PENDING,
+            error=error,
+            run_after=now + timedelta(seconds=retry_delay(task.attempts)),
+            worker='',
+        )
+    else:
+        updated = rows.update(status=Task.FAILED, error=error, finished_at=now)
+    return updated > 0
+
+
+def recover_stale(now=None):
+    """Fail or requeue running tasks whose worker stopped sending heartbeats"""
+    now = now or timezone.now()
+    recovered = 0
+    for task in Task.objects.filter(status=Task.RUNNING):
+        if task.heartbeat_at and now - task.heartbeat_at < timedelta(seconds=task.timeout + STALE_GRACE):
+            continue
+        # Only recover the task if no worker touched it in the meantime
+        if fail(task, f'Worker {task.worker} stopped responding',
+                only_if={'status': Task.RUNNING, 'heartbeat_at': task.heartbeat_at}):
+            recovered += 1
+    return recovered
+
+
+def work(worker, once=False, poll=1.0, should_stop=lambda: False):
+    """Claim and run tasks until ``should_stop()``; with ``once``, stop when the queue is empty"""
+    processed = 0
+    last_recovery = 0
+    while not should_stop():
+        if time.monotonic() - last_recovery > STALE_GRACE:
+            recover_stale()
+            last_recovery = time.monotonic()
+        task = claim(worker)
+        if task is None:
+            if once:
+                break
+            time.sleep(poll)
+            continue
+        run(task)
+        processed += 1
+    return processed
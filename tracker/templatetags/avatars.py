@@ -0,0 +1,31 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import format_html
+
+from tracker.avatars import avatar_sizes, user_digest
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar_img(user, size=32, css_class='rounded-circle'):
+    """
+    <img> of the user's avatar at ``size`` pixels, with a double size
+    variant for high density screens; empty when the user has none.
+
+    Usage: {% load avatars %}{% avatar_img user 32 %}
+    """
+    if not user.is_authenticated:
+        return ''
+    digest = user_digest(user)
+    if not digest:
+        return ''
+    sizes = avatar_sizes()
+    # The smallest fixed size covering the requested one, and twice that
+    src = min((s for s in sizes if s >= size), default=max(sizes))
+    retina = min((s for s in sizes if s >= 2 * size), default=max(sizes))
+    return format_html(
+        '<img src="{}" srcset="{} 2x" width="{}" height="{}" alt="{}" class="{}" decoding="async">',
+        reverse('avatar', args=[digest, src]), reverse('avatar', args=[digest, retina]),
+        size, size, user.get_username(), css_class,
+    )
@@ -0,0 +1,35 @@
+from django import template
+from django.utils.html import format_html
+
+from tracker.receipts import receipt_sources
+
+register = template.Library()
+
+# Receipts are shown as a thumbnail column in lists and about half the page
+# width on narrow screens
+DEFAULT_SIZES = '(max-width: 576px) 50vw, 160px'
+
+
+@register.simple_tag
+def receipt_img(expense, sizes=DEFAULT_SIZES, css_class='img-thumbnail'):
+    """
+    Lazily loaded <img> for an expense's receipt, offering the thumbnails in
+    ``srcset`` so the browser fetches the smallest one that fits ``sizes``.
+
+    Usage: {% load receipts %}{% receipt_img expense sizes="320px" %}
+    """
+    sources = receipt_sources(expense)
+    if sources is None:
+        return ''
+    if not sources['srcset']:
+        # Not processed yet: no thumbnails or known dimensions
+        return format_html(
+            '<img src="{}" alt="Receipt for {}" class="{}" loading="lazy" decoding="async">',
+            sources['url'], expense.title, css_class,
+        )
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="Receipt for {}" '
+        'class="{}" loading="lazy" decoding="async">',
+        sources['url'], sources['srcset'], sizes, sources['width'], sources['height'],
+        expense.title, css_class,
+    )
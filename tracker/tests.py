@@ -1,3 +1,1288 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core import mail
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse, StreamingHttpResponse
+from django.contrib.auth.models import User
+from django.template import Context, Template
+from django.db import connection, transaction
+from django.db.utils import ConnectionHandler
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from expensetracker import db
+
+from . import (anomalies, avatars, benchmarks, budget_alerts, charts, checks, dashboard, fx, importers, insights,
+               query_plans, receipts, profiling, recurring, replicas, rollups, search, tasks)
+from .charts import ChartRange
+from .models import (Budget, BudgetAlert, BudgetPeriodSpend, Category, DataVersion, Expense, ExpenseCategoryStats,
+                     ExpenseRollup, FxRate, Income, Task, UserProfile)
+from .pagination import KeysetPaginator
+from .periods import period_window
+from .reports import report_summary
+from .signals import transactions_bulk_created
+from .tags import set_tags
+from .views import _analytics_data
+
+
+class ViewQueryBudgetTests(TestCase):
+    """
+    Every tracker URL stays within its declared query budget.
+
+    Seeds TRACKER_BENCHMARK_SCALE expenses (default 1k); larger scales and
+    timing reports are run with ``manage.py benchmark_views``.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        scale = os.environ.get('TRACKER_BENCHMARK_SCALE', '1k')
+        cls.fixture = benchmarks.seed(benchmarks.SCALES.get(scale) or int(scale))
+
+    def test_every_url_has_a_case(self):
+        self.assertEqual(benchmarks.uncovered_urls(), [])
+
+    def test_views_within_query_budget(self):
+        for row in benchmarks.run_cases(self.fixture, repeat=1):
+            with self.subTest(view=row['view']):
+                self.assertLess(row['status'], 400)
+                self.assertLessEqual(row['queries'], row['budget'])
+
+    def test_view_queries_use_indexes(self):
+        problems = query_plans.check_cases(self.fixture)
+        self.assertEqual([(label, scans) for label, _, scans in problems], [])
+
+    def test_keyset_pages_seek_through_the_index(self):
+        paginator = KeysetPaginator(Expense.objects.filter(user=self.fixture.user), 10)
+        cursor = paginator.page().next_cursor
+        queryset = paginator.queryset.order_by(*paginator.ordering).filter(paginator.seek(paginator.decode(cursor)))
+        plan = query_plans.explain(*queryset[:11].query.sql_with_params())
+        # The index range starts at the cursor's date instead of the user's newest row
+        self.assertTrue(any('(user_id=? AND date<?)' in step for step in plan), plan)
+
+    def test_full_scans_are_detected(self):
+        query = Expense.objects.filter(title='Coffee').values('id').query
+        plan = query_plans.explain(*query.sql_with_params())
+        self.assertEqual(query_plans.full_scans(plan), ['SCAN tracker_expense'])
+
+
+class CompareReportsTests(TestCase):
+
+    def report(self, queries, time_ms):
+        return {'results': [{'view': 'dashboard', 'queries': queries, 'time_ms': time_ms}]}
+
+    def test_more_queries_is_a_regression(self):
+        regressions = benchmarks.compare_reports(self.report(5, 10.0), self.report(6, 10.0))
+        self.assertEqual(regressions, ['dashboard: 5 -> 6 queries'])
+
+    def test_slowdown_beyond_tolerance_is_a_regression(self):
+        self.assertEqual(benchmarks.compare_reports(self.report(5, 20.0), self.report(5, 25.0)), [])
+        self.assertEqual(
+            benchmarks.compare_reports(self.report(5, 20.0), self.report(5, 40.0)),
+            ['dashboard: 20.0 -> 40.0 ms'],
+        )
+
+
+class CacheCheckTests(SimpleTestCase):
+
+    @override_settings(DEBUG=False)
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual([warning.id for warning in checks.check_tracker_cache(None)], ['tracker.W001'])
+        with override_settings(CACHES={'tracker': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                   'LOCATION': tempfile.gettempdir()}}):
+            self.assertEqual(checks.check_tracker_cache(None), [])
+
+
+class DataVersionTests(TestCase):
+
+    def test_worker_writes_invalidate_other_processes(self):
+        user = User.objects.create_user('versions', password='secret')
+        food = Category.objects.create(name='Food')
+        self.client.force_login(user)
+        first = self.client.get('/api/dashboard/?fields=totals')
+        self.assertEqual(self.client.get('/api/dashboard/?fields=totals',
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # A task worker process has a cache of its own
+        worker_cache = LocMemCache('worker', {})
+        with mock.patch('tracker.cache.get_cache', return_value=worker_cache), \
+                self.captureOnCommitCallbacks(execute=True):
+            Expense.objects.create(user=user, title='Lunch', amount=Decimal('12.00'), category=food,
+                                   date=timezone.localdate())
+        second = self.client.get('/api/dashboard/?fields=totals', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['totals']['total_expenses'], 12.0)
+
+    def test_hits_and_misses_are_reported(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        before = self.client.get(reverse('profiling_stats')).json()['cache']
+        for _ in range(2):
+            self.client.get('/api/dashboard/?fields=totals')
+        after = self.client.get(reverse('profiling_stats')).json()['cache']
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+
+@override_settings(TRACKER_PROFILING=True, TRACKER_PROFILING_SAMPLE_RATE=1.0)
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        profiling.store.reset()
+        self.request = RequestFactory().get('/')
+
+    def view(self, request):
+        list(Category.objects.all())
+        return HttpResponse('ok')
+
+    def test_sync_chain_is_profiled(self):
+        middleware = profiling.ProfilingMiddleware(self.view)
+        self.assertFalse(iscoroutinefunction(middleware))
+        response = middleware(self.request)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual(profiling.store.summary()['unresolved']['sampled'], 1)
+
+    def test_async_chain_is_profiled(self):
+        async def view(request):
+            return await sync_to_async(self.view)(request)
+
+        middleware = profiling.ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(self.request)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual(profiling.store.summary()['unresolved']['sampled'], 1)
+
+
+@mock.patch('tracker.replicas.replica_aliases', return_value=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        self.session = SessionStore()
+
+    def request(self, view):
+        """Run ``view`` through the middleware and return the alias it read from"""
+        aliases = []
+
+        def recording_view(request):
+            aliases.append(self.router.db_for_read(Category))
+            view(request)
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.session = self.session
+        replicas.ReadYourWritesMiddleware(replicas.replica_reads(recording_view))(request)
+        return aliases[0]
+
+    def write(self, request):
+        self.assertEqual(self.router.db_for_write(Category), 'default')
+
+    def test_replica_views_read_from_replica(self, _):
+        self.assertEqual(self.request(lambda request: None), 'replica')
+        self.assertNotIn(replicas.SESSION_KEY, self.session)
+
+    def test_session_reads_primary_after_write(self, _):
+        self.request(self.write)
+        self.assertIn(replicas.SESSION_KEY, self.session)
+        self.assertEqual(self.request(lambda request: None), 'default')
+
+    def test_session_returns_to_replica_after_window(self, _):
+        self.request(self.write)
+        self.session[replicas.SESSION_KEY] -= replicas.read_your_writes_window()
+        self.assertEqual(self.request(lambda request: None), 'replica')
+
+    def test_reads_after_write_in_request_use_primary(self, _):
+        after_write = []
+
+        def view(request):
+            self.write(request)
+            after_write.append(self.router.db_for_read(Category))
+
+        self.assertEqual(self.request(view), 'replica')
+        self.assertEqual(after_write, ['default'])
+
+    def test_cache_versions_read_from_primary(self, _):
+        aliases = []
+
+        def view(request):
+            aliases.append(self.router.db_for_read(DataVersion))
+
+        self.assertEqual(self.request(view), 'replica')
+        self.assertEqual(aliases, ['default'])
+
+    def test_outside_requests_use_primary(self, _):
+        self.assertEqual(self.router.db_for_read(Category), 'default')
+
+
+def _succeed(task):
+    tasks.report_progress(task, 5, 10, 'halfway')
+    tasks.save_result(task, 'result.txt', io.BytesIO(b'done'))
+
+
+def _crash(task):
+    raise RuntimeError('boom')
+
+
+def _reject(task):
+    raise tasks.TaskError('bad parameters')
+
+
+def _hang(task):
+    time.sleep(5)
+
+
+@mock.patch.dict(tasks.HANDLERS, {'succeed': _succeed, 'crash': _crash, 'reject': _reject, 'hang': _hang})
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root, TRACKER_TASK_RETRY_DELAY=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('tasks')
+
+    def test_success_stores_progress_and_result(self):
+        task = tasks.enqueue('succeed', self.user)
+        self.assertEqual(tasks.work('test', once=True), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.progress, task.message), (Task.SUCCEEDED, 100, 'halfway'))
+        self.assertEqual(task.result.read(), b'done')
+        self.assertTrue(task.result.name.startswith(f'tasks/{self.user.pk}/{task.pk}/'))
+
+    def test_failures_are_retried_until_max_attempts(self):
+        task = tasks.enqueue('crash', self.user, max_attempts=2)
+        self.assertEqual(tasks.run(tasks.claim('test')).status, Task.PENDING)
+        task = tasks.run(tasks.claim('test'))
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertIn('boom', task.error)
+        self.assertIsNone(tasks.claim('test'))
+
+    def test_retry_waits_for_backoff(self):
+        with self.settings(TRACKER_TASK_RETRY_DELAY=60):
+            tasks.enqueue('crash', self.user)
+            tasks.run(tasks.claim('test'))
+        self.assertIsNone(tasks.claim('test'))
+
+    def test_task_error_is_not_retried(self):
+        tasks.enqueue('reject', self.user)
+        task = tasks.run(tasks.claim('test'))
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 1))
+
+    def test_timeout_interrupts_attempt(self):
+        tasks.enqueue('hang', self.user, timeout=1, max_attempts=1)
+        start = time.monotonic()
+        task = tasks.run(tasks.claim('test'))
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIn('TaskTimeout', task.error)
+
+    def test_claimed_task_is_not_claimed_again(self):
+        tasks.enqueue('succeed', self.user)
+        self.assertIsNotNone(tasks.claim('first'))
+        self.assertIsNone(tasks.claim('second'))
+
+    def test_stale_running_task_is_requeued(self):
+        task = tasks.enqueue('succeed', self.user, timeout=10)
+        tasks.claim('gone')
+        later = timezone.now() + timedelta(seconds=10 + tasks.STALE_GRACE + 1)
+        self.assertEqual(tasks.recover_stale(later), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+
+    def test_outcome_of_recovered_attempt_is_dropped(self):
+        later = timezone.now() + timedelta(seconds=10 + tasks.STALE_GRACE + 1)
+
+        def recovered(task):
+            # The attempt outlives its timeout and is requeued, then claimed again
+            tasks.recover_stale(later)
+            Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+            tasks.claim('other')
+
+        def recovered_then_crash(task):
+            recovered(task)
+            _crash(task)
+
+        for handler in (recovered, recovered_then_crash):
+            with self.subTest(handler=handler), mock.patch.dict(tasks.HANDLERS, {'slow': handler}):
+                tasks.enqueue('slow', self.user, timeout=10)
+                task = tasks.run(tasks.claim('first'))
+                self.assertEqual((task.status, task.worker, task.attempts), (Task.RUNNING, 'other', 2))
+                task.delete()
+
+    def test_heartbeat_during_recovery_keeps_task_running(self):
+        task = tasks.enqueue('succeed', self.user, timeout=10)
+        tasks.claim('slow')
+        later = timezone.now() + timedelta(seconds=10 + tasks.STALE_GRACE + 1)
+        fail = tasks.fail
+
+        def heartbeat_first(*args, **kwargs):
+            # The worker reports progress between the stale check and the update
+            tasks.report_progress(Task.objects.get(pk=task.pk), 50)
+            return fail(*args, **kwargs)
+
+        with mock.patch.object(tasks, 'fail', side_effect=heartbeat_first):
+            self.assertEqual(tasks.recover_stale(later), 0)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.worker), (Task.RUNNING, 'slow'))
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('rollups')
+        self.food = Category.objects.create(name='Food')
+        self.travel = Category.objects.create(name='Travel')
+
+    def assertRollupsMatch(self):
+        """Every monthly and daily rollup row equals a fresh aggregate of the transactions"""
+        for model, (rollup_model, group_field) in rollups.ROLLUPS.items():
+            for rollup, period_field, period in [(rollup_model, 'month', TruncMonth('date')),
+                                                 (rollups.DAILY_ROLLUPS[model], 'day', F('date'))]:
+                expected = {
+                    (row['user_id'], row[group_field], row[period_field]): (row['total'], row['count'])
+                    for row in model.objects.values('user_id', group_field, **{period_field: period}).annotate(
+                        total=Sum(fx.converted()), count=Count('id')
+                    ).order_by()
+                }
+                stored = {
+                    (row['user_id'], row[group_field], row[period_field]): (row['total'], row['count'])
+                    for row in rollup.objects.values('user_id', group_field, period_field, 'total', 'count')
+                }
+                self.assertEqual(stored, expected, rollup.__name__)
+
+    def expense(self, amount, day, category=None):
+        return Expense.objects.create(user=self.user, title='Spend', amount=Decimal(amount),
+                                      category=category or self.food, date=day)
+
+    def test_writes_keep_rollups_current(self):
+        lunch = self.expense('12.50', date(2025, 1, 31))
+        self.expense('7.50', date(2025, 1, 31))
+        self.assertRollupsMatch()
+
+        lunch.amount = Decimal('20.00')
+        lunch.save()
+        self.assertRollupsMatch()
+
+        # Moved to another category, then into the next month
+        lunch.category = self.travel
+        lunch.save()
+        self.assertRollupsMatch()
+        lunch.date = date(2025, 2, 1)
+        lunch.save()
+        self.assertRollupsMatch()
+
+        lunch.delete()
+        self.assertRollupsMatch()
+        self.assertFalse(rollups.DAILY_ROLLUPS[Expense].objects.filter(day=date(2025, 2, 1)).exists())
+
+        salary = Income.objects.create(user=self.user, title='Salary', amount=Decimal('1000.00'),
+                                       source='salary', date=date(2025, 1, 1))
+        salary.source = 'freelance'
+        salary.save()
+        self.assertRollupsMatch()
+
+    def test_receiver_failure_rolls_back_the_write(self):
+        self.client.force_login(self.user)
+        lunch = self.expense('12.50', date(2025, 1, 31))
+        failing = mock.Mock(**{'index.side_effect': RuntimeError('index down')})
+        form = {'title': 'Dinner', 'amount': '30.00', 'category': self.food.pk, 'date': '2025-01-31',
+                'payment_method': 'card'}
+        with mock.patch('tracker.signals.get_search_backend', return_value=failing):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('add_expense'), form)
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('edit_expense', args=[lunch.pk]), dict(form, category=self.travel.pk))
+        self.assertEqual(list(Expense.objects.values_list('title', 'amount')), [('Spend', Decimal('12.50'))])
+        self.assertEqual(list(ExpenseRollup.objects.values_list('category_id', 'total', 'count')),
+                         [(self.food.pk, Decimal('12.50'), 1)])
+        self.assertRollupsMatch()
+
+    def test_bulk_create_and_rebuild_agree(self):
+        self.expense('5.00', date(2025, 3, 3))
+        created = Expense.objects.bulk_create([
+            Expense(user=self.user, title='Bulk', amount=Decimal(amount), category=category, date=day)
+            for amount, category, day in [('1.00', self.food, date(2025, 3, 3)),
+                                          ('2.00', self.travel, date(2025, 3, 4)),
+                                          ('3.00', self.food, date(2025, 4, 1))]
+        ])
+        transactions_bulk_created.send(sender=Expense, instances=created)
+        self.assertRollupsMatch()
+
+        incremental = list(ExpenseRollup.objects.order_by('category_id', 'month').values_list(
+            'category_id', 'month', 'total', 'count'
+        ))
+        rollups.rebuild_all([self.user])
+        self.assertRollupsMatch()
+        self.assertEqual(list(ExpenseRollup.objects.order_by('category_id', 'month').values_list(
+            'category_id', 'month', 'total', 'count'
+        )), incremental)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('pages')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Food')
+        Expense.objects.bulk_create([
+            Expense(user=self.user, title=f'Tie {n}', amount=Decimal('1.00'), category=category, date=date(2025, 5, 1))
+            for n in range(7)
+        ])
+        # Identical sort keys apart from the id tie-breaker
+        Expense.objects.update(created_at=timezone.now())
+
+    def test_cursor_walks_ties_without_gaps_or_duplicates(self):
+        seen, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get('/api/expenses/', {'cursor': cursor, 'limit': 3})
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.json()['results']]
+            cursor = response.json()['next_cursor']
+        self.assertEqual(seen, list(Expense.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_bad_cursor_is_rejected(self):
+        def token(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+        cursors = [
+            'garbage!', '%%%', token('not a list'), token(['2025-05-01']), token([None, None, None]),
+            token(['2025-13-45', '2025-05-01T00:00:00Z', 1]), token(['2025-05-01', {'a': 1}, 1]),
+            token(['2025-05-01', '2025-05-01T00:00:00Z', 10 ** 30]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/expenses/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class ImporterTests(TestCase):
+
+    OFX_SGML = (
+        'OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+        '<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20250304120000\n<TRNAMT>-42.50\n<NAME>Grocer\n<MEMO>Weekly shop\n</STMTTRN>\n'
+        '<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20250305\n<TRNAMT>1000.00\n<NAME>Salary\n</STMTTRN>\n'
+        '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+    )
+    OFX_XML = (
+        '<?xml version="1.0"?>\n<?OFX OFXHEADER="200" VERSION="220"?>\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>'
+        '<BANKTRANLIST><STMTTRN><TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20250304120000</DTPOSTED>'
+        '<TRNAMT>-42.50</TRNAMT><NAME>Grocer</NAME><MEMO>Weekly shop</MEMO></STMTTRN>'
+        '<STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20250305</DTPOSTED><TRNAMT>1000.00</TRNAMT>'
+        '<NAME>Salary</NAME></STMTTRN></BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>'
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user('importer')
+        self.food = Category.objects.create(name='Food')
+
+    def run_csv(self, text, **kwargs):
+        importer = importers.ExpenseImporter(self.user, default_category=self.food, **kwargs)
+        return importer.import_file(io.BytesIO(text.encode()), 'csv')
+
+    def test_row_errors_and_deposits(self):
+        result = self.run_csv(
+            'Date,Narration,Debit,Credit\n'
+            '2025-03-01,Lunch,12.50,\n'
+            'yesterday,Dinner,20.00,\n'
+            '2025-03-02,Taxi,ten,\n'
+            '2025-03-03,Refund,,15.00\n'
+            '2025-03-04,Salary,0.00,1000.00\n'
+            '2025-03-05,Nothing,0.00,\n'
+        )
+        self.assertEqual((result.created, result.skipped, result.error_count), (1, 2, 3))
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 7])
+        self.assertIn('date: "yesterday" is not a recognised date', result.errors[0][1])
+        self.assertIn('amount: "ten" is not a number', result.errors[1][1])
+        self.assertIn('amount:', result.errors[2][1])
+        self.assertEqual(list(Expense.objects.values_list('title', 'amount')), [('Lunch', Decimal('12.50'))])
+
+    def test_ofx_sgml_and_xml_read_alike(self):
+        sgml = list(importers.parse_ofx(io.BytesIO(self.OFX_SGML.encode())))
+        xml = list(importers.parse_ofx(io.BytesIO(self.OFX_XML.encode())))
+        self.assertEqual(sgml, xml)
+        self.assertEqual(sgml, [
+            (1, {'date': '20250304', 'title': 'Grocer', 'amount': '-42.50', 'description': 'Weekly shop'}),
+            (2, {'credit': '1000.00'}),
+        ])
+        result = importers.ExpenseImporter(self.user, default_category=self.food).import_file(
+            io.BytesIO(self.OFX_SGML.encode()), 'ofx'
+        )
+        self.assertEqual((result.created, result.skipped), (1, 1))
+        self.assertEqual(Expense.objects.get().amount, Decimal('42.50'))
+
+    def test_new_categories_are_reused_across_batches(self):
+        result = self.run_csv(
+            'Date,Title,Amount,Category\n'
+            '2025-03-01,Bus,2.00,Transport\n'
+            '2025-03-02,Train,5.00,transport\n'
+            '2025-03-03,Taxi,9.00,TRANSPORT\n',
+            batch_size=1,
+        )
+        self.assertEqual((result.created, result.categories_created), (3, 1))
+        transport = Category.objects.get(name__iexact='transport')
+        self.assertEqual(transport.name, 'Transport')
+        self.assertEqual(Expense.objects.filter(category=transport).count(), 3)
+
+    def test_import_queries_do_not_grow_with_rows(self):
+        Budget.objects.create(user=self.user, category=self.food, amount=Decimal('1000.00'), period_type='monthly',
+                              start_date=date(2025, 1, 1))
+        lines = ['Date,Title,Amount,Category']
+        for n in range(1200):
+            day = date(2025, 1, 1) + timedelta(days=n % 180)
+            lines.append(f'{day},Row {n},{n % 50 + 1}.00,{["Food", "Travel", "Bills"][n % 3]}')
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_csv('\n'.join(lines) + '\n')
+        self.assertEqual(result.created, 1200)
+        # Two batches over six months: besides the expense INSERTs (chunked by the
+        # database's parameter limit) a budget seed per month, everything else set-based
+        other = [query for query in queries if not query['sql'].startswith('INSERT INTO "tracker_expense" ')]
+        self.assertLessEqual(len(other), 70)
+        self.assertEqual(
+            ExpenseRollup.objects.aggregate(total=Sum('total'), count=Sum('count')),
+            Expense.objects.aggregate(total=Sum('amount'), count=Count('id')),
+        )
+        self.assertEqual(sum(ExpenseCategoryStats.objects.values_list('count', flat=True)), 1200)
+        self.assertEqual(BudgetPeriodSpend.objects.get(period_start=date(2025, 2, 1)).spent,
+                         Expense.objects.filter(category=self.food, date__month=2).aggregate(Sum('amount'))['amount__sum'])
+
+    def test_failed_batch_leaves_no_categories(self):
+        with mock.patch('tracker.importers.add_tags', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.run_csv('Date,Title,Amount,Category\n2025-03-01,Bus,2.00,Transport\n')
+        self.assertFalse(Category.objects.filter(name='Transport').exists())
+        self.assertFalse(Expense.objects.exists())
+
+
+class PeriodWindowTests(SimpleTestCase):
+
+    def test_day_based_windows_follow_the_anchor(self):
+        anchor = date(2025, 1, 1)  # a Wednesday
+        self.assertEqual(period_window('weekly', anchor, date(2025, 1, 15)), (date(2025, 1, 15), date(2025, 1, 22)))
+        self.assertEqual(period_window('weekly', anchor, date(2025, 1, 21)), (date(2025, 1, 15), date(2025, 1, 22)))
+        self.assertEqual(period_window('daily', anchor, date(2025, 3, 9)), (date(2025, 3, 9), date(2025, 3, 10)))
+
+    def test_yearly_window_follows_the_anchor(self):
+        anchor = date(2024, 3, 15)
+        self.assertEqual(period_window('yearly', anchor, date(2025, 3, 14)), (date(2024, 3, 15), date(2025, 3, 15)))
+        self.assertEqual(period_window('yearly', anchor, date(2025, 3, 15)), (date(2025, 3, 15), date(2026, 3, 15)))
+
+    def test_future_anchor_gives_the_first_period(self):
+        for period_type, end in [('daily', date(2025, 6, 2)), ('weekly', date(2025, 6, 8)),
+                                 ('monthly', date(2025, 7, 1)), ('yearly', date(2026, 6, 1))]:
+            with self.subTest(period_type=period_type):
+                self.assertEqual(period_window(period_type, date(2025, 6, 1), date(2025, 5, 1)), (date(2025, 6, 1), end))
+
+    def test_yearly_window_from_leap_day(self):
+        anchor = date(2024, 2, 29)
+        self.assertEqual(period_window('yearly', anchor, date(2025, 2, 27)), (date(2024, 2, 29), date(2025, 2, 28)))
+        self.assertEqual(period_window('yearly', anchor, date(2025, 2, 28)), (date(2025, 2, 28), date(2026, 2, 28)))
+        self.assertEqual(period_window('yearly', anchor, date(2028, 3, 1)), (date(2028, 2, 29), date(2029, 2, 28)))
+
+
+class RecurringTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('recurring')
+        self.category = Category.objects.create(name='Bills')
+
+    def template(self, period, day):
+        return Expense.objects.create(user=self.user, title='Rent', amount=Decimal('100.00'), category=self.category,
+                                      date=day, is_recurring=True, recurring_period=period)
+
+    def occurrences(self, template):
+        return list(Expense.objects.filter(recurring_source=template).order_by('date').values_list('date', flat=True))
+
+    def test_month_end_is_clamped_and_restored(self):
+        monthly = self.template('monthly', date(2024, 1, 31))
+        yearly = self.template('yearly', date(2024, 2, 29))
+        recurring.materialize(until=date(2028, 3, 1))
+        self.assertEqual(self.occurrences(monthly)[:3], [date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)])
+        self.assertEqual(self.occurrences(yearly),
+                         [date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29)])
+
+    def test_rerun_creates_nothing(self):
+        template = self.template('weekly', date(2025, 1, 1))
+        first = recurring.materialize(until=date(2025, 3, 1))
+        second = recurring.materialize(until=date(2025, 3, 1))
+        self.assertEqual((first.created[Expense], second.created[Expense]), (8, 0))
+        self.assertEqual(len(self.occurrences(template)), 8)
+        template.refresh_from_db()
+        self.assertEqual(template.recurring_last_date, date(2025, 2, 26))
+
+    def test_occurrences_per_run_are_capped(self):
+        template = self.template('daily', date(2020, 1, 1))
+        until = date(2020, 1, 1) + timedelta(days=recurring.MAX_OCCURRENCES_PER_RUN + 10)
+        self.assertEqual(recurring.materialize(until=until).created[Expense], recurring.MAX_OCCURRENCES_PER_RUN)
+        self.assertEqual(recurring.materialize(until=until).created[Expense], 10)
+        self.assertEqual(self.occurrences(template)[-1], until)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        search.forget_search_backend()
+        self.backend = search.get_search_backend()
+        if not isinstance(self.backend, search.SQLiteFTS5Backend):
+            self.skipTest('SQLite FTS5 is not available')
+        self.user = User.objects.create_user('searcher')
+        self.category = Category.objects.create(name='Groceries')
+
+    def expense(self, title, description=None, user=None):
+        return Expense.objects.create(user=user or self.user, title=title, description=description,
+                                      amount=Decimal('5.00'), category=self.category, date=date(2025, 4, 1))
+
+    def titles(self, query):
+        return [expense.title for expense in self.backend.search(self.user, query)[:]]
+
+    def test_title_matches_rank_first(self):
+        self.expense('Market run', description='coffee and milk')
+        self.expense('Coffee beans')
+        self.expense('Coffee', user=User.objects.create_user('other'))
+        self.assertEqual(self.titles('coffee'), ['Coffee beans', 'Market run'])
+        self.assertEqual(self.backend.search(self.user, 'coffee').count(), 2)
+
+    def test_words_match_as_prefixes(self):
+        self.expense('Coffee beans')
+        self.expense('Coffee cup')
+        self.assertEqual(self.titles('cof bea'), ['Coffee beans'])
+        self.assertEqual(sorted(self.titles('groc')), ['Coffee beans', 'Coffee cup'])
+
+    def test_index_follows_edits_and_deletes(self):
+        expense = self.expense('Coffee beans')
+        expense.title = 'Tea leaves'
+        expense.save()
+        self.assertEqual(self.titles('coffee'), [])
+        self.assertEqual(self.titles('tea'), ['Tea leaves'])
+
+        self.category.name = 'Drinks'
+        self.category.save()
+        self.assertEqual(self.titles('drinks'), ['Tea leaves'])
+        self.assertEqual(self.titles('groceries'), [])
+
+        expense.delete()
+        self.assertEqual(self.titles('tea'), [])
+
+    def test_fallback_is_detected_again(self):
+        search.forget_search_backend()
+        with mock.patch.object(connection.introspection, 'table_names', return_value=[]):
+            self.assertIsInstance(search.get_search_backend(), search.DatabaseSearchBackend)
+        self.assertIsInstance(search.get_search_backend(), search.DatabaseSearchBackend)
+        later = time.monotonic() + search.DETECT_INTERVAL
+        with mock.patch('tracker.search.time.monotonic', return_value=later):
+            self.assertIsInstance(search.get_search_backend(), search.SQLiteFTS5Backend)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        self.client.force_login(self.user)
+        self.food = Category.objects.create(name='Food')
+        self.travel = Category.objects.create(name='Travel')
+        dinner = Expense.objects.create(user=self.user, title='Dinner, "late"', amount=Decimal('30.00'),
+                                        category=self.food, date=date(2025, 2, 10), payment_method='card')
+        set_tags(dinner, ['work', 'team'])
+        Expense.objects.create(user=self.user, title='Train', amount=Decimal('8.00'), category=self.travel,
+                               date=date(2025, 3, 5), location='Pune')
+        Expense.objects.create(user=User.objects.create_user('other'), title='Hidden', amount=Decimal('1.00'),
+                               category=self.food, date=date(2025, 2, 10))
+
+    def export(self, **filters):
+        response = self.client.get(reverse('export_expenses'), filters)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="expenses.csv"')
+        return b''.join(response.streaming_content).decode()
+
+    def test_rows_are_streamed_and_escaped(self):
+        content = self.export()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ['Date', 'Title', 'Category', 'Amount', 'Currency', 'Payment Method',
+                                   'Description', 'Tags', 'Location'])
+        self.assertEqual(rows[1], ['2025-03-05', 'Train', 'Travel', '8.00', 'INR', 'Cash', '', '', 'Pune'])
+        self.assertEqual(rows[2][:4], ['2025-02-10', 'Dinner, "late"', 'Food', '30.00'])
+        self.assertEqual(sorted(rows[2][7].split(', ')), ['team', 'work'])
+        self.assertIn('"Dinner, ""late"""', content)
+        self.assertEqual(len(rows), 3)
+
+    def test_filters_limit_rows(self):
+        def titles(**filters):
+            return [row[1] for row in list(csv.reader(io.StringIO(self.export(**filters))))[1:]]
+
+        self.assertEqual(titles(date_from='2025-03-01'), ['Train'])
+        self.assertEqual(titles(date_to='2025-02-28'), ['Dinner, "late"'])
+        self.assertEqual(titles(category=self.travel.pk), ['Train'])
+        self.assertEqual(titles(tag='Work'), ['Dinner, "late"'])
+        self.assertEqual(titles(tag='work, holiday'), [])
+
+
+class ChartDataTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('charts')
+        self.client.force_login(self.user)
+        food = Category.objects.create(name='Food', color='#ff0000')
+        for day, amount in [(date(2025, 3, 3), '10.00'), (date(2025, 3, 4), '5.00'), (date(2025, 3, 17), '20.00'),
+                            (date(2024, 12, 31), '7.00')]:
+            Expense.objects.create(user=self.user, title='Meal', amount=Decimal(amount), category=food, date=day)
+        Income.objects.create(user=self.user, title='Pay', amount=Decimal('100.00'), source='salary',
+                              date=date(2025, 3, 1))
+
+    def totals(self, granularity, start, end):
+        response = self.client.get(reverse('expense_chart_data'),
+                                   {'granularity': granularity, 'start': start, 'end': end})
+        self.assertEqual(response.status_code, 200)
+        return [(row['period'], row['total']) for row in response.json()['data']]
+
+    def test_buckets_per_granularity_with_empty_ones_zero(self):
+        self.assertEqual(self.totals('day', '2025-03-02', '2025-03-05'), [
+            ('2025-03-02', 0.0), ('2025-03-03', 10.0), ('2025-03-04', 5.0), ('2025-03-05', 0.0),
+        ])
+        # Weeks start on Monday; a window starting midweek only counts its own days
+        self.assertEqual(self.totals('week', '2025-03-04', '2025-03-23'), [
+            ('2025-03-03', 5.0), ('2025-03-10', 0.0), ('2025-03-17', 20.0),
+        ])
+        self.assertEqual(self.totals('month', '2024-12-01', '2025-03-31'), [
+            ('2024-12-01', 7.0), ('2025-01-01', 0.0), ('2025-02-01', 0.0), ('2025-03-01', 35.0),
+        ])
+        self.assertEqual(self.totals('year', '2024-01-01', '2025-12-31'), [('2024-01-01', 7.0), ('2025-01-01', 35.0)])
+
+    def test_bad_params_are_rejected(self):
+        for params in [{'months': 'six'}, {'months': '0'}, {'months': '121'}, {'granularity': 'hour'},
+                       {'start': '2025-13-01'}, {'start': '2025-03-10', 'end': '2025-03-01'},
+                       {'granularity': 'day', 'start': '2000-01-01', 'end': '2025-01-01'}]:
+            for name in ('expense_chart_data', 'monthly_trend_data'):
+                with self.subTest(view=name, params=params):
+                    response = self.client.get(reverse(name), params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.json())
+
+    def test_one_grouped_query_per_model(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('monthly_trend_data'), {'start': '2024-12-01', 'end': '2025-03-31'})
+        self.assertEqual(response.json()['expenses'], [7.0, 0.0, 0.0, 35.0])
+        self.assertEqual(response.json()['income'], [0.0, 0.0, 0.0, 100.0])
+        for table in ('tracker_expense', 'tracker_income'):
+            with self.subTest(table=table):
+                self.assertEqual(len([query for query in queries if f'FROM "{table}"' in query['sql']]), 1)
+
+    def test_async_views_match_the_sync_queries(self):
+        params = {'start': '2024-12-01', 'end': '2025-03-31'}
+        chart_range = ChartRange.from_params(params, default_months=12)
+        expenses = charts.series(Expense.objects.filter(user=self.user), chart_range)
+        income = charts.series(Income.objects.filter(user=self.user), chart_range)
+        self.assertEqual(async_to_sync(charts.aseries)(Expense.objects.filter(user=self.user), chart_range), expenses)
+        self.assertEqual(self.client.get(reverse('expense_chart_data'), params).json()['data'], [
+            {'month': label, 'period': bucket.isoformat(), 'total': total}
+            for bucket, label, total in zip(chart_range.buckets, chart_range.labels, expenses)
+        ])
+        self.assertEqual(self.client.get(reverse('monthly_trend_data'), params).json(), {
+            'labels': chart_range.labels, 'periods': [bucket.isoformat() for bucket in chart_range.buckets],
+            'expenses': expenses, 'income': income, 'granularity': 'month',
+        })
+        categories = Expense.objects.filter(user=self.user).values('category__name', 'category__color').annotate(
+            total=Sum(fx.converted())).order_by('-total')[:10]
+        self.assertEqual(self.client.get(reverse('category_chart_data')).json(), {
+            'labels': [item['category__name'] for item in categories],
+            'data': [float(item['total']) for item in categories],
+            'colors': [item['category__color'] for item in categories],
+        })
+
+
+class DashboardApiTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dashboard')
+        self.client.force_login(self.user)
+        food = Category.objects.create(name='Food', color='#ff0000')
+        today = timezone.localdate()
+        for amount in ('12.50', '30.00'):
+            Expense.objects.create(user=self.user, title='Groceries', amount=Decimal(amount), category=food, date=today)
+        Income.objects.create(user=self.user, title='Pay', amount=Decimal('500.00'), source='salary', date=today)
+
+    def get(self, **params):
+        return self.client.get(reverse('dashboard_api'), params)
+
+    def test_fields_pick_the_widgets(self):
+        self.assertEqual(list(self.get().json()), dashboard.FIELDS)
+        data = self.get(fields='trend, totals').json()
+        self.assertEqual(list(data), ['totals', 'trend'])
+        self.assertEqual(data['totals']['monthly_expenses'], 42.5)
+        self.assertEqual(data['totals']['monthly_balance'], 457.5)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.get(fields='totals,secrets')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: secrets', response.json()['error'])
+
+    def test_months_are_validated(self):
+        self.assertEqual(len(self.get(fields='trend', months='3').json()['trend']['labels']), 3)
+        for months in ('three', '0', '121'):
+            with self.subTest(months=months):
+                response = self.get(fields='trend', months=months)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_gzip_only_when_accepted(self):
+        plain = self.get()
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.client.get(reverse('dashboard_api'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+
+
+class TagTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tagger')
+        self.client.force_login(self.user)
+        food = Category.objects.create(name='Food')
+        self.expenses = {}
+        for title, amount, tags in [('Lunch', '12.00', ['work']), ('Taxi', '20.00', ['work', 'travel']),
+                                    ('Snack', '3.00', [])]:
+            self.expenses[title] = Expense.objects.create(user=self.user, title=title, amount=Decimal(amount),
+                                                          category=food, date=date(2025, 4, 1))
+            set_tags(self.expenses[title], tags)
+
+    def test_filter_by_tags(self):
+        def titles(tag):
+            response = self.client.get(reverse('expense_list_api'), {'tag': tag})
+            return sorted(row['title'] for row in response.json()['results'])
+
+        self.assertEqual(titles(' Work '), ['Lunch', 'Taxi'])
+        self.assertEqual(titles('work, travel'), ['Taxi'])
+        self.assertEqual(titles('holiday'), [])
+
+    def test_per_tag_totals(self):
+        totals = {row['tag__name']: (row['total'], row['count']) for row in _analytics_data(self.user)['tag_data']}
+        self.assertEqual(totals, {'work': (Decimal('32.00'), 2), 'travel': (Decimal('20.00'), 1)})
+
+
+class TagMigrationTests(TransactionTestCase):
+    """The 0006 data migration turns comma-separated tag strings into Tag rows"""
+
+    before = [('tracker', '0005_recurring_occurrences')]
+    after = [('tracker', '0006_tag_expensetag')]
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_tag_strings_are_split_trimmed_and_deduplicated(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model('auth', 'User').objects.create(username='legacy')
+        category = apps.get_model('tracker', 'Category').objects.create(name='Food')
+        OldExpense = apps.get_model('tracker', 'Expense')
+        for title, tags in [('Lunch', ' Work ,work,  Team  Lunch'), ('Taxi', 'TRAVEL, work,,'), ('Snack', '')]:
+            OldExpense.objects.create(user=user, title=title, amount=Decimal('1.00'), category=category,
+                                      date=date(2025, 4, 1), tags=tags)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        Tag = apps.get_model('tracker', 'Tag')
+        ExpenseTag = apps.get_model('tracker', 'ExpenseTag')
+        self.assertEqual(sorted(Tag.objects.values_list('name', flat=True)), ['team lunch', 'travel', 'work'])
+        links = sorted(ExpenseTag.objects.values_list('expense__title', 'tag__name'))
+        self.assertEqual(links, [('Lunch', 'team lunch'), ('Lunch', 'work'), ('Taxi', 'travel'), ('Taxi', 'work')])
+
+
+class DatabaseProfileTests(SimpleTestCase):
+
+    def open(self, environ):
+        """A connection to a scratch file configured like DATABASES['default'] would be"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        handler = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.dummy'},
+            'profile': db.database_settings(directory, environ=environ, name=os.path.join(directory, 'db.sqlite3')),
+        })
+        connection = handler['profile']
+        self.addCleanup(connection.close)
+        return connection
+
+    def pragmas(self, connection):
+        with connection.cursor() as cursor:
+            return {name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                    for name in ('journal_mode', 'busy_timeout', 'synchronous')}
+
+    def test_profiles_configure_new_connections(self):
+        tuned = self.open({'DB_PROFILE': 'tuned'})
+        self.assertEqual(self.pragmas(tuned), {'journal_mode': 'wal', 'busy_timeout': 5000, 'synchronous': 1})
+        self.assertEqual(tuned.settings_dict['CONN_MAX_AGE'], 60)
+        default = self.open({'DB_PROFILE': 'default'})
+        self.assertEqual(self.pragmas(default)['journal_mode'], 'delete')
+        self.assertEqual(self.pragmas(default)['synchronous'], 2)
+        self.assertEqual(default.settings_dict['CONN_MAX_AGE'], 0)
+
+    def test_environment_overrides(self):
+        connection = self.open({'DB_PROFILE': 'tuned', 'SQLITE_BUSY_TIMEOUT': '1234', 'SQLITE_SYNCHRONOUS': 'FULL',
+                                'DB_CONN_MAX_AGE': ''})
+        self.assertEqual(self.pragmas(connection), {'journal_mode': 'wal', 'busy_timeout': 1234, 'synchronous': 2})
+        self.assertIsNone(connection.settings_dict['CONN_MAX_AGE'])
+        with self.assertRaises(ValueError):
+            db.profile_settings(environ={'DB_PROFILE': 'fast'})
+
+    def test_tuned_transactions_begin_immediate(self):
+        connection = self.open({'DB_PROFILE': 'tuned'})
+        # atomic() looks connections up by alias; hand it the scratch one
+        with mock.patch('django.db.transaction.get_connection', return_value=connection):
+            with CaptureQueriesContext(connection) as queries, transaction.atomic(using='profile'):
+                connection.cursor().execute('SELECT 1')
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+class ReportSummaryTests(TestCase):
+
+    def test_ranges_combine_monthly_and_daily_rollups(self):
+        user = User.objects.create_user('reports')
+        food = Category.objects.create(name='Food')
+        for day, amount in [(date(2024, 1, 31), '10.00'), (date(2024, 2, 10), '20.00'),
+                            (date(2024, 5, 2), '30.00'), (date(2024, 5, 20), '40.00')]:
+            Expense.objects.create(user=user, title='Meal', amount=Decimal(amount), category=food, date=day)
+        Income.objects.create(user=user, title='Pay', amount=Decimal('500.00'), source='salary', date=date(2024, 3, 1))
+        # Moving an expense within its month only changes the daily rollups
+        moved = Expense.objects.get(date=date(2024, 5, 20))
+        moved.date = date(2024, 5, 1)
+        moved.save()
+
+        summary = report_summary(user, date(2024, 1, 31), date(2024, 5, 1))
+        self.assertEqual((summary['total_expenses'], summary['expenses_count']), (Decimal('70.00'), 3))
+        self.assertEqual(summary['net_savings'], Decimal('430.00'))
+        summary = report_summary(user, date(2024, 2, 1), date(2024, 4, 30))
+        self.assertEqual((summary['total_expenses'], summary['total_income']), (Decimal('20.00'), Decimal('500.00')))
+
+    @override_settings(TEMPLATES=benchmarks.benchmark_templates(settings.TEMPLATES))
+    def test_malformed_dates_fall_back_to_this_month(self):
+        self.client.force_login(User.objects.create_user('reports'))
+        response = self.client.get(reverse('reports'), {'start_date': 'bogus', 'end_date': '2024-05-01'})
+        self.assertEqual(response.status_code, 200)
+        today = timezone.now().date()
+        self.assertEqual((response.context['start_date'], response.context['end_date']), (today.replace(day=1), today))
+        self.assertEqual([str(message) for message in response.context['messages']], ['Enter dates as YYYY-MM-DD.'])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class BudgetAlertTests(TestCase):
+
+    def test_each_threshold_alerts_once_per_period(self):
+        user = User.objects.create_user('alerts', email='alerts@example.com')
+        UserProfile.objects.create(user=user, currency='EUR')
+        food = Category.objects.create(name='Food')
+        today = timezone.localdate()
+        budget = Budget.objects.create(user=user, category=food, amount=Decimal('100.00'),
+                                       period_type='monthly', start_date=today.replace(day=1))
+
+        def spend(amount):
+            with self.captureOnCommitCallbacks(execute=True):
+                return Expense.objects.create(user=user, title='Meal', amount=Decimal(amount), category=food, date=today)
+
+        spend('50.00')
+        spend('35.00')
+        lunch = spend('10.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            lunch.delete()
+        spend('30.00')
+        self.assertEqual(list(BudgetAlert.objects.order_by('threshold').values_list('threshold', 'spent')),
+                         [(80, Decimal('85.00')), (100, Decimal('115.00'))])
+        self.assertEqual(Task.objects.filter(kind='send_budget_alerts').count(), 1)
+
+        tasks.work('test', once=True)
+        message, = mail.outbox
+        self.assertEqual(message.to, ['alerts@example.com'])
+        self.assertIn('€115.00 of €100.00', message.body)
+        self.assertFalse(BudgetAlert.objects.filter(sent_at__isnull=True).exists())
+
+        # A write that skips the signals is caught by the nightly reconcile
+        Expense.objects.filter(user=user, amount=Decimal('50.00')).update(amount=Decimal('5.00'))
+        self.assertEqual(budget_alerts.reconcile(), (1, 1, 0))
+        self.assertEqual(BudgetPeriodSpend.objects.get(budget=budget).spent, Decimal('70.00'))
+
+
+    def test_admin_budget_labels_do_not_query_per_budget(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        food = Category.objects.create(name='Food')
+
+        def add_budgets(count):
+            for _ in range(count):
+                user = User.objects.create_user(f'owner{User.objects.count()}')
+                UserProfile.objects.create(user=user, currency='EUR')
+                budget = Budget.objects.create(user=user, category=food, amount=Decimal('100.00'),
+                                               period_type='monthly', start_date=date(2025, 1, 1))
+                BudgetAlert.objects.create(budget=budget, period_start=date(2025, 1, 1), threshold=80,
+                                           spent=Decimal('80.00'), budget_amount=Decimal('100.00'))
+
+        def queries(url):
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(captured)
+
+        add_budgets(2)
+        urls = [reverse('admin:tracker_budget_changelist'), reverse('admin:tracker_budgetalert_changelist'),
+                reverse('admin:tracker_budgetalert_add')]
+        for url in urls:
+            # The first visit also runs one-off lookups such as content types
+            queries(url)
+        before = [queries(url) for url in urls]
+        add_budgets(3)
+        self.assertEqual([queries(url) for url in urls], before)
+        self.assertContains(self.client.get(urls[2]), '€100.00/monthly')
+
+
+@override_settings(TRACKER_FX_BASE_CURRENCY='INR')
+class CurrencyTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(fx.rates_changed)
+        loaded, errors = fx.load_csv(io.StringIO(
+            'date,currency,rate\n'
+            '2025-01-01,USD,80\n'
+            '2025-01-10,USD,82.5\n'
+            '2025-01-01,EUR,90\n'
+            '2025-01-05,XYZ,1\n'
+        ))
+        self.assertEqual((loaded, errors), (3, [(5, 'currency: unknown currency "XYZ"')]))
+        fx.rates_changed()
+
+    def test_rates_are_looked_up_by_date(self):
+        table = fx.rate_table()
+        self.assertEqual(table.rate('USD', date(2024, 12, 1)), Decimal('80'))
+        self.assertEqual(table.rate('USD', date(2025, 1, 9)), Decimal('80'))
+        self.assertEqual(table.rate('USD', date(2025, 1, 10)), Decimal('82.5'))
+        self.assertEqual(table.rate('INR', date(2025, 1, 10)), 1)
+        self.assertIsNone(table.rate('GBP', date(2025, 1, 10)))
+        self.assertEqual(table.convert(Decimal('9.00'), 'EUR', 'USD', date(2025, 1, 3)), Decimal('10.13'))
+
+        # Replaced rates reach a process once its next version check is due
+        fx.load_csv(io.BytesIO(b'date,currency,rate\n2025-01-10,USD,83\n'))
+        self.assertEqual(FxRate.objects.get(currency='USD', date=date(2025, 1, 10)).rate, Decimal('83'))
+        self.assertIs(fx.rate_table(), table)
+        later = time.monotonic() + fx.VERSION_CHECK_INTERVAL
+        with mock.patch.object(fx.time, 'monotonic', return_value=later):
+            self.assertEqual(fx.rate_table().rate('USD', date(2025, 1, 10)), Decimal('83'))
+
+    def test_totals_are_in_the_home_currency(self):
+        user = User.objects.create_user('traveller', password='secret')
+        UserProfile.objects.create(user=user)
+        food = Category.objects.create(name='Food')
+        for amount, currency, day in [('10.00', 'USD', 2), ('10.00', 'USD', 12), ('5.00', 'INR', 12), ('3.00', 'GBP', 12)]:
+            Expense.objects.create(user=user, title='Meal', amount=Decimal(amount), currency=currency,
+                                   category=food, date=date(2025, 1, day))
+        expected = Decimal('800.00') + Decimal('825.00') + Decimal('5.00') + Decimal('3.00')
+        self.assertEqual(ExpenseRollup.objects.get(user=user).total, expected)
+        self.assertEqual(Expense.objects.aggregate(total=Sum(fx.converted()))['total'], expected)
+        self.assertEqual(Expense.objects.filter(currency='INR').aggregate(total=Sum(fx.converted('USD')))['total'],
+                         Decimal('0.06'))
+
+        # A new home currency rebuilds the user's totals
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=user)
+            profile.currency = 'USD'
+            profile.save()
+        tasks.work('test', once=True)
+        self.assertEqual(ExpenseRollup.objects.get(user=user).total, Decimal('23.06'))
+
+
+class AnomalyTests(TestCase):
+
+    def test_outliers_are_flagged_when_written(self):
+        user = User.objects.create_user('anomalies', password='secret')
+        food = Category.objects.create(name='Food')
+        for amount in ['10.00', '12.00', '11.00', '9.00', '10.50']:
+            Expense.objects.create(user=user, title='Meal', amount=Decimal(amount), category=food, date=date(2025, 1, 1))
+        self.client.force_login(user)
+        self.client.post('/expenses/add/', {
+            'title': 'Banquet', 'amount': '250.00', 'category': food.pk,
+            'date': '2025-01-02', 'payment_method': 'cash',
+        })
+        banquet = Expense.objects.get(title='Banquet')
+        self.assertGreater(banquet.anomaly_score, 3)
+        self.assertEqual(anomalies.explain(banquet)['category_mean'], 50.42)
+        self.assertEqual(list(anomalies.recent(user)), [banquet])
+
+        # Corrected to an ordinary amount, it is scored again without itself
+        banquet.amount = Decimal('11.50')
+        banquet.save()
+        self.assertIsNone(Expense.objects.get(pk=banquet.pk).anomaly_score)
+        Expense.objects.filter(amount=Decimal('9.00')).delete()
+        stats = ExpenseCategoryStats.objects.get(user=user, category=food)
+        amounts = [10.0, 12.0, 11.0, 10.5, 11.5]
+        mean = sum(amounts) / len(amounts)
+        self.assertEqual(stats.count, 5)
+        self.assertAlmostEqual(stats.mean, mean)
+        self.assertAlmostEqual(stats.m2, sum((amount - mean) ** 2 for amount in amounts))
+        self.assertEqual(anomalies.rebuild([user]), 1)
+
+
+@skipUnless(insights.available(), 'NumPy is not installed')
+class InsightsTests(TestCase):
+
+    def test_statistics_match_the_expenses(self):
+        user = User.objects.create_user('insights', password='secret')
+        food = Category.objects.create(name='Food')
+        today = timezone.localdate()
+        # Ten ordinary meals and one far above them
+        for offset, amount in enumerate(['400.00'] + ['10.00'] * 5 + ['12.00'] * 5):
+            Expense.objects.create(user=user, title='Meal', amount=Decimal(amount), category=food,
+                                   date=today - timedelta(days=offset), payment_method='upi' if offset else 'card')
+
+        data = insights.compute(insights.load_columns(user), today)
+        self.assertEqual(data['count'], 11)
+        self.assertEqual(data['trend']['days'][-1], today.isoformat())
+        self.assertEqual(data['trend']['totals'][-1], 400.0)
+        self.assertEqual(data['trend']['rolling_7'][-1], round((400 + 10 * 5 + 12) / 7, 2))
+        self.assertEqual(data['percentiles']['p50'], 12.0)
+        self.assertEqual([row['amount'] for row in data['anomalies']], [400.0])
+        self.assertEqual(data['payment_methods'][0], {'payment_method': 'card', 'total': 400.0, 'share': 78.4})
+
+        self.client.force_login(user)
+        anomaly, = self.client.get('/api/analytics/').json()['anomalies']
+        self.assertEqual((anomaly['category'], anomaly['category_mean']), ('Food', 46.36))
+
+    def test_forecast_follows_the_monthly_trend(self):
+        today = date(2025, 7, 15)
+        months = insights.np.array(['2025-01-10', '2025-02-10', '2025-03-10', '2025-04-10',
+                                    '2025-05-10', '2025-06-10'], dtype='datetime64[D]')
+        columns = insights.Columns(
+            ids=insights.np.arange(6), days=months, amounts=insights.np.arange(1.0, 7.0) * 100,
+            categories=insights.np.ones(6, dtype=int), methods=insights.np.zeros(6, dtype=int),
+        )
+        forecast, = insights.forecasts(columns, today)
+        self.assertEqual((forecast['forecast'], forecast['trend'], forecast['last_month']), (700.0, 100.0, 600.0))
+
+
+class ReceiptProcessingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root, TRACKER_RECEIPT_MAX_SIDE=1000)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('receipts', password='secret')
+        self.category = Category.objects.create(name='Food')
+        self.client.force_login(self.user)
+        # A landscape photo with EXIF saying it must be rotated to portrait
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera maker'
+        photo = io.BytesIO()
+        Image.linear_gradient('L').resize((1600, 1200)).convert('RGB').save(photo, 'JPEG', exif=exif)
+        self.photo = photo.getvalue()
+
+    def upload(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/expenses/add/', {
+                'title': title, 'amount': '12.50', 'category': self.category.pk,
+                'date': '2025-01-15', 'payment_method': 'cash',
+                'receipt_image': SimpleUploadedFile('receipt.jpg', self.photo, 'image/jpeg'),
+            })
+        return Expense.objects.get(title=title)
+
+    def test_upload_is_processed_in_background(self):
+        expense = self.upload('Lunch')
+        original = expense.receipt_image.name
+        self.assertFalse(receipts.is_processed(original))
+        self.assertEqual(tasks.work('test', once=True), 1)
+
+        expense.refresh_from_db()
+        self.assertTrue(receipts.is_processed(expense.receipt_image.name))
+        self.assertEqual((expense.receipt_width, expense.receipt_height), (750, 1000))
+        with Image.open(expense.receipt_image) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (750, 1000)))
+            self.assertEqual(dict(image.getexif()), {})
+        for width in (160, 320, 640):
+            self.assertTrue(default_storage.exists(receipts.variant_name(expense.receipt_image.name, width)))
+        self.assertFalse(default_storage.exists(original))
+
+    def test_same_photo_is_stored_once(self):
+        first = self.upload('Lunch')
+        second = self.upload('Dinner')
+        self.assertEqual(tasks.work('test', once=True), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.receipt_image.name, second.receipt_image.name)
+
+    def test_receipt_img_offers_thumbnails(self):
+        expense = self.upload('Lunch')
+        template = Template('{% load receipts %}{% receipt_img expense %}')
+        self.assertNotIn('srcset', template.render(Context({'expense': expense})))
+        tasks.work('test', once=True)
+        expense.refresh_from_db()
+        html = template.render(Context({'expense': expense}))
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('/320.webp 320w', html)
+        self.assertIn('/full.webp 750w', html)
+
+
+class AvatarTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, TRACKER_AVATAR_CACHE_DIR=os.path.join(self.media_root, 'cache')
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('avatars', password='secret')
+        self.client.force_login(self.user)
+
+    def upload(self, color):
+        photo = io.BytesIO()
+        Image.new('RGB', (900, 600), color).save(photo, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/profile/edit/', {
+                'avatar': SimpleUploadedFile('me.jpg', photo.getvalue(), 'image/jpeg'),
+            })
+        return UserProfile.objects.get(user=self.user).avatar
+
+    def test_upload_is_normalized_and_replaced_file_removed(self):
+        first = self.upload('red')
+        with Image.open(first) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (avatars.MASTER_SIZE, avatars.MASTER_SIZE)))
+        second = self.upload('blue')
+        self.assertNotEqual(first.name, second.name)
+        self.assertFalse(default_storage.exists(first.name))
+        self.assertEqual(avatars.user_digest(self.user), avatars.digest_of(second.name))
+
+    def test_resized_variants_are_cached_and_evicted(self):
+        digest = avatars.digest_of(self.upload('red').name)
+        response = self.client.get(f'/avatars/{digest}/32.webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (32, 32))
+        self.assertEqual(self.client.get(f'/avatars/{digest}/33.webp').status_code, 404)
+
+        self.client.get(f'/avatars/{digest}/64.webp')
+        # The 32px variant was used more recently
+        os.utime(avatars._cache_path(digest, 64), (1, 1))
+        self.assertEqual(avatars.trim_cache(max_bytes=os.path.getsize(avatars.variant_path(digest, 32))), 1)
+        self.assertTrue(os.path.exists(avatars._cache_path(digest, 32)))
+        self.assertFalse(os.path.exists(avatars._cache_path(digest, 64)))
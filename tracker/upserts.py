@@ -0,0 +1,67 @@
+"""
+Set-based upserts for counter tables.
+
+Rollups, category stats and budget spend counters are updated by adding a
+change to a row that may not exist yet. ``upsert()`` writes a whole batch of
+such changes with one ``INSERT ... ON CONFLICT (key) DO UPDATE`` statement
+per chunk (SQLite 3.24+ and PostgreSQL), instead of an UPDATE per row plus a
+create-and-retry for missing rows. The SET expressions read the stored row's
+old values, so concurrent writers add up instead of overwriting each other.
+"""
+from django.db import connection
+
+# Chunks are further limited by the database's maximum number of parameters
+UPSERT_BATCH_SIZE = 500
+
+
+class _Columns:
+    """Format helper: ``{old.total}``/``{new.total}`` name a field's stored/inserted column"""
+
+    def __init__(self, model, table):
+        self.model = model
+        self.table = table
+
+    def __getattr__(self, name):
+        column = connection.ops.quote_name(self.model._meta.get_field(name).column)
+        return f'{self.table}.{column}'
+
+
+def added(*fields):
+    """SET expressions adding the inserted values of ``fields`` to the stored ones"""
+    return {field: f'{{old.{field}}} + {{new.{field}}}' for field in fields}
+
+
+def upsert(model, rows, unique_fields, updates):
+    """
+    Insert ``rows`` (dicts of field values) into ``model``'s table. A row
+    conflicting on ``unique_fields`` updates the stored one instead, setting
+    each field of ``updates`` to its SQL expression, in which ``{old.field}``
+    and ``{new.field}`` stand for the stored and the inserted value.
+    """
+    if not rows:
+        return
+    opts = model._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    fields = [opts.get_field(name) for name in rows[0]]
+    columns = ', '.join(quote(field.column) for field in fields)
+    conflict = ', '.join(quote(opts.get_field(name).column) for name in unique_fields)
+    formats = {'old': _Columns(model, table), 'new': _Columns(model, 'excluded')}
+    assignments = ', '.join(
+        f'{quote(opts.get_field(name).column)} = {expression.format(**formats)}'
+        for name, expression in updates.items()
+    )
+    placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    batch_size = min(UPSERT_BATCH_SIZE, connection.ops.bulk_batch_size(fields, rows) or UPSERT_BATCH_SIZE)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(row[name], connection)
+                for row in chunk for name, field in zip(row, fields)
+            ]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([placeholder] * len(chunk))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {assignments}',
+                params,
+            )
@@ -13,10 +13,12 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('avatars/<str:digest>/<int:size>.webp', views.avatar, name='avatar'),
     
     # Expense management
     path('expenses/', views.expense_list, name='expense_list'),
     path('expenses/add/', views.add_expense, name='add_expense'),
+    path('expenses/import/', views.import_expenses, name='import_expenses'),
     path('expenses/<int:pk>/edit/', views.edit_expense, name='edit_expense'),
     path('expenses/<int:pk>/delete/', views.delete_expense, name='delete_expense'),
     path('expenses/<int:pk>/detail/', views.expense_detail, name='expense_detail'),
@@ -43,11 +45,22 @@ urlpatterns = [
     path('analytics/', views.analytics, name='analytics'),
     path('reports/', views.reports, name='reports'),
     path('reports/export/', views.export_expenses, name='export_expenses'),
+    path('reports/pdf/', views.report_pdf, name='report_pdf'),
+    
+    # Background tasks
+    path('tasks/', views.task_list, name='task_list'),
+    path('tasks/<int:pk>/download/', views.task_download, name='task_download'),
     
     # API endpoints for AJAX
+    path('api/dashboard/', views.dashboard_api, name='dashboard_api'),
+    path('api/analytics/', views.analytics_api, name='analytics_api'),
     path('api/expense-chart-data/', views.expense_chart_data, name='expense_chart_data'),
     path('api/category-chart-data/', views.category_chart_data, name='category_chart_data'),
     path('api/monthly-trend-data/', views.monthly_trend_data, name='monthly_trend_data'),
+    path('api/expenses/', views.expense_list_api, name='expense_list_api'),
+    path('api/income/', views.income_list_api, name='income_list_api'),
+    path('api/tasks/<int:pk>/', views.task_status, name='task_status'),
+    path('api/profiling/', views.profiling_stats, name='profiling_stats'),
     
     # Search and filters
     path('search/', views.search_expenses, name='search_expenses'),
@@ -1,20 +1,39 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Sum, Count, Q
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Sum, Count
 from django.db.models.functions import TruncMonth, TruncDay
+from django.core.files.storage import default_storage
 from django.core.paginator import Paginator
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_POST
+from django.urls import reverse
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
-import json
-import csv
-from io import StringIO
-from .models import Expense, Income, Category, Budget, UserProfile
+import os
+from .models import Expense, Income, Category, Budget, UserProfile, ExpenseRollup, ExpenseTag, Task
+from . import anomalies, avatars, fx, insights, rollups, tasks
+from .budgets import evaluate_budgets
+from .exports import EXPORT_FORMATS, expense_rows, stream_csv
+from .importers import ExpenseImporter, detect_format, inline_import_limit, store_upload
+from .receipts import receipt_sources
+from .reports import report_summary
+from .search import get_search_backend
+from .pagination import InvalidCursor, KeysetPaginator, paginate_request
+from . import charts, profiling
+from .charts import ChartRange
+from .dashboard import DashboardData, parse_fields
+from .replicas import replica_reads
+from .cache import cached_for_user, cached_user_view, conditional_user_view, request_version
+from . import cache as tracker_cache
 from .forms import (CustomUserCreationForm, ExpenseForm, IncomeForm, 
-                   CategoryForm, BudgetForm, UserProfileForm, ExpenseFilterForm)
+                   CategoryForm, BudgetForm, UserProfileForm, ExpenseFilterForm,
+                   ExpenseImportForm)
 
 def home(request):
     """Landing page"""
@@ -26,58 +45,31 @@ def home(request):
 def dashboard(request):
     """Main dashboard with overview"""
     # Get current month data
-    current_month = timezone.now().replace(day=1)
-    next_month = (current_month + timedelta(days=32)).replace(day=1)
+    current_month = timezone.localdate().replace(day=1)
     
-    # Total expenses and income for current month
-    monthly_expenses = Expense.objects.filter(
-        user=request.user,
-        date__gte=current_month,
-        date__lt=next_month
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    monthly_income = Income.objects.filter(
-        user=request.user,
-        date__gte=current_month,
-        date__lt=next_month
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    # Monthly and all-time totals come from the rollup tables
+    totals = rollups.month_totals(request.user, current_month)
+    monthly_expenses = totals['monthly_expenses']
+    monthly_income = totals['monthly_income']
+    total_expenses = totals['total_expenses']
+    total_income = totals['total_income']
     
     # Recent transactions
-    recent_expenses = Expense.objects.filter(user=request.user)[:5]
+    recent_expenses = Expense.objects.filter(user=request.user).select_related('category')[:5]
     recent_income = Income.objects.filter(user=request.user)[:3]
+    unusual_expenses = anomalies.recent(request.user)
     
     # Category-wise spending for current month
-    category_expenses = Expense.objects.filter(
+    category_expenses = ExpenseRollup.objects.filter(
         user=request.user,
-        date__gte=current_month,
-        date__lt=next_month
+        month=current_month
     ).values('category__name', 'category__color').annotate(
-        total=Sum('amount')
+        total=Sum('total')
     ).order_by('-total')[:6]
     
     # Budget status
-    budgets = Budget.objects.filter(user=request.user, is_active=True)
-    budget_status = []
-    for budget in budgets:
-        spent = Expense.objects.filter(
-            user=request.user,
-            category=budget.category,
-            date__gte=current_month,
-            date__lt=next_month
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        percentage = float(spent / budget.amount * 100) if budget.amount > 0 else 0
-        budget_status.append({
-            'budget': budget,
-            'spent': spent,
-            'remaining': budget.amount - spent,
-            'percentage': percentage,
-            'status': 'danger' if percentage > 90 else 'warning' if percentage > 70 else 'success'
-        })
-    
-    # Quick stats
-    total_expenses = Expense.objects.filter(user=request.user).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    total_income = Income.objects.filter(user=request.user).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    budgets = Budget.objects.filter(user=request.user, is_active=True).select_related('category')
+    budget_status = evaluate_budgets(budgets)
     
     context = {
         'monthly_expenses': monthly_expenses,
@@ -88,6 +80,7 @@ def dashboard(request):
         'total_balance': total_income - total_expenses,
         'recent_expenses': recent_expenses,
         'recent_income': recent_income,
+        'unusual_expenses': unusual_expenses,
         'category_expenses': category_expenses,
         'budget_status': budget_status,
         'current_month': current_month.strftime('%B %Y'),
@@ -132,6 +125,22 @@ def edit_profile(request):
     
     return render(request, 'tracker/edit_profile.html', {'form': form})
 
+@condition(etag_func=lambda request, digest, size: f'{digest}-{size}')
+def avatar(request, digest, size):
+    """Serve an avatar at one of the fixed sizes; the URL changes with the image, so it never expires"""
+    if size not in avatars.avatar_sizes() or not avatars.digest_of(avatars.master_name(digest)):
+        raise Http404('No such avatar')
+    try:
+        if size == avatars.MASTER_SIZE:
+            image = default_storage.open(avatars.master_name(digest), 'rb')
+        else:
+            image = open(avatars.variant_path(digest, size), 'rb')
+    except FileNotFoundError:
+        raise Http404('No such avatar')
+    response = FileResponse(image, content_type='image/webp')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @login_required
 def expense_list(request):
     """List all expenses with filtering"""
@@ -139,33 +148,21 @@ def expense_list(request):
     filter_form = ExpenseFilterForm(request.GET)
     
     # Apply filters
-    if filter_form.is_valid():
-        if filter_form.cleaned_data.get('date_from'):
-            expenses = expenses.filter(date__gte=filter_form.cleaned_data['date_from'])
-        if filter_form.cleaned_data.get('date_to'):
-            expenses = expenses.filter(date__lte=filter_form.cleaned_data['date_to'])
-        if filter_form.cleaned_data.get('category'):
-            expenses = expenses.filter(category=filter_form.cleaned_data['category'])
-        if filter_form.cleaned_data.get('payment_method'):
-            expenses = expenses.filter(payment_method=filter_form.cleaned_data['payment_method'])
-        if filter_form.cleaned_data.get('amount_min'):
-            expenses = expenses.filter(amount__gte=filter_form.cleaned_data['amount_min'])
-        if filter_form.cleaned_data.get('amount_max'):
-            expenses = expenses.filter(amount__lte=filter_form.cleaned_data['amount_max'])
-    
-    # Pagination
-    paginator = Paginator(expenses, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    expenses = filter_form.filter_queryset(expenses)
     
     # Calculate totals
-    total_amount = expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    totals = expenses.aggregate(total=Sum(fx.converted()), count=Count('id'))
+    
+    # Pagination (?cursor= switches to keyset pagination)
+    page_obj = paginate_request(
+        request, expenses.select_related('category').prefetch_related('tags'), 10, count=totals['count']
+    )
     
     context = {
         'page_obj': page_obj,
         'filter_form': filter_form,
-        'total_amount': total_amount,
-        'expenses_count': expenses.count(),
+        'total_amount': totals['total'] or Decimal('0'),
+        'expenses_count': totals['count'],
     }
     
     return render(request, 'tracker/expenses/list.html', context)
@@ -174,15 +171,20 @@ def expense_list(request):
 def add_expense(request):
     """Add new expense"""
     if request.method == 'POST':
-        form = ExpenseForm(request.POST, request.FILES)
+        home = fx.home_currency(request.user.id)
+        form = ExpenseForm(request.POST, request.FILES, home_currency=home)
         if form.is_valid():
             expense = form.save(commit=False)
             expense.user = request.user
-            expense.save()
+            fx.remember_home(expense, home)
+            # The rollups, stats and counters updated by the receivers commit with the row
+            with transaction.atomic():
+                expense.save()
+                form.save_m2m()
             messages.success(request, f'Expense "{expense.title}" added successfully!')
             return redirect('expense_list')
     else:
-        form = ExpenseForm()
+        form = ExpenseForm(home_currency=fx.home_currency(request.user.id))
     
     return render(request, 'tracker/expenses/form.html', {
         'form': form,
@@ -190,6 +192,44 @@ def add_expense(request):
         'button_text': 'Add Expense'
     })
 
+@login_required
+def import_expenses(request):
+    """Import expenses from a CSV or OFX bank statement"""
+    result = None
+    if request.method == 'POST':
+        form = ExpenseImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            statement = form.cleaned_data['statement']
+            file_format = form.cleaned_data['file_format'] or detect_format(statement.name)
+            default_category = form.cleaned_data['default_category']
+            if statement.size > inline_import_limit():
+                # Large statements are imported by a background worker; a
+                # retry could import the rows of a failed attempt twice
+                tasks.enqueue('import_expenses', request.user, {
+                    'path': store_upload(request.user, statement),
+                    'name': statement.name,
+                    'file_format': file_format,
+                    'default_category': default_category.pk if default_category else None,
+                }, max_attempts=1)
+                messages.success(request, f'"{statement.name}" is being imported in the background.')
+                return redirect('task_list')
+            importer = ExpenseImporter(
+                request.user,
+                default_category=default_category
+            )
+            result = importer.import_file(statement, file_format)
+            if result.created:
+                messages.success(request, f'Imported {result.created} expenses from "{statement.name}".')
+            if result.error_count:
+                messages.warning(request, f'{result.error_count} rows could not be imported.')
+    else:
+        form = ExpenseImportForm()
+    
+    return render(request, 'tracker/expenses/import.html', {
+        'form': form,
+        'result': result,
+    })
+
 @login_required
 def edit_expense(request, pk):
     """Edit existing expense"""
@@ -198,7 +238,8 @@ def edit_expense(request, pk):
     if request.method == 'POST':
         form = ExpenseForm(request.POST, request.FILES, instance=expense)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
             messages.success(request, f'Expense "{expense.title}" updated successfully!')
             return redirect('expense_list')
     else:
@@ -218,6 +259,7 @@ def delete_expense(request, pk):
     
     if request.method == 'POST':
         expense_title = expense.title
+        # delete() sends its signals inside its own transaction
         expense.delete()
         messages.success(request, f'Expense "{expense_title}" deleted successfully!')
         return redirect('expense_list')
@@ -228,25 +270,24 @@ def delete_expense(request, pk):
 def expense_detail(request, pk):
     """Expense detail view"""
     expense = get_object_or_404(Expense, pk=pk, user=request.user)
-    return render(request, 'tracker/expenses/detail.html', {'expense': expense})
+    context = {'expense': expense, 'anomaly': anomalies.explain(expense)}
+    return render(request, 'tracker/expenses/detail.html', context)
 
 @login_required
 def income_list(request):
     """List all income"""
     incomes = Income.objects.filter(user=request.user)
     
-    # Pagination
-    paginator = Paginator(incomes, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
     # Calculate totals
-    total_amount = incomes.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    totals = incomes.aggregate(total=Sum(fx.converted()), count=Count('id'))
+    
+    # Pagination (?cursor= switches to keyset pagination)
+    page_obj = paginate_request(request, incomes, 10, count=totals['count'])
     
     context = {
         'page_obj': page_obj,
-        'total_amount': total_amount,
-        'incomes_count': incomes.count(),
+        'total_amount': totals['total'] or Decimal('0'),
+        'incomes_count': totals['count'],
     }
     
     return render(request, 'tracker/income/list.html', context)
@@ -255,15 +296,18 @@ def income_list(request):
 def add_income(request):
     """Add new income"""
     if request.method == 'POST':
-        form = IncomeForm(request.POST)
+        home = fx.home_currency(request.user.id)
+        form = IncomeForm(request.POST, home_currency=home)
         if form.is_valid():
             income = form.save(commit=False)
             income.user = request.user
-            income.save()
+            fx.remember_home(income, home)
+            with transaction.atomic():
+                income.save()
             messages.success(request, f'Income "{income.title}" added successfully!')
             return redirect('income_list')
     else:
-        form = IncomeForm()
+        form = IncomeForm(home_currency=fx.home_currency(request.user.id))
     
     return render(request, 'tracker/income/form.html', {
         'form': form,
@@ -279,7 +323,8 @@ def edit_income(request, pk):
     if request.method == 'POST':
         form = IncomeForm(request.POST, instance=income)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
             messages.success(request, f'Income "{income.title}" updated successfully!')
             return redirect('income_list')
     else:
@@ -299,6 +344,7 @@ def delete_income(request, pk):
     
     if request.method == 'POST':
         income_title = income.title
+        # delete() sends its signals inside its own transaction
         income.delete()
         messages.success(request, f'Income "{income_title}" deleted successfully!')
         return redirect('income_list')
@@ -366,29 +412,10 @@ def delete_category(request, pk):
 @login_required
 def budget_list(request):
     """List all budgets"""
-    budgets = Budget.objects.filter(user=request.user)
-    
-    # Calculate spent amounts for each budget
-    budget_data = []
-    current_month = timezone.now().replace(day=1)
-    next_month = (current_month + timedelta(days=32)).replace(day=1)
-    
-    for budget in budgets:
-        spent = Expense.objects.filter(
-            user=request.user,
-            category=budget.category,
-            date__gte=current_month,
-            date__lt=next_month
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        percentage = float(spent / budget.amount * 100) if budget.amount > 0 else 0
-        budget_data.append({
-            'budget': budget,
-            'spent': spent,
-            'remaining': budget.amount - spent,
-            'percentage': percentage,
-            'status': 'danger' if percentage > 90 else 'warning' if percentage > 70 else 'success'
-        })
+    budgets = Budget.objects.filter(user=request.user).select_related('category')
+    
+    # Spent amounts for every budget's current period in one query
+    budget_data = evaluate_budgets(budgets)
     
     return render(request, 'tracker/budgets/list.html', {'budget_data': budget_data})
 
@@ -446,213 +473,259 @@ def delete_budget(request, pk):
     
     return render(request, 'tracker/budgets/delete.html', {'budget': budget})
 
-@login_required
-def analytics(request):
-    """Analytics dashboard"""
+def _analytics_data(user):
+    """Compute the analytics page data for a user"""
     # Monthly expenses for the current year
     current_year = timezone.now().year
     monthly_data = Expense.objects.filter(
-        user=request.user,
+        user=user,
         date__year=current_year
     ).annotate(
         month=TruncMonth('date')
     ).values('month').annotate(
-        total=Sum('amount')
+        total=Sum(fx.converted())
     ).order_by('month')
     
     # Category breakdown
     category_data = Expense.objects.filter(
-        user=request.user
+        user=user
     ).values('category__name', 'category__color').annotate(
-        total=Sum('amount'),
+        total=Sum(fx.converted()),
         count=Count('id')
     ).order_by('-total')
     
     # Payment method breakdown
     payment_data = Expense.objects.filter(
-        user=request.user
+        user=user
     ).values('payment_method').annotate(
-        total=Sum('amount'),
+        total=Sum(fx.converted()),
         count=Count('id')
     ).order_by('-total')
     
+    # Tag breakdown, joined through the (tag, expense) index
+    tag_data = ExpenseTag.objects.filter(
+        tag__user=user
+    ).values('tag__name').annotate(
+        total=Sum(fx.converted(prefix='expense__')),
+        count=Count('expense_id')
+    ).order_by('-total')
+    
     # Top expenses
-    top_expenses = Expense.objects.filter(user=request.user).order_by('-amount')[:10]
+    top_expenses = Expense.objects.filter(user=user).select_related('category').prefetch_related('tags').order_by('-amount')[:10]
     
     # Recent trends (last 30 days daily)
     thirty_days_ago = timezone.now().date() - timedelta(days=30)
     daily_trends = Expense.objects.filter(
-        user=request.user,
+        user=user,
         date__gte=thirty_days_ago
     ).annotate(
         day=TruncDay('date')
     ).values('day').annotate(
-        total=Sum('amount')
+        total=Sum(fx.converted())
     ).order_by('day')
     
-    context = {
+    return {
         'monthly_data': list(monthly_data),
         'category_data': list(category_data),
         'payment_data': list(payment_data),
-        'top_expenses': top_expenses,
+        'tag_data': list(tag_data),
+        'top_expenses': list(top_expenses),
         'daily_trends': list(daily_trends),
         'current_year': current_year,
     }
+
+@login_required
+@replica_reads
+@conditional_user_view
+def analytics(request):
+    """Analytics dashboard"""
+    # Served from the per-user cache until the user's data changes
+    version, _ = request_version(request)
+    context = cached_for_user(
+        'analytics', request.user.pk, lambda: _analytics_data(request.user), version=version
+    )
+    context = dict(context, insights=insights.user_insights(request.user, version))
     
     return render(request, 'tracker/analytics.html', context)
 
-@login_required
-def reports(request):
-    """Reports page"""
-    # Get date range from request
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
+def _report_dates(params):
+    """Read start_date/end_date (YYYY-MM-DD), defaulting to the current month"""
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
     
     if start_date and end_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-    else:
-        # Default to current month
-        today = timezone.now().date()
-        start_date = today.replace(day=1)
-        end_date = today
-    
-    # Filter expenses and income
+        return (datetime.strptime(start_date, '%Y-%m-%d').date(),
+                datetime.strptime(end_date, '%Y-%m-%d').date())
+    # Default to current month
+    today = timezone.now().date()
+    return today.replace(day=1), today
+
+@login_required
+@replica_reads
+def reports(request):
+    """Reports page; the transactions of the range are listed a page at a time"""
+    try:
+        start_date, end_date = _report_dates(request.GET)
+    except ValueError:
+        messages.error(request, 'Enter dates as YYYY-MM-DD.')
+        start_date, end_date = _report_dates({})
+    context = report_summary(request.user, start_date, end_date)
+    
+    # The summary already counted the rows, so the paginators need no COUNT
     expenses = Expense.objects.filter(
         user=request.user,
         date__gte=start_date,
         date__lte=end_date
-    )
+    ).select_related('category')
+    expense_paginator = Paginator(expenses, 20)
+    expense_paginator.count = context['expenses_count']
     
     incomes = Income.objects.filter(
         user=request.user,
         date__gte=start_date,
         date__lte=end_date
     )
+    income_paginator = Paginator(incomes, 20)
+    income_paginator.count = context['incomes_count']
     
-    # Calculate totals
-    total_expenses = expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    total_income = incomes.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    net_savings = total_income - total_expenses
-    
-    # Category breakdown
-    category_breakdown = expenses.values(
-        'category__name', 'category__color'
-    ).annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total')
-    
-    # Income source breakdown
-    income_breakdown = incomes.values('source').annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'start_date': start_date,
-        'end_date': end_date,
-        'expenses': expenses,
-        'incomes': incomes,
-        'total_expenses': total_expenses,
-        'total_income': total_income,
-        'net_savings': net_savings,
-        'category_breakdown': category_breakdown,
-        'income_breakdown': income_breakdown,
-        'expenses_count': expenses.count(),
-        'incomes_count': incomes.count(),
-    }
+    context = dict(context, **{
+        'expenses': expense_paginator.get_page(request.GET.get('expense_page')),
+        'incomes': income_paginator.get_page(request.GET.get('income_page')),
+        'tasks': Task.objects.filter(user=request.user)[:5],
+    })
     
     return render(request, 'tracker/reports.html', context)
 
+@login_required
+@require_POST
+def report_pdf(request):
+    """Queue a PDF report of the posted date range"""
+    try:
+        start_date, end_date = _report_dates(request.POST)
+    except ValueError:
+        messages.error(request, 'Enter dates as YYYY-MM-DD.')
+        return redirect('reports')
+    tasks.enqueue('report_pdf', request.user, {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+    })
+    messages.success(request, 'Your PDF report is being generated.')
+    return redirect('task_list')
+
 @login_required
 def export_expenses(request):
-    """Export expenses to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="expenses.csv"'
+    """
+    Export expenses honouring the expense list filters.
     
-    writer = csv.writer(response)
-    writer.writerow([
-        'Date', 'Title', 'Category', 'Amount', 'Payment Method', 
-        'Description', 'Tags', 'Location'
-    ])
-    
-    expenses = Expense.objects.filter(user=request.user).order_by('-date')
-    for expense in expenses:
-        writer.writerow([
-            expense.date,
-            expense.title,
-            expense.category.name,
-            expense.amount,
-            expense.get_payment_method_display(),
-            expense.description or '',
-            expense.tags or '',
-            expense.location or '',
-        ])
+    GET streams a CSV straight away; POST queues a background export
+    (``format=csv`` or ``xlsx``) whose file is downloaded from the task list.
+    """
+    if request.method == 'POST':
+        file_format = request.POST.get('format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            messages.error(request, 'Unsupported export format.')
+            return redirect('expense_list')
+        filters = {key: value for key, value in request.POST.lists() if key not in ('format', 'csrfmiddlewaretoken')}
+        tasks.enqueue('export_expenses', request.user, {'filters': filters, 'format': file_format})
+        messages.success(request, 'Your export is being prepared.')
+        return redirect('task_list')
+    
+    filter_form = ExpenseFilterForm(request.GET)
+    expenses = filter_form.filter_queryset(
+        Expense.objects.filter(user=request.user)
+    ).order_by('-date', '-created_at')
     
+    response = StreamingHttpResponse(
+        stream_csv(expense_rows(expenses)),
+        content_type='text/csv'
+    )
+    response['Content-Disposition'] = 'attachment; filename="expenses.csv"'
     return response
 
+@login_required
+def task_list(request):
+    """The user's background tasks, newest first"""
+    paginator = Paginator(Task.objects.filter(user=request.user), 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'tracker/tasks/list.html', {'page_obj': page_obj})
+
+@login_required
+def task_status(request, pk):
+    """API endpoint for polling a task's progress"""
+    task = get_object_or_404(Task, pk=pk, user=request.user)
+    return JsonResponse(_task_json(task))
+
+@login_required
+def task_download(request, pk):
+    """Download a finished task's result file"""
+    task = get_object_or_404(Task, pk=pk, user=request.user, status=Task.SUCCEEDED)
+    if not task.result:
+        raise Http404('This task has no result file')
+    return FileResponse(task.result.open('rb'), as_attachment=True, filename=os.path.basename(task.result.name))
+
 @login_required
 def search_expenses(request):
     """Search expenses"""
     query = request.GET.get('q', '')
-    expenses = Expense.objects.filter(user=request.user)
+    expenses = Expense.objects.filter(user=request.user).select_related('category')
+    backend = get_search_backend()
+    
+    if query and 'cursor' in request.GET:
+        # Keyset pages walk the matches in date order
+        total_results = backend.search(request.user, query).count()
+        expenses = backend.filter(expenses, request.user, query)
+    elif query:
+        # Ranked full-text matches with a cheap count
+        expenses = backend.search(request.user, query)
+        total_results = expenses.count()
+    else:
+        total_results = expenses.count()
     
-    if query:
-        expenses = expenses.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(tags__icontains=query) |
-            Q(location__icontains=query) |
-            Q(category__name__icontains=query)
-        )
-    
-    # Pagination
-    paginator = Paginator(expenses, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination (?cursor= switches to keyset pagination)
+    page_obj = paginate_request(request, expenses, 10, count=total_results)
     
     context = {
         'page_obj': page_obj,
         'query': query,
-        'total_results': expenses.count(),
+        'total_results': total_results,
     }
     
     return render(request, 'tracker/search_results.html', context)
 
 # API Views for AJAX requests
 @login_required
-def expense_chart_data(request):
+@replica_reads
+@cached_user_view
+async def expense_chart_data(request):
     """API endpoint for expense chart data"""
-    expenses = Expense.objects.filter(user=request.user)
-    
-    # Get last 6 months data
-    monthly_data = []
-    for i in range(6):
-        date = timezone.now() - timedelta(days=30*i)
-        month_start = date.replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        total = expenses.filter(
-            date__gte=month_start,
-            date__lte=month_end
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'total': float(total)
-        })
-    
-    return JsonResponse({'data': list(reversed(monthly_data))})
-
-@login_required
-def category_chart_data(request):
+    try:
+        chart_range = ChartRange.from_params(request.GET, default_months=6)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    totals = await charts.aseries(Expense.objects.filter(user=request.user), chart_range)
+    
+    data = [
+        {
+            'month': label,
+            'period': bucket.isoformat(),
+            'total': total
+        }
+        for bucket, label, total in zip(chart_range.buckets, chart_range.labels, totals)
+    ]
+    
+    return JsonResponse({'data': data, 'granularity': chart_range.granularity})
+
+@login_required
+@replica_reads
+@cached_user_view
+async def category_chart_data(request):
     """API endpoint for category chart data"""
-    category_data = Expense.objects.filter(
+    category_data = [item async for item in Expense.objects.filter(
         user=request.user
     ).values('category__name', 'category__color').annotate(
-        total=Sum('amount')
-    ).order_by('-total')[:10]
+        total=Sum(fx.converted())
+    ).order_by('-total')[:10]]
     
     data = {
         'labels': [item['category__name'] for item in category_data],
@@ -663,38 +736,161 @@ def category_chart_data(request):
     return JsonResponse(data)
 
 @login_required
-def monthly_trend_data(request):
+@replica_reads
+@cached_user_view
+async def monthly_trend_data(request):
     """API endpoint for monthly trend data"""
-    # Get last 12 months data
-    monthly_expenses = []
-    monthly_income = []
-    labels = []
-    
-    for i in range(12):
-        date = timezone.now() - timedelta(days=30*i)
-        month_start = date.replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        expense_total = Expense.objects.filter(
-            user=request.user,
-            date__gte=month_start,
-            date__lte=month_end
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        income_total = Income.objects.filter(
-            user=request.user,
-            date__gte=month_start,
-            date__lte=month_end
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        monthly_expenses.append(float(expense_total))
-        monthly_income.append(float(income_total))
-        labels.append(month_start.strftime('%b %Y'))
-    
+    try:
+        chart_range = ChartRange.from_params(request.GET, default_months=12)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    # One grouped query per model. The async ORM runs both on the request's
+    # single database thread, so gathering them would not overlap them
+    expenses = await charts.aseries(Expense.objects.filter(user=request.user), chart_range)
+    income = await charts.aseries(Income.objects.filter(user=request.user), chart_range)
     data = {
-        'labels': list(reversed(labels)),
-        'expenses': list(reversed(monthly_expenses)),
-        'income': list(reversed(monthly_income))
+        'labels': chart_range.labels,
+        'periods': [bucket.isoformat() for bucket in chart_range.buckets],
+        'expenses': expenses,
+        'income': income,
+        'granularity': chart_range.granularity,
     }
     
-    return JsonResponse(data)
\ No newline at end of file
+    return JsonResponse(data)
+
+@login_required
+@gzip_page
+@replica_reads
+@cached_user_view
+def dashboard_api(request):
+    """API endpoint returning the dashboard widgets picked by ``fields=`` in one response"""
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+        chart_range = ChartRange.from_params({'months': request.GET.get('months')}, default_months=12)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    # Widgets share the rollup queries; each query runs once at most
+    data = DashboardData(request.user, chart_range).build(fields)
+    
+    if 'totals' in data:
+        data['totals'] = {key: float(value) for key, value in data['totals'].items()}
+    if 'categories' in data:
+        data['categories'] = [dict(row, total=float(row['total'])) for row in data['categories']]
+    if 'budgets' in data:
+        data['budgets'] = [_budget_status_json(status) for status in data['budgets']]
+    if 'recent' in data:
+        data['recent'] = {
+            'expenses': [_expense_json(expense) for expense in data['recent']['expenses']],
+            'income': [_income_json(income) for income in data['recent']['income']],
+        }
+    if 'anomalies' in data:
+        data['anomalies'] = [_expense_json(expense) for expense in data['anomalies']]
+    
+    return JsonResponse(data)
+
+@login_required
+@gzip_page
+@replica_reads
+@cached_user_view
+def analytics_api(request):
+    """API endpoint returning the spending statistics of the analytics page"""
+    data = insights.user_insights(request.user, request_version(request)[0])
+    if data is None:
+        return JsonResponse({'error': 'Spending statistics need NumPy, which is not installed'}, status=503)
+    return JsonResponse(data)
+
+def _budget_status_json(status):
+    budget = status['budget']
+    return {
+        'id': budget.pk,
+        'category': budget.category.name,
+        'period_type': budget.period_type,
+        'amount': float(budget.amount),
+        'spent': float(status['spent']),
+        'remaining': float(status['remaining']),
+        'percentage': round(status['percentage'], 1),
+        'status': status['status'],
+        'period_start': status['period_start'].isoformat(),
+        'period_end': status['period_end'].isoformat(),
+    }
+
+def _expense_json(expense):
+    return {
+        'id': expense.pk,
+        'title': expense.title,
+        'amount': float(expense.amount),
+        'currency': expense.currency,
+        'date': expense.date.isoformat(),
+        'category': expense.category.name,
+        'payment_method': expense.payment_method,
+        'tags': expense.get_tags_list(),
+        'anomaly_score': expense.anomaly_score,
+        'location': expense.location,
+        'receipt': receipt_sources(expense),
+    }
+
+def _income_json(income):
+    return {
+        'id': income.pk,
+        'title': income.title,
+        'amount': float(income.amount),
+        'currency': income.currency,
+        'date': income.date.isoformat(),
+        'source': income.source,
+    }
+
+def _task_json(task):
+    return {
+        'id': task.pk,
+        'kind': task.kind,
+        'status': task.status,
+        'progress': task.progress,
+        'message': task.message,
+        'attempts': task.attempts,
+        'created_at': task.created_at.isoformat(),
+        'finished_at': task.finished_at.isoformat() if task.finished_at else None,
+        'download_url': reverse('task_download', args=[task.pk]) if task.result and task.status == Task.SUCCEEDED else None,
+    }
+
+def _keyset_json(request, queryset, serialize):
+    try:
+        per_page = min(max(int(request.GET.get('limit', 50)), 1), 200)
+    except ValueError:
+        per_page = 50
+    paginator = KeysetPaginator(queryset, per_page)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page],
+        'next_cursor': page.next_cursor,
+    })
+
+@login_required
+def expense_list_api(request):
+    """API endpoint listing expenses with cursor pagination"""
+    expenses = Expense.objects.filter(user=request.user).select_related('category').prefetch_related('tags')
+    expenses = ExpenseFilterForm(request.GET).filter_queryset(expenses)
+    query = request.GET.get('q', '')
+    if query:
+        expenses = get_search_backend().filter(expenses, request.user, query)
+    return _keyset_json(request, expenses, _expense_json)
+
+@login_required
+def income_list_api(request):
+    """API endpoint listing income with cursor pagination"""
+    incomes = Income.objects.filter(user=request.user)
+    return _keyset_json(request, incomes, _income_json)
+
+@staff_member_required
+def profiling_stats(request):
+    """Staff-only API endpoint with this process's request profiling statistics"""
+    return JsonResponse({
+        'enabled': profiling.profiling_enabled(),
+        'sample_rate': profiling.sample_rate(),
+        'views': profiling.store.summary(),
+        'cache': tracker_cache.stats(),
+    })